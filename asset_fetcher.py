@@ -0,0 +1,133 @@
+"""
+WeasyPrint 用の url_fetcher（画像・フォントをメモリにキャッシュ）
+
+同じ report.json から複数のテンプレート（日本語・英語など）を描画するとき，
+画像とフォントの読込を 1 回で済ませるために使う．アセットストア
+（asset_store.AssetStore）を渡すと，取り込み済みのファイルは内容ハッシュを
+キーにキャッシュするので，検査が違っても同じ内容の画像は 1 回しか読まない．
+
+    fetcher = AssetFetcher(store=AssetStore())
+    fetcher.prefetch(report_asset_urls(data, base_dir))
+    HTML(..., url_fetcher=fetcher)
+"""
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+from weasyprint import default_url_fetcher
+
+import metrics
+from asset_store import is_url, report_asset_srcs
+
+# キャッシュの上限（常駐プロセスでメモリを使い切らないように）
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_MIME_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg",
+               ".gif": "image/gif", ".svg": "image/svg+xml"}
+
+
+def _file_path(url):
+    if not url.startswith("file:"):
+        return None
+    try:
+        return Path(url2pathname(urlparse(url).path)).resolve()
+    except (OSError, ValueError):
+        return None
+
+
+def _to_url(src, base_dir):
+    if is_url(src):
+        return src
+    return Path(base_dir, src).resolve().as_uri()
+
+
+def report_asset_urls(data, base_dir):
+    """
+    report.json が参照する画像の URL 一覧（重複なし）
+    """
+    return list(dict.fromkeys(_to_url(src, base_dir) for src in report_asset_srcs(data)))
+
+
+class AssetFetcher:
+    """
+    取得結果をメモリに保持する url_fetcher（スレッドセーフ，LRU）
+    """
+
+    def __init__(self, store=None, max_bytes=DEFAULT_MAX_BYTES, root=None):
+        self.store = store
+        # root を指定すると，その中のファイル（と data: URI）しか読まない
+        self.root = Path(root).resolve() if root is not None else None
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, url):
+        path = _file_path(url)
+        if path is None:
+            return url
+        if self.store is not None:
+            digest = self.store.lookup(path)
+            if digest:
+                return f"sha256:{digest}"
+        return path.as_uri()
+
+    def _fetch(self, url, key, *args, **kwargs):
+        if key.startswith("sha256:"):
+            path = _file_path(url)
+            return {"string": self.store.read(key[7:], path),
+                    "mime_type": _MIME_TYPES.get(path.suffix.lower()),
+                    "redirected_url": url, "filename": path.name}
+        result = default_url_fetcher(url, *args, **kwargs)
+        if "file_obj" in result:
+            with result.pop("file_obj") as f:
+                result["string"] = f.read()
+        return result
+
+    def _put(self, key, result):
+        size = len(result.get("string") or b"")
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = result
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._cache) > 1:
+                _, old = self._cache.popitem(last=False)
+                self._bytes -= len(old.get("string") or b"")
+
+    def _check_root(self, url):
+        if self.root is None or url.startswith("data:"):
+            return
+        path = _file_path(url)
+        if path is None or not path.is_relative_to(self.root):
+            raise ValueError(f"{self.root} の外は読めません: {url}")
+
+    def __call__(self, url, *args, **kwargs):
+        self._check_root(url)
+        key = self._key(url)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                metrics.cache_event("asset", True)
+                return dict(cached, redirected_url=url)
+            self.misses += 1
+        metrics.cache_event("asset", False)
+        result = self._fetch(url, key, *args, **kwargs)
+        self._put(key, result)
+        return dict(result)
+
+    def prefetch(self, urls):
+        """
+        先読み（存在しないファイルは無視し，描画時の警告に任せる）
+        """
+        for url in urls:
+            try:
+                self(url)
+            except Exception as e:
+                print(f"WARN: 先読み失敗 {url} ({e})")
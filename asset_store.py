@@ -0,0 +1,273 @@
+"""
+outputs/ の画像を内容ハッシュで管理するアセットストア
+
+検査ごとの outputs/<検査ID>/ には，空フレームや凡例など同じ内容の PNG が
+何度も保存されている．report.json が参照する画像をストアに取り込むと
+  objects/<先頭2文字>/<sha256>     … 実体（内容ごとに 1 つ）
+  index.sqlite3                    … パス → ハッシュ，参照数
+で管理し，元ファイルは実体へのハードリンクに置き換える（同じボリュームの場合）．
+描画時の url_fetcher はパスをハッシュに引き直して読むので，同じ内容の画像は
+1 プロセスで 1 回しか読まない．描画の途中の取り込み（copy=False）はハッシュと
+参照元を記録するだけで実体は作らない（ストアの容量は増えず，実体が無ければ元ファイルを読む）．
+
+    python asset_store.py ingest outputs/*/report.json
+    python asset_store.py release outputs/20211021093634_000001-003/report.json
+    python asset_store.py gc
+    python asset_store.py stats
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+
+DEFAULT_STORE = Path(__file__).resolve().parent / "asset_store"
+
+# テンプレートに直書きされている静的画像
+STATIC_ASSETS = ["position.png"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest    TEXT PRIMARY KEY,
+    size      INTEGER NOT NULL,
+    refcount  INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS paths (
+    path      TEXT PRIMARY KEY,
+    digest    TEXT NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    size      INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS owners (
+    owner     TEXT NOT NULL,
+    digest    TEXT NOT NULL,
+    PRIMARY KEY (owner, digest)
+);
+"""
+
+
+def report_asset_srcs(data):
+    """
+    report.json（とテンプレート）が参照する画像の src 一覧
+    """
+    srcs = list(STATIC_ASSETS)
+    srcs += [tl["img"] for tl in data.get("timeline", []) if tl.get("img") and not tl.get("track")]
+    srcs += [img["src"] for block in data.get("gallery", []) for img in block.get("images", [])]
+    return srcs
+
+
+def is_url(src):
+    return "://" in src or src.startswith(("file:", "data:"))
+
+
+def report_asset_paths(data, base_dir):
+    """
+    report.json が参照する画像ファイルのパス一覧（重複なし，URL は除く）
+    """
+    paths = (Path(base_dir, src).resolve() for src in report_asset_srcs(data) if not is_url(src))
+    return list(dict.fromkeys(paths))
+
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class AssetStore:
+    """
+    内容ハッシュで画像を保持するストア（パス → ハッシュの対応と参照数を持つ）
+    """
+
+    def __init__(self, root=DEFAULT_STORE):
+        self.root = Path(root)
+        (self.root / "objects").mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+        # パス → (mtime_ns, size, digest) のメモリキャッシュ
+        self._lookup_cache = {}
+
+    def _conn(self):
+        # 接続はスレッドごと・プロセスごと（fork 先で親の接続を使わない）
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(str(self.root / "index.sqlite3"), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def object_path(self, digest):
+        return self.root / "objects" / digest[:2] / digest
+
+    # ---------- 取り込み ----------
+    def _ingest_file(self, conn, path, link, copy=True):
+        st = path.stat()
+        row = conn.execute("SELECT digest, mtime_ns, size FROM paths WHERE path = ?",
+                           (str(path),)).fetchone()
+        if row and row[1] == st.st_mtime_ns and row[2] == st.st_size:
+            # 記録済み．描画時に記録しただけ（実体なし）なら内容は同じなので実体だけ作る
+            digest = row[0]
+            if not copy or self.object_path(digest).exists():
+                return digest
+        else:
+            digest = _sha256_file(path)
+        obj = self.object_path(digest)
+        if copy and not obj.exists():
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            tmp = obj.with_name(f"{digest}.{os.getpid()}.tmp")
+            shutil.copyfile(path, tmp)
+            # 実体は読み取り専用（リンク先の元ファイルをその場で書き換えて内容とハッシュがずれないように）
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, obj)
+        conn.execute("INSERT OR IGNORE INTO objects (digest, size, refcount) VALUES (?, ?, 0)",
+                     (digest, st.st_size))
+
+        # 元ファイルを実体へのハードリンクに置き換えて容量を共有する
+        if link and obj.exists() and not os.path.samefile(path, obj):
+            tmp = path.with_name(path.name + ".link.tmp")
+            try:
+                os.link(obj, tmp)
+                os.replace(tmp, path)
+            except OSError:
+                # 別ボリュームなどリンクできない場合は元ファイルのまま
+                if tmp.exists():
+                    tmp.unlink()
+        st = path.stat()
+        conn.execute("INSERT OR REPLACE INTO paths (path, digest, mtime_ns, size) VALUES (?, ?, ?, ?)",
+                     (str(path), digest, st.st_mtime_ns, st.st_size))
+        return digest
+
+    def ingest_report(self, json_path, base_dir=None, data=None, link=False, copy=True):
+        """
+        report.json が参照する画像を取り込み，このレポートを参照元として数える．
+        base_dir は画像パスの基準ディレクトリ（既定は report.json のディレクトリ）
+        link=True で元ファイルを実体へのハードリンクに置き換える（CLI の ingest だけが使う．
+        描画の途中で検査の元画像を差し替えないよう既定はコピーのみ）
+        copy=False ならハッシュ・パス・参照元を記録するだけで実体を作らない（描画時．
+        元ファイルはそのままなので容量を増やさない）
+        戻り値: 取り込んだ画像の数
+        """
+        json_path = Path(json_path).resolve()
+        if data is None:
+            data = json.loads(json_path.read_text(encoding="utf-8"))
+        owner = str(json_path)
+        conn = self._conn()
+        count = 0
+        with conn:
+            for path in report_asset_paths(data, base_dir or json_path.parent):
+                if not path.exists():
+                    continue
+                digest = self._ingest_file(conn, path, link, copy)
+                added = conn.execute("INSERT OR IGNORE INTO owners (owner, digest) VALUES (?, ?)",
+                                     (owner, digest)).rowcount
+                if added:
+                    conn.execute("UPDATE objects SET refcount = refcount + 1 WHERE digest = ?",
+                                 (digest,))
+                count += 1
+        return count
+
+    def release(self, json_path):
+        """
+        レポートの参照を外す（実体の削除は gc で行う）
+        """
+        owner = str(Path(json_path).resolve())
+        conn = self._conn()
+        with conn:
+            digests = [r[0] for r in conn.execute(
+                "SELECT digest FROM owners WHERE owner = ?", (owner,))]
+            conn.execute("DELETE FROM owners WHERE owner = ?", (owner,))
+            conn.executemany("UPDATE objects SET refcount = refcount - 1 WHERE digest = ?",
+                             [(d,) for d in digests])
+        return len(digests)
+
+    def gc(self):
+        """
+        参照数 0 の実体を削除する
+        """
+        conn = self._conn()
+        with conn:
+            digests = [r[0] for r in conn.execute("SELECT digest FROM objects WHERE refcount <= 0")]
+            for digest in digests:
+                obj = self.object_path(digest)
+                if obj.exists():
+                    os.chmod(obj, 0o644)   # Windows では読み取り専用のファイルを消せない
+                    obj.unlink()
+                conn.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+                conn.execute("DELETE FROM paths WHERE digest = ?", (digest,))
+        return len(digests)
+
+    # ---------- 参照 ----------
+    def lookup(self, path):
+        """
+        パスに対応する実体のハッシュ（未登録・更新済みなら None）
+        """
+        path = Path(path)
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        key = str(path)
+        cached = self._lookup_cache.get(key)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        row = self._conn().execute("SELECT digest, mtime_ns, size FROM paths WHERE path = ?",
+                                   (key,)).fetchone()
+        if not row or row[1] != st.st_mtime_ns or row[2] != st.st_size:
+            return None
+        self._lookup_cache[key] = (row[1], row[2], row[0])
+        return row[0]
+
+    def read(self, digest, path=None):
+        """
+        実体を読む．実体が無ければ（copy=False で記録しただけなら）path を読む
+        """
+        obj = self.object_path(digest)
+        if path is not None and not obj.exists():
+            return Path(path).read_bytes()
+        return obj.read_bytes()
+
+    def stats(self):
+        conn = self._conn()
+        n_obj, obj_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects").fetchone()
+        n_path, path_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM paths").fetchone()
+        return {"objects": n_obj, "object_bytes": obj_bytes,
+                "paths": n_path, "path_bytes": path_bytes,
+                "saved_bytes": path_bytes - obj_bytes}
+
+
+def main():
+    p = argparse.ArgumentParser(description="outputs/ 画像のアセットストア")
+    p.add_argument("--store", default=str(DEFAULT_STORE), help="ストアのディレクトリ")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("ingest", help="report.json が参照する画像を取り込む")
+    s.add_argument("reports", nargs="+")
+    s.add_argument("--base", default=None, help="画像パスの基準ディレクトリ（既定は report.json の場所）")
+    s.add_argument("--no-link", action="store_true", help="元ファイルをハードリンクに置き換えない")
+    s = sub.add_parser("release", help="レポートの参照を外す")
+    s.add_argument("reports", nargs="+")
+    sub.add_parser("gc", help="参照されていない実体を削除")
+    sub.add_parser("stats", help="ストアの統計")
+    args = p.parse_args()
+
+    store = AssetStore(args.store)
+    if args.cmd == "ingest":
+        for report in args.reports:
+            n = store.ingest_report(report, base_dir=args.base, link=not args.no_link)
+            print(f"INGEST: {report} ({n} files)")
+    elif args.cmd == "release":
+        for report in args.reports:
+            print(f"RELEASE: {report} ({store.release(report)} refs)")
+    elif args.cmd == "gc":
+        print(f"GC: {store.gc()} objects removed")
+    print(json.dumps(store.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+バッチ描画のジャーナル（再開用）
+
+完了したジョブを 1 行 1 件の JSON Lines で追記する．
+  {"key", "digest", "pdf", "size", "status": "ok"|"failed", "error"?, "at"}
+key はジョブの入力・出力の組（report.json・テンプレート・言語・PDF），digest は
+report.json とテンプレート・言語のカタログ（locales/<lang>.json）の内容，言語・出力プロファイル・
+描画エンジン，参照している画像ファイルの更新時刻・サイズのハッシュ．
+
+再実行時は key ごとに最後の記録を見て，
+  status が ok・digest が同じ・PDF が記録時のサイズで残っている → スキップ
+  それ以外（失敗・入力が変わった・PDF が消えた・未記録）       → 再投入
+とする．1 件ごとに fsync するので，途中で落ちても完了済みの分は失われない
+（書きかけの最終行は読み込み時に捨てる）．
+"""
+import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from asset_store import report_asset_paths
+from i18n import DEFAULT_LOCALE, LOCALES_DIR
+
+
+def job_key(job):
+    parts = [str(Path(job["json"]).resolve()), str(Path(job["template"]).resolve()),
+             job.get("lang") or "", str(Path(job["pdf"]).resolve())]
+    return "|".join(parts)
+
+
+class BatchJournal:
+    """
+    追記専用のジャーナル（書き込みは親プロセスの 1 スレッドから行う）
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+        self._template_digests = {}
+        # パス → (更新時刻, 内容のハッシュ)（カタログ）
+        self._catalog_digests = {}
+        self._load()
+        self._f = None
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # 書きかけの行
+                self.entries[entry["key"]] = entry
+
+    def _open(self):
+        if self._f is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # 最終行が書きかけで終わっている場合は改行で区切ってから追記する
+            needs_newline = False
+            if self.path.exists() and self.path.stat().st_size:
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    needs_newline = f.read(1) != b"\n"
+            self._f = open(self.path, "a", encoding="utf-8")
+            if needs_newline:
+                self._f.write("\n")
+        return self._f
+
+    def _catalog_digest(self, lang):
+        path = LOCALES_DIR / f"{lang or DEFAULT_LOCALE}.json"
+        mtime = path.stat().st_mtime_ns
+        cached = self._catalog_digests.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = self._catalog_digests[path] = \
+                (mtime, hashlib.sha256(path.read_bytes()).hexdigest())
+        return cached[1]
+
+    def digest(self, job):
+        """
+        ジョブの入力（report.json・テンプレート・カタログ・言語・出力プロファイル・エンジン・
+        画像ファイル）のハッシュ．画像は中身を読まず更新時刻とサイズだけ使う
+        """
+        template = str(Path(job["template"]).resolve())
+        t_digest = self._template_digests.get(template)
+        if t_digest is None:
+            t_digest = self._template_digests[template] = \
+                hashlib.sha256(Path(template).read_bytes()).hexdigest()
+        raw = Path(job["json"]).read_bytes()
+        h = hashlib.sha256(raw)
+        h.update(t_digest.encode())
+        h.update((job.get("lang") or "").encode())
+        # プロファイル・エンジンを変えたら描き直す
+        h.update((job.get("profile") or "").encode())
+        h.update((job.get("engine") or "").encode())
+        # テンプレートの文言はカタログから入るので，カタログを直しても描き直す
+        h.update(self._catalog_digest(job.get("lang")).encode())
+        # 画像を差し替えたら描き直す（基準ディレクトリは print_report と同じく既定は PDF の出力先）
+        base_dir = job.get("base_dir") or Path(job["pdf"]).resolve().parent
+        try:
+            paths = report_asset_paths(json.loads(raw), base_dir)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            paths = []   # 壊れた report.json は描画（report_schema）で失敗させる
+        for path in paths:
+            try:
+                st = path.stat()
+                stamp = f"{path}|{st.st_mtime_ns}|{st.st_size}"
+            except OSError:
+                stamp = f"{path}|missing"
+            h.update(stamp.encode())
+        return h.hexdigest()
+
+    def is_done(self, job, digest):
+        entry = self.entries.get(job_key(job))
+        if not entry or entry["status"] != "ok" or entry["digest"] != digest:
+            return False
+        try:
+            return os.path.getsize(entry["pdf"]) == entry["size"]
+        except OSError:
+            return False
+
+    def record(self, job, digest, status, pdf=None, error=None):
+        entry = {"key": job_key(job), "digest": digest, "pdf": pdf,
+                 "size": os.path.getsize(pdf) if pdf and os.path.exists(pdf) else None,
+                 "status": status,
+                 "at": datetime.datetime.now().isoformat(timespec="seconds")}
+        if error:
+            entry["error"] = error
+        f = self._open()
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+        self.entries[entry["key"]] = entry
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
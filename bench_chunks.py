@@ -0,0 +1,107 @@
+"""
+--chunks（シートを組に分けた並列レイアウト）と 1 組の描画のサイズ・時間の比較
+
+ギャラリーを --gallery-scale 倍にした大きいレポートを，1 組（chunks=0）と
+--chunks N で repeat 回ずつ交互に描画し，合計時間の中央値と PDF のサイズを比べる．
+組ごとにフォントのサブセットが別に埋め込まれる（pdf_dedup ではまとめられない）ため，
+結合した PDF は 1 組の描画より大きくなることがある．--chunks を運用で使う前に
+このベンチマークを通すこと（サイズ比が --max-size-ratio を超えるか，速さの比が
+--min-speedup に届かなければ終了コード 1）．
+
+    python bench_chunks.py --chunks 4 --gallery-scale 20 --repeat 3 [--out chunks.json]
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from load_test import percentile
+from print_report import DEFAULT_LOCALE, load_report_data, render_report, warm_up
+
+DEFAULT_OUT_DIR = Path(__file__).resolve().parent / ".cache" / "bench_chunks"
+
+
+def run_bench(template, report_json, chunks, repeat, out_dir, lang=None, gallery_scale=1):
+    """
+    戻り値: {"single": [{"total", "bytes", "pages"}, ...], "chunks": [...]}
+    """
+    base_dir = Path(report_json).resolve().parent
+    data = load_report_data(report_json, base_dir=base_dir)
+    if gallery_scale > 1:
+        data = copy.deepcopy(data)
+        data["gallery"] = data.get("gallery", []) * gallery_scale
+    out_dir.mkdir(parents=True, exist_ok=True)
+    scaled = out_dir / "bench.json"
+    scaled.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+    warm_up([template], [lang or DEFAULT_LOCALE])
+    modes = {"single": 0, "chunks": chunks}
+    runs = {name: [] for name in modes}
+    try:
+        for r in range(repeat):
+            for name in (list(modes) if r % 2 == 0 else list(modes)[::-1]):
+                pdf = out_dir / f"bench_{name}.pdf"
+                t0 = time.perf_counter()
+                result = render_report(template, str(scaled), str(pdf), locale=lang,
+                                       base_dir=base_dir, chunks=modes[name])
+                runs[name].append({"total": time.perf_counter() - t0,
+                                   "bytes": os.path.getsize(pdf), "pages": result["pages"]})
+    finally:
+        scaled.unlink()
+    return runs
+
+
+def summarize(runs):
+    summary = {name: {"total": percentile([r["total"] for r in rows], 50),
+                      "bytes": rows[-1]["bytes"], "pages": rows[-1]["pages"]}
+               for name, rows in runs.items()}
+    single, chunked = summary["single"], summary["chunks"]
+    summary["size_ratio"] = chunked["bytes"] / single["bytes"]
+    summary["speedup"] = single["total"] / chunked["total"]
+    return summary
+
+
+def main():
+    here = Path(__file__).resolve().parent
+    p = argparse.ArgumentParser(description="--chunks と 1 組の描画の PDF サイズ・時間の比較")
+    p.add_argument("--template", default=str(here / "report.html"))
+    p.add_argument("--report", default=str(here / "report.json"))
+    p.add_argument("--lang", default=None)
+    p.add_argument("--chunks", type=int, default=os.cpu_count() or 2, metavar="N")
+    p.add_argument("--repeat", type=int, default=3, help="それぞれの描画回数")
+    p.add_argument("--gallery-scale", type=int, default=20,
+                   help="ギャラリーのブロックを N 倍にして大きいレポートで測る")
+    p.add_argument("--max-size-ratio", type=float, default=1.0,
+                   help="許すサイズの比（--chunks / 1 組．既定 1.0 = 大きくならないこと）")
+    p.add_argument("--min-speedup", type=float, default=1.0,
+                   help="必要な速さの比（1 組 / --chunks の合計時間）")
+    p.add_argument("--out-dir", default=str(DEFAULT_OUT_DIR), help="PDF の出力先")
+    p.add_argument("--out", default=None, help="結果 JSON の保存先")
+    args = p.parse_args()
+
+    runs = run_bench(args.template, args.report, args.chunks, args.repeat, Path(args.out_dir),
+                     lang=args.lang, gallery_scale=args.gallery_scale)
+    s = summarize(runs)
+    for name in ("single", "chunks"):
+        print(f"{name:<8}{s[name]['total']:>8.2f}s{s[name]['bytes'] / 1024:>9.0f}KB"
+              f"{s[name]['pages']:>6} pages")
+    ok = s["size_ratio"] <= args.max_size_ratio and s["speedup"] >= args.min_speedup
+    print(f"{'OK' if ok else 'NG'}: size x{s['size_ratio']:.2f}（上限 {args.max_size_ratio}）/ "
+          f"speedup x{s['speedup']:.2f}（下限 {args.min_speedup}）")
+
+    if args.out:
+        report = {"created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                  "template": args.template, "report": args.report, "chunks": args.chunks,
+                  "repeat": args.repeat, "gallery_scale": args.gallery_scale,
+                  "summary": s, "runs": runs}
+        Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"OUT: {args.out}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+出力プロファイル（pdf_profiles）ごとのサイズと時間の比較
+
+同じ report.json・テンプレートを各プロファイルで repeat 回ずつ描画し，
+レイアウト・書き出し（後処理を含む）・合計の中央値，PDF のサイズ・ページ数，
+線形化されたかどうかを表にする．プロファイルは 1 回ごとに順番を回して交互に測る
+（CPU のクロックやキャッシュの温まり方の偏りを避ける）．
+
+    python bench_profiles.py --report report.json --repeat 5
+    python bench_profiles.py --gallery-scale 10 --out bench.json --compare bench_old.json
+
+default は WeasyPrint の既定（--profile なし）．静的 HTML は 1 回だけ作って使い回すので，
+表の時間は html_to_pdf（レイアウト＋書き出し）だけを測っている．
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import time
+from pathlib import Path
+
+import pdf_profiles
+from load_test import percentile
+from print_report import (
+    DEFAULT_LOCALE,
+    build_soup,
+    html_to_pdf,
+    load_report_data,
+    warm_up,
+)
+
+DEFAULT_OUT_DIR = Path(__file__).resolve().parent / ".cache" / "bench_profiles"
+
+
+def is_linearized(pdf_path):
+    # 線形化辞書はファイル先頭の最初のオブジェクト
+    with open(pdf_path, "rb") as f:
+        return b"/Linearized" in f.read(1024)
+
+
+def run_bench(template, report_json, profiles, repeat, out_dir, lang=None, gallery_scale=1):
+    """
+    戻り値: {プロファイル名: [{"layout", "write_pdf", "total", "bytes", "pages", "linearized"}, ...]}
+    """
+    base_dir = Path(report_json).resolve().parent
+    data = load_report_data(report_json, base_dir=base_dir)
+    if gallery_scale > 1:
+        data = copy.deepcopy(data)
+        data["gallery"] = data.get("gallery", []) * gallery_scale
+    soup = build_soup(template, data, lang or DEFAULT_LOCALE)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    html = out_dir / "bench.html"
+    html.write_text(str(soup), encoding="utf-8")
+
+    warm_up([template], [lang or DEFAULT_LOCALE])
+    runs = {name: [] for name in profiles}
+    try:
+        for r in range(repeat):
+            order = profiles[r % len(profiles):] + profiles[:r % len(profiles)]
+            for name in order:
+                profile = None if name == "default" else name
+                pdf = out_dir / f"bench_{name}.pdf"
+                stats = {}
+                t0 = time.perf_counter()
+                html_to_pdf(str(html), str(pdf), stats=stats, base_dir=base_dir, profile=profile)
+                runs[name].append({"layout": stats["layout"], "write_pdf": stats["write_pdf"],
+                                   "total": time.perf_counter() - t0,
+                                   "bytes": os.path.getsize(pdf), "pages": stats["pages"],
+                                   "linearized": is_linearized(pdf)})
+    finally:
+        html.unlink()
+    return runs
+
+
+def summarize(runs):
+    summary = {}
+    for name, rows in runs.items():
+        summary[name] = {
+            "layout": percentile([r["layout"] for r in rows], 50),
+            "write_pdf": percentile([r["write_pdf"] for r in rows], 50),
+            "total": percentile([r["total"] for r in rows], 50),
+            "bytes": rows[-1]["bytes"],
+            "pages": rows[-1]["pages"],
+            "linearized": rows[-1]["linearized"],
+        }
+    return summary
+
+
+def print_summary(summary, baseline=None):
+    """
+    プロファイルごとの中央値（default があればサイズ・時間の比を付ける．
+    baseline を渡すと以前の結果との合計時間・サイズの差を付ける）
+    """
+    ref = summary.get("default")
+    head = f"{'':<10}{'layout':>9}{'write':>9}{'total':>9}{'size':>10}{'pages':>7}{'lin':>5}"
+    if ref:
+        head += f"{'size/def':>10}{'time/def':>10}"
+    if baseline:
+        head += f"{'base tot':>10}{'base size':>11}"
+    print(head)
+    for name, s in summary.items():
+        line = (f"{name:<10}{s['layout']:>8.2f}s{s['write_pdf']:>8.2f}s{s['total']:>8.2f}s"
+                f"{s['bytes'] / 1024:>8.0f}KB{s['pages']:>7}{'yes' if s['linearized'] else '-':>5}")
+        if ref:
+            line += f"{s['bytes'] / ref['bytes']:>9.2f}x{s['total'] / ref['total']:>9.2f}x"
+        b = (baseline or {}).get(name)
+        if b:
+            line += f"{b['total']:>9.2f}s{b['bytes'] / 1024:>9.0f}KB"
+        print(line)
+
+
+def main():
+    here = Path(__file__).resolve().parent
+    p = argparse.ArgumentParser(description="出力プロファイルごとのPDFサイズ・描画時間の比較")
+    p.add_argument("--template", default=str(here / "report.html"))
+    p.add_argument("--report", default=str(here / "report.json"))
+    p.add_argument("--lang", default=None)
+    p.add_argument("--profiles", default=",".join(["default", *pdf_profiles.PROFILES]),
+                   help="比較するプロファイル（カンマ区切り，default は WeasyPrint の既定）")
+    p.add_argument("--repeat", type=int, default=3, help="プロファイルごとの描画回数")
+    p.add_argument("--gallery-scale", type=int, default=1,
+                   help="ギャラリーのブロックを N 倍にして大きいレポートで測る")
+    p.add_argument("--out-dir", default=str(DEFAULT_OUT_DIR), help="PDF の出力先")
+    p.add_argument("--out", default=None, help="結果 JSON の保存先")
+    p.add_argument("--compare", default=None, help="以前の結果 JSON（--out の出力）と比較する")
+    args = p.parse_args()
+
+    profiles = [name.strip() for name in args.profiles.split(",") if name.strip()]
+    for name in profiles:
+        if name != "default":
+            pdf_profiles.check_profile(name)
+
+    runs = run_bench(args.template, args.report, profiles, args.repeat, Path(args.out_dir),
+                     lang=args.lang, gallery_scale=args.gallery_scale)
+    summary = summarize(runs)
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))["summary"]
+    print_summary(summary, baseline)
+
+    if args.out:
+        report = {"created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                  "template": args.template, "report": args.report, "repeat": args.repeat,
+                  "gallery_scale": args.gallery_scale, "summary": summary, "runs": runs}
+        Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"OUT: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ from reportlab.lib.pagesizes import letter
 from pypdf import PdfWriter, PdfReader  # インポートは同じ
 from io import BytesIO
 
+from stamp_pdfs import stamp_many
+
 # 新しいテキスト付きPDF作成（同じ）
 packet = BytesIO()
 can = canvas.Canvas(packet, pagesize=letter)
@@ -12,14 +14,12 @@ packet.seek(0)
 new_pdf = PdfReader(packet)
 
 # 既存PDF読み込みと結合
-existing_pdf = PdfReader("Ideal_Report.pdf")  # open不要、ファイルパス直接可
+# merge_page はページごとにコンテンツを解析・書き直すので，
+# オーバーレイを Form XObject にして各ページから参照する
 output = PdfWriter()
-
-page = existing_pdf.pages[0]
-new_page = new_pdf.pages[0]
-page.merge_page(new_page)
-output.add_page(page)
+output.append("Ideal_Report.pdf", pages=[0])  # open不要、ファイルパス直接可
+stamp_many(output, output.pages, new_pdf.pages[0])
 
 # 保存
 with open("output.pdf", "wb") as output_file:
-    output.write(output_file)
\ No newline at end of file
+    output.write(output_file)
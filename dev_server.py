@@ -0,0 +1,289 @@
+"""
+テンプレート・CSS 開発用のプレビューサーバ（ホットリロード）
+
+テンプレート・locales/・fonts/・report.json の更新時刻をポーリングで見張り，
+変わったときだけ描き直して，ブラウザのページ（http://127.0.0.1:<port>/）の PDF と
+描画時間・ページ数を差し替える．ページは /status を long-poll しているので，
+保存してから表示が変わるまでは描画時間＋ポーリング間隔で済む．
+
+フォント設定・画像（url_fetcher とそのキャッシュ）・解析済みテンプレート・report.json は
+プロセスに置いたまま使い回す．描き直す範囲は変わったものによって
+  テンプレート・カタログ … soup を作り直す（テンプレートは print_report のキャッシュが
+                           更新時刻を見て解析し直す）
+  fonts/                 … フォント設定と画像のキャッシュも捨てて作り直す
+  report.json だけ       … 中身が変わった項目の部分だけ作り直す（print_report.SECTION_UPDATERS）
+レイアウト（WeasyPrint）は毎回文書全体で行う．
+
+    python dev_server.py --report report.json [--template report.html] [--lang en] [--port 8765]
+"""
+import argparse
+import json
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import print_report
+from asset_fetcher import AssetFetcher
+from i18n import DEFAULT_LOCALE, LOCALES_DIR, available_locales, load_catalog
+from report_schema import validate
+
+DEFAULT_OUT_DIR = Path(__file__).resolve().parent / ".cache" / "dev_server"
+POLL_INTERVAL = 0.2
+# /status の long-poll で待つ最大秒数
+STATUS_WAIT = 25
+
+PAGE = """<!doctype html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<title>report preview</title>
+<style>
+  html, body { margin: 0; height: 100%; font: 13px sans-serif; }
+  body { display: flex; flex-direction: column; }
+  #bar { padding: 4px 8px; background: #eee; border-bottom: 1px solid #ccc; }
+  #bar.error { background: #fdd; }
+  #error { margin: 0; padding: 8px; color: #a00; white-space: pre-wrap; display: none; }
+  iframe { flex: 1; border: 0; }
+</style>
+</head>
+<body>
+<div id="bar">waiting...</div>
+<pre id="error"></pre>
+<iframe id="pdf"></iframe>
+<script>
+let version = -1;
+function show(s) {
+  const bar = document.getElementById("bar");
+  const error = document.getElementById("error");
+  bar.className = s.ok ? "" : "error";
+  bar.textContent = `#${s.version} ${s.at}  ${s.changed.join(", ")}  ` +
+    (s.ok ? `${s.pages} pages  ` + Object.entries(s.timings)
+      .map(([k, v]) => `${k} ${(v * 1000).toFixed(0)}ms`).join(" / ") +
+      (s.sections.length ? `  [${s.sections.join(", ")}]` : "") : "描画に失敗しました（前回の PDF を表示中）");
+  error.style.display = s.ok ? "none" : "block";
+  error.textContent = s.error || "";
+  if (s.ok) document.getElementById("pdf").src = `/preview.pdf?v=${s.version}`;
+}
+async function poll() {
+  for (;;) {
+    try {
+      const res = await fetch(`/status?since=${version}`);
+      const s = await res.json();
+      if (s.version !== version) { version = s.version; show(s); }
+    } catch (e) {
+      await new Promise(r => setTimeout(r, 1000));
+    }
+  }
+}
+poll();
+</script>
+</body>
+</html>
+"""
+
+
+class Watcher:
+    """
+    ファイルの更新時刻をポーリングで見張る．groups: {種類: パスの一覧を返す関数}
+    """
+
+    def __init__(self, groups, interval=POLL_INTERVAL):
+        self.groups = groups
+        self.interval = interval
+        self.last = self.snapshot()
+
+    def snapshot(self):
+        stamps = {}
+        for kind, paths in self.groups.items():
+            for path in paths():
+                try:
+                    stamps[path] = (kind, path.stat().st_mtime_ns)
+                except OSError:
+                    stamps[path] = (kind, None)
+        return stamps
+
+    def wait(self):
+        """
+        どれかが変わるまで待ち，変わったファイルの種類の集合を返す
+        （エディタが数回に分けて書く場合に備え，更新時刻が落ち着くまで待つ）
+        """
+        while True:
+            time.sleep(self.interval)
+            now = self.snapshot()
+            if now == self.last:
+                continue
+            while True:
+                time.sleep(self.interval)
+                settled = self.snapshot()
+                if settled == now:
+                    break
+                now = settled
+            kinds = {stamp[0] for path, stamp in now.items() if self.last.get(path) != stamp}
+            kinds |= {stamp[0] for path, stamp in self.last.items() if path not in now}
+            self.last = now
+            return kinds
+
+
+class Preview:
+    """
+    描画の状態（soup・data・画像キャッシュ）と，ブラウザに返す最新の結果
+    """
+
+    def __init__(self, template, report_json, out_dir, locale=None, base_dir=None):
+        self.template = str(Path(template).resolve())
+        self.report_json = Path(report_json).resolve()
+        self.locale = locale or DEFAULT_LOCALE
+        self.base_dir = Path(base_dir or self.report_json.parent).resolve()
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.html = self.out_dir / "preview.html"
+        self.pdf = self.out_dir / "preview.pdf"
+
+        self.data = None
+        self.soup = None
+        self.fetcher = AssetFetcher()
+        self.image_cache = {}
+        self.status = {"version": 0, "ok": False, "error": "まだ描画していません", "changed": [],
+                       "sections": [], "timings": {}, "pages": 0, "at": ""}
+        self.cond = threading.Condition()
+
+    def watched(self):
+        fonts_dirs = {Path(self.template).parent / "fonts", self.base_dir / "fonts"}
+        return {
+            "template": lambda: [Path(self.template)],
+            "locale": lambda: sorted(LOCALES_DIR.glob("*.json")),
+            "fonts": lambda: sorted(p for d in fonts_dirs if d.is_dir() for p in d.iterdir()),
+            "report": lambda: [self.report_json],
+        }
+
+    def rebuild(self, kinds):
+        """
+        kinds（変わったファイルの種類）に応じて必要な分だけ作り直して描画する
+        """
+        t0 = time.perf_counter()
+        if "fonts" in kinds:
+            print_report.reset_fonts()
+            self.fetcher = AssetFetcher()
+            self.image_cache = {}
+            self.soup = None
+        if kinds & {"template", "locale"}:
+            self.soup = None
+
+        sections = []
+        if "report" in kinds or self.data is None:
+            data = json.loads(self.report_json.read_text(encoding="utf-8"))
+            validate(data, base_dir=self.base_dir, source=str(self.report_json))
+            sections = print_report.changed_sections(self.data, data)
+            self.data = data
+
+        if self.soup is None:
+            self.soup = print_report.build_soup(self.template, self.data, self.locale)
+            updated = ["all"]
+        elif sections:
+            updated = print_report.update_sections(self.soup, self.data, sections,
+                                                   msgs=load_catalog(self.locale))
+        else:
+            return None   # 保存し直しただけで中身は同じ
+        self.html.write_text(str(self.soup), encoding="utf-8")
+        t1 = time.perf_counter()
+
+        stats = {}
+        print_report.html_to_pdf(str(self.html), str(self.pdf), url_fetcher=self.fetcher,
+                                 cache=self.image_cache, stats=stats, base_dir=self.base_dir)
+        timings = {"build_dom": t1 - t0, "layout": stats["layout"], "write_pdf": stats["write_pdf"]}
+        return {"sections": updated, "timings": timings, "pages": stats["pages"]}
+
+    def publish(self, kinds, result=None, error=None):
+        with self.cond:
+            self.status = {**self.status, "version": self.status["version"] + 1, "ok": error is None,
+                           "error": error, "changed": sorted(kinds),
+                           "at": time.strftime("%H:%M:%S")}
+            if result is not None:
+                self.status.update(result)
+            self.cond.notify_all()
+
+    def wait_status(self, since, timeout=STATUS_WAIT):
+        with self.cond:
+            self.cond.wait_for(lambda: self.status["version"] != since, timeout)
+            return dict(self.status)
+
+    def run(self, interval=POLL_INTERVAL):
+        kinds = {"template", "report"}
+        watcher = Watcher(self.watched(), interval)
+        while True:
+            try:
+                result = self.rebuild(kinds)
+                if result is not None:
+                    self.publish(kinds, result)
+                    print(f"DEV: {', '.join(sorted(kinds))} → {', '.join(result['sections'])} "
+                          f"({sum(result['timings'].values()):.2f}s)")
+            except Exception:
+                # 保存途中の JSON・壊れたテンプレートなど．前回の PDF のまま次の変更を待つ
+                error = traceback.format_exc()
+                self.soup = None   # 途中まで更新した soup は次の変更で作り直す
+                self.publish(kinds, error=error)
+                print(f"DEV: 描画に失敗\n{error}")
+            kinds = watcher.wait()
+
+
+def make_handler(preview):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, body, content_type):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/":
+                self._send(PAGE.encode("utf-8"), "text/html; charset=utf-8")
+            elif url.path == "/status":
+                since = int(parse_qs(url.query).get("since", ["-1"])[0])
+                status = preview.wait_status(since)
+                self._send(json.dumps(status, ensure_ascii=False).encode("utf-8"),
+                           "application/json; charset=utf-8")
+            elif url.path == "/preview.pdf" and preview.pdf.exists():
+                self._send(preview.pdf.read_bytes(), "application/pdf")
+            else:
+                self.send_error(404)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    here = Path(__file__).resolve().parent
+    p = argparse.ArgumentParser(description="テンプレート・CSS 開発用のプレビューサーバ")
+    p.add_argument("--template", default=str(here / "report.html"))
+    p.add_argument("--report", default=str(here / "report.json"))
+    p.add_argument("--lang", default=DEFAULT_LOCALE, choices=available_locales())
+    p.add_argument("--base", default=None, help="画像パスの基準ディレクトリ（既定: report.json の場所）")
+    p.add_argument("--out-dir", default=str(DEFAULT_OUT_DIR), help="preview.html / preview.pdf の出力先")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--interval", type=float, default=POLL_INTERVAL, help="ポーリング間隔 [秒]")
+    args = p.parse_args()
+
+    preview = Preview(args.template, args.report, args.out_dir, args.lang, args.base)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(preview))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="dev-http", daemon=True).start()
+    print(f"DEV: http://{args.host}:{args.port}/")
+    try:
+        preview.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
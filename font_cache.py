@@ -0,0 +1,132 @@
+"""
+reportlab の TrueType フォント解析結果のキャッシュ
+
+TTFont(name, path) は登録のたびに cmap・hmtx・glyf を pure Python で読む
+（グリフ数に比例し，Segoe UI で数十 ms，グリフの多い和文フォントではその数倍）．
+解析結果（charToGlyph・幅・ascent/descent・flags・グリフ位置など）をフォントファイルの
+内容ハッシュをキーに pickle で保存し，2 回目以降はその 1 ファイルを読むだけで TTFont を作る
+（フォントファイル自体もサブセットを作るために読む）．
+キャッシュが無い・壊れている・reportlab の版が違うときは普通に解析して保存し直す．
+
+PDF に埋め込むサブセット（makeSubset）も，フォントと文字の組が同じなら同じバイト列に
+なるので，プロセス内（SUBSET_MEMORY 件）とディスクにキャッシュする．
+定型の見出し・ラベルだけの組はレポートをまたいで当たる．
+
+    font = load_ttfont("SegoeUI", "fonts/segoeui.ttf")
+    pdfmetrics.registerFont(font)
+"""
+import functools
+import hashlib
+import operator
+import os
+import pickle
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import reportlab
+from reportlab.pdfbase.ttfonts import TTFont, TTFontFace
+
+import metrics
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "fonts"
+# 保存する属性や形式を変えたら上げる
+CACHE_VERSION = 1
+SUBSET_MEMORY = 64
+
+# (フォントのハッシュ, 文字の組) → サブセットのバイト列（新しい順に SUBSET_MEMORY 件）
+_SUBSETS = OrderedDict()
+
+
+class CachedTTFontFace(TTFontFace):
+    """
+    makeSubset の結果をキャッシュする TTFontFace（load_ttfont が作る）
+    """
+    digest = None
+    cache_dir = None
+
+    def makeSubset(self, subset):
+        key = (self.digest, tuple(subset))
+        data = _SUBSETS.get(key)
+        if data is not None:
+            _SUBSETS.move_to_end(key)
+            metrics.cache_event("font_subset", True)
+            return data
+
+        name = hashlib.sha256(repr(key[1]).encode()).hexdigest()[:32]
+        path = Path(self.cache_dir) / "subsets" / f"{self.digest[:16]}_{name}.ttf"
+        metrics.cache_event("font_subset", path.exists())
+        if path.exists():
+            data = path.read_bytes()
+        else:
+            data = super().makeSubset(subset)
+            _write_atomic(path, data)
+        _SUBSETS[key] = data
+        if len(_SUBSETS) > SUBSET_MEMORY:
+            _SUBSETS.popitem(last=False)
+        return data
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _cache_path(cache_dir, digest):
+    return Path(cache_dir) / f"{digest}.rl{reportlab.Version}.v{CACHE_VERSION}.pickle"
+
+
+def _dump(font):
+    # フォントファイルの中身（_ttf_data）・文書ごとの状態（state）と，
+    # pickle できない単位換算の lambda（_pdfScale，unitsPerEm から作り直す）は保存しない
+    face = {k: v for k, v in font.face.__dict__.items() if k not in ("_ttf_data", "_pdfScale")}
+    attrs = {k: v for k, v in font.__dict__.items() if k not in ("face", "state")}
+    return pickle.dumps({"face": face, "font": attrs}, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _load(blob, ttf_data):
+    from weakref import WeakKeyDictionary
+
+    saved = pickle.loads(blob)
+    face = CachedTTFontFace.__new__(CachedTTFontFace)
+    face.__dict__.update(saved["face"])
+    face._ttf_data = ttf_data
+    face._pdfScale = functools.partial(operator.mul, 1000 / face.unitsPerEm)
+    font = TTFont.__new__(TTFont)
+    font.__dict__.update(saved["font"])
+    font.face = face
+    font.state = WeakKeyDictionary()
+    return font
+
+
+def load_ttfont(name, path, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    TTFont(name, path) と同じものを返す（解析結果はキャッシュから）
+    """
+    path = Path(path)
+    ttf_data = path.read_bytes()
+    digest = hashlib.sha256(ttf_data).hexdigest()
+    cache = _cache_path(cache_dir, digest)
+
+    font = None
+    if cache.exists():
+        try:
+            font = _load(cache.read_bytes(), ttf_data)
+        except Exception as e:
+            print(f"WARN: フォントのキャッシュを読めません（解析し直します）: {cache.name} ({e})")
+    metrics.cache_event("font", font is not None)
+    if font is None:
+        t0 = time.perf_counter()
+        font = TTFont(name, str(path))
+        font.face.__class__ = CachedTTFontFace
+        _write_atomic(cache, _dump(font))
+        print(f"FONT: {path.name} を解析 {time.perf_counter() - t0:.2f}s")
+
+    # 同じファイルを別名で登録しても使えるよう，名前とパスは呼び出しに合わせる
+    font.fontName = name
+    font.face.filename = str(path)
+    font.face.digest = digest
+    font.face.cache_dir = str(cache_dir)
+    return font
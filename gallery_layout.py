@@ -0,0 +1,65 @@
+"""
+サムネイルギャラリーの改ページ計算
+
+テンプレートの .exam-gallery に書いた寸法
+  data-columns   … 1 行のサムネイル数
+  data-row-mm    … 1 行の高さ（サムネイルの高さ + 行間）
+  data-first-mm  … 1 枚目のシートでギャラリーに使える高さ
+  data-page-mm   … 続きのシート（ヘッダーの下）でギャラリーに使える高さ
+から各シートに入る行数を決め，ブロックをシートに割り振る．
+レイアウトを試さずに Python 側で決めるので，画像枚数に比例した時間で済む．
+
+1 ブロック（A, B, ...）は ceil(画像数 / 列数) 行．今のシートに入らないブロックは
+次のシートに送り，1 シートに収まらないほど大きいブロックだけを行単位で分割する．
+"""
+import math
+
+
+def gallery_geometry(section):
+    """
+    .exam-gallery の data 属性から (列数, 1 枚目の行数, 続きのシートの行数) を返す．
+    寸法が書かれていなければ改ページしない（行数は無限大）
+    """
+    columns = int(section.get("data-columns", 3))
+    row_mm = section.get("data-row-mm")
+    if not row_mm:
+        return columns, math.inf, math.inf
+    row_mm = float(row_mm)
+    rows_first = int(float(section.get("data-first-mm", 0)) // row_mm)
+    rows_per_page = int(float(section["data-page-mm"]) // row_mm)
+    if rows_per_page < 1:
+        raise ValueError(f"data-page-mm が 1 行（{row_mm}mm）より小さい")
+    return columns, rows_first, rows_per_page
+
+
+def block_rows(n_images, columns):
+    return max(1, math.ceil(n_images / columns))
+
+
+def paginate(blocks, columns, rows_first, rows_per_page):
+    """
+    blocks（report.json の gallery）をシートに割り振る．
+    戻り値: シートごとの [(ブロック番号, 画像の開始, 画像の終了), ...]．
+    先頭は 1 枚目のシート（ギャラリーが入らなければ空）
+    """
+    pages = [[]]
+    remaining = rows_first
+    for bi, block in enumerate(blocks):
+        n = len(block.get("images", []))
+        rows = block_rows(n, columns)
+        # 今のシートに入らず，次のシートなら丸ごと入るブロックは送る
+        if rows > remaining and rows <= rows_per_page:
+            pages.append([])
+            remaining = rows_per_page
+        start = 0
+        while rows:
+            if remaining < 1:
+                pages.append([])
+                remaining = rows_per_page
+            take = min(rows, remaining)
+            end = min(n, start + take * columns)
+            pages[-1].append((bi, start, end))
+            remaining -= take
+            rows -= take
+            start = end
+    return pages
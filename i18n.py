@@ -0,0 +1,57 @@
+"""
+レポートの多言語化（メッセージカタログ）
+
+カタログは locales/<lang>.json．テンプレート側は
+  data-i18n="キー"      … 要素の文字列をカタログの値に置き換える
+  data-i18n-alt="キー"  … alt 属性をカタログの値に置き換える
+で差し込み位置を示す．Python 側で生成する文字列（開始時刻など）も
+同じカタログから format して使う．
+"""
+import json
+from pathlib import Path
+
+LOCALES_DIR = Path(__file__).resolve().parent / "locales"
+DEFAULT_LOCALE = "ja"
+
+# locale → (更新時刻, カタログ)
+_CATALOGS = {}
+
+
+def available_locales():
+    return sorted(p.stem for p in LOCALES_DIR.glob("*.json"))
+
+
+def load_catalog(locale=None):
+    """
+    カタログを読み込む（ファイルの更新時刻が変わったら読み直す）
+    """
+    locale = locale or DEFAULT_LOCALE
+    path = LOCALES_DIR / f"{locale}.json"
+    if not path.exists():
+        raise ValueError(f"未対応の言語です: {locale}（{', '.join(available_locales())}）")
+    mtime = path.stat().st_mtime_ns
+    cached = _CATALOGS.get(locale)
+    if cached is None or cached[0] != mtime:
+        cached = _CATALOGS[locale] = (mtime, json.loads(path.read_text(encoding="utf-8")))
+    return cached[1]
+
+
+def catalog_mtime(locale=None):
+    return (LOCALES_DIR / f"{locale or DEFAULT_LOCALE}.json").stat().st_mtime_ns
+
+
+def localize(soup, locale=None):
+    """
+    テンプレートの差し込み位置をカタログの文字列で置き換える
+    """
+    locale = locale or DEFAULT_LOCALE
+    msgs = load_catalog(locale)
+    if soup.html is not None:
+        soup.html["lang"] = locale
+    for el in soup.select("[data-i18n]"):
+        el.string = msgs[el["data-i18n"]]
+        del el["data-i18n"]
+    for el in soup.select("[data-i18n-alt]"):
+        el["alt"] = msgs[el["data-i18n-alt"]]
+        del el["data-i18n-alt"]
+    return soup
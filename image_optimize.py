@@ -0,0 +1,132 @@
+"""
+タイムラインPNGの可逆最適化
+
+C++側が出力するタイムライン画像は数色しか使わない帯グラフだが，
+フルカラーの RGB(A) PNG として届く．ここでは
+  1. 色数が 256 以下ならパレット（P）モードへ可逆変換（ビット深度も最小化）
+  2. メタデータ（tEXt, iCCP など）を削除
+  3. zlib 最大圧縮 → zopfli（インストールされていれば）で再圧縮
+を行い，結果を元画像の内容ハッシュをキーにキャッシュする．
+"""
+import hashlib
+import io
+import os
+from pathlib import Path
+
+from PIL import Image
+
+import metrics
+
+try:
+    import zopfli.png as zopflipng
+except ImportError:  # zopfli は任意
+    zopflipng = None
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "images"
+
+# 変換ロジックを変えたら上げる（古いキャッシュを無効化）
+CACHE_VERSION = "1"
+
+
+def _bits_for(n_colors):
+    for bits in (1, 2, 4):
+        if n_colors <= (1 << bits):
+            return bits
+    return 8
+
+
+def _to_palette(im):
+    """
+    256色以下なら可逆にPモードへ変換する．変換できなければ None
+    """
+    rgba = im.convert("RGBA")
+    colors = rgba.getcolors(256)
+    if colors is None:
+        return None
+
+    # tRNS を短くするため透過色を先頭に並べる
+    entries = sorted((c for _, c in colors), key=lambda c: c[3] == 255)
+    index = {c: i for i, c in enumerate(entries)}
+
+    pal = Image.new("P", rgba.size)
+    pal.putdata([index[px] for px in rgba.getdata()])
+    flat = []
+    for r, g, b, _ in entries:
+        flat.extend((r, g, b))
+    pal.putpalette(flat)
+
+    alphas = [a for _, _, _, a in entries]
+    if any(a != 255 for a in alphas):
+        # 不透明でない色までを tRNS に入れる
+        last = max(i for i, a in enumerate(alphas) if a != 255)
+        pal.info["transparency"] = bytes(alphas[:last + 1])
+    return pal, len(entries)
+
+
+def optimize_png(data: bytes) -> bytes:
+    """
+    PNG バイト列を可逆に最適化して返す（元より大きくなる場合は元を返す）
+    """
+    im = Image.open(io.BytesIO(data))
+    im.load()
+
+    save_args = {"format": "PNG", "optimize": True, "compress_level": 9}
+    converted = _to_palette(im)
+    if converted is not None:
+        out_im, n_colors = converted
+        save_args["bits"] = _bits_for(n_colors)
+        if "transparency" in out_im.info:
+            save_args["transparency"] = out_im.info["transparency"]
+    else:
+        # 色数が多い場合もメタデータだけは落とす
+        out_im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+
+    buf = io.BytesIO()
+    out_im.save(buf, **save_args)
+    best = buf.getvalue()
+
+    if zopflipng is not None:
+        try:
+            z = zopflipng.optimize(best)
+            if len(z) < len(best):
+                best = z
+        except Exception as e:
+            print(f"WARN: zopfli 失敗 ({e})")
+
+    return best if len(best) < len(data) else data
+
+
+def optimized_path(src, cache_dir=DEFAULT_CACHE_DIR) -> Path:
+    """
+    src を最適化したファイルのパスを返す（内容ハッシュでキャッシュ）
+    """
+    data = Path(src).read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    cache_dir = Path(cache_dir)
+    out = cache_dir / f"{digest}.v{CACHE_VERSION}.png"
+    metrics.cache_event("image", out.exists())
+    if out.exists():
+        return out
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    optimized = optimize_png(data)
+    tmp = out.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(optimized)
+    os.replace(tmp, out)
+    print(f"IMG: {Path(src).name} {len(data)} -> {len(optimized)} bytes")
+    return out
+
+
+def optimize_timeline_images(data, base_dir, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    data["timeline"][].img を最適化済みファイルの file URI に置き換える
+    """
+    base_dir = Path(base_dir)
+    for tl in data.get("timeline", []):
+        if not tl.get("img"):
+            continue
+        src = base_dir / tl["img"]
+        if not src.exists():
+            print(f"WARN: タイムライン画像が見つかりません: {src}")
+            continue
+        tl["img"] = optimized_path(src, cache_dir).resolve().as_uri()
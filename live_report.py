@@ -0,0 +1,304 @@
+"""
+検査中のレポートの逐次更新（JSON Patch を受けてプレビューを描き直す）
+
+検査の途中から C++ 側が report.json への差分を JSON Patch（RFC 6902 の
+add / replace / remove / test）で 1 行ずつ送り，ここで文書をメモリに持って
+当てていく．1 行は操作 1 つのオブジェクトか，操作の配列（まとめて当てる）．
+
+    {"op": "add", "path": "/checks/rows/-", "value": {"label": "ルゴール", "mark": "○", "time": "2分32秒"}}
+    {"op": "add", "path": "/timeline/2/track/events/-", "value": {"time": 300}}
+    [{"op": "add", "path": "/gallery/0/images/-", "value": {"src": "...png", "time": "1m32s", "index": 4}}]
+
+操作が触った最上位の項目（header / checks / timeline / gallery）の部分だけ soup を
+作り直し（print_report.SECTION_UPDATERS），プレビューの PDF は --interval 秒に
+1 回までにまとめて描き直す．フォント・画像・テンプレートは温めたまま使い回すので，
+入力が終わった（EOF）ときの最終 PDF は，最後のプレビューから変わっていなければ
+そのコピーで済み，変わっていても残りの部分を描き直すだけで済む．
+
+当てられないパッチ（パスが無い・test が一致しない）は丸ごと捨てる（文書は変えない）．
+描画の前に report_schema で検証し，不正な間（画像がまだ無いなど）は描かずに次を待つ．
+
+    producer | python live_report.py --out report.pdf [--initial report.json] [--lang en]
+    python live_report.py --input patches.jsonl --out report.pdf --final-json report.json
+"""
+import argparse
+import copy
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+import print_report
+from asset_fetcher import AssetFetcher
+from i18n import DEFAULT_LOCALE, available_locales, load_catalog
+from report_schema import ReportValidationError, validate
+
+DEFAULT_OUT_DIR = Path(__file__).resolve().parent / ".cache" / "live"
+DEFAULT_INTERVAL = 1.0
+
+
+class PatchError(ValueError):
+    pass
+
+
+def _pointer(path):
+    """
+    JSON Pointer → トークンの一覧（"/a/b~1c" → ["a", "b/c"]）
+    """
+    if path == "":
+        return []
+    if not path.startswith("/"):
+        raise PatchError(f"パスは / で始めてください: {path!r}")
+    return [t.replace("~1", "/").replace("~0", "~") for t in path[1:].split("/")]
+
+
+def _index(container, token, path, append=False):
+    if token == "-" and append:
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise PatchError(f"配列の添字ではありません: {path}")
+    i = int(token)
+    if i > len(container) or (i == len(container) and not append):
+        raise PatchError(f"添字が範囲外です: {path}")
+    return i
+
+
+def _parent(doc, tokens, path):
+    node = doc
+    for token in tokens[:-1]:
+        try:
+            node = node[_index(node, token, path)] if isinstance(node, list) else node[token]
+        except (KeyError, TypeError):
+            raise PatchError(f"パスがありません: {path}")
+    if not isinstance(node, (dict, list)):
+        raise PatchError(f"パスがありません: {path}")
+    return node
+
+
+def _apply_op(doc, op):
+    kind, path = op.get("op"), op.get("path")
+    if not isinstance(path, str):
+        raise PatchError(f"path がありません: {op}")
+    tokens = _pointer(path)
+    if not tokens:
+        raise PatchError("文書全体の置き換えはできません（path が空）")
+    parent, last = _parent(doc, tokens, path), tokens[-1]
+
+    if kind == "test":
+        try:
+            value = parent[_index(parent, last, path)] if isinstance(parent, list) else parent[last]
+        except KeyError:
+            raise PatchError(f"パスがありません: {path}")
+        if value != op.get("value"):
+            raise PatchError(f"test が一致しません: {path}")
+    elif kind == "add":
+        value = copy.deepcopy(op["value"])
+        if isinstance(parent, list):
+            parent.insert(_index(parent, last, path, append=True), value)
+        else:
+            parent[last] = value
+    elif kind in ("replace", "remove"):
+        if isinstance(parent, list):
+            i = _index(parent, last, path)
+        elif last in parent:
+            i = last
+        else:
+            raise PatchError(f"パスがありません: {path}")
+        if kind == "replace":
+            parent[i] = copy.deepcopy(op["value"])
+        else:
+            del parent[i]
+    else:
+        raise PatchError(f"未対応の操作です: {kind!r}（add / replace / remove / test）")
+
+
+def apply_patch(data, ops):
+    """
+    ops（JSON Patch の操作の一覧）を当てた新しい文書と，触った最上位の項目を返す．
+    途中で失敗したら PatchError（data は変えない）．触った項目だけ複製してから当てる
+    """
+    if isinstance(ops, dict):
+        ops = [ops]
+    touched = []
+    for op in ops:
+        if not isinstance(op, dict):
+            raise PatchError(f"操作はオブジェクトにしてください: {op!r}")
+        path = op.get("path")
+        if op.get("op") != "test" and isinstance(path, str) and path:
+            key = _pointer(path)[0]
+            if key not in touched:
+                touched.append(key)
+    doc = dict(data)
+    for key in touched:
+        if key in doc:
+            doc[key] = copy.deepcopy(doc[key])
+    for op in ops:
+        _apply_op(doc, op)
+    return doc, [key for key in touched if key in print_report.SECTION_UPDATERS]
+
+
+class LiveReport:
+    """
+    メモリ上の report.json と，それを描いた soup・温めた描画の状態
+    """
+
+    def __init__(self, template, data, out_dir, locale=None, base_dir=None):
+        self.template = str(Path(template).resolve())
+        self.locale = locale or DEFAULT_LOCALE
+        self.base_dir = Path(base_dir or Path.cwd()).resolve()
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.html = self.out_dir / "live.html"
+        self.pdf = self.out_dir / "live.pdf"
+
+        self.data = data
+        self.soup = None
+        self.dirty = set(print_report.SECTION_UPDATERS)
+        self.fetcher = AssetFetcher()
+        self.image_cache = {}
+        self.renders = 0
+        self.patches = 0
+        # 描けずに待っている理由（同じ内容を何度も表示しない）
+        self.waiting = None
+
+    def apply(self, ops):
+        self.data, touched = apply_patch(self.data, ops)
+        self.dirty.update(touched)
+        self.patches += 1
+        return touched
+
+    def render(self):
+        """
+        変わった部分だけ作り直してプレビューを描く．
+        不正な間は描かずに False（変わった部分は覚えておく）
+        """
+        try:
+            validate(self.data, base_dir=self.base_dir)
+        except ReportValidationError as e:
+            if str(e) != self.waiting:
+                print(f"WAIT: {e}")
+            self.waiting = str(e)
+            return False
+        self.waiting = None
+        t0 = time.perf_counter()
+        if self.soup is None:
+            self.soup = print_report.build_soup(self.template, self.data, self.locale)
+            updated = ["all"]
+        else:
+            updated = print_report.update_sections(self.soup, self.data, self.dirty,
+                                                   msgs=load_catalog(self.locale))
+        self.dirty.clear()
+        self.html.write_text(str(self.soup), encoding="utf-8")
+        t1 = time.perf_counter()
+        stats = {}
+        print_report.html_to_pdf(str(self.html), str(self.pdf), url_fetcher=self.fetcher,
+                                 cache=self.image_cache, stats=stats, base_dir=self.base_dir)
+        self.renders += 1
+        print(f"LIVE: #{self.renders} patches {self.patches} {', '.join(updated)} "
+              f"(build {t1 - t0:.3f}s / layout {stats['layout']:.2f}s / write {stats['write_pdf']:.2f}s, "
+              f"{stats['pages']} pages)")
+        return True
+
+    def finish(self, pdf_path):
+        """
+        最終 PDF を pdf_path に書く（最後のプレビューから変わっていなければコピーするだけ）
+        """
+        if self.dirty or self.soup is None:
+            validate(self.data, base_dir=self.base_dir)   # 不正なら誤りの一覧で止める
+            self.render()
+        part = f"{pdf_path}.{os.getpid()}.part"
+        shutil.copyfile(self.pdf, part)
+        os.replace(part, pdf_path)
+        return str(Path(pdf_path).resolve())
+
+
+def _read_lines(stream, q):
+    for line in stream:
+        q.put(line)
+    q.put(None)
+
+
+def run(live, stream, interval=DEFAULT_INTERVAL):
+    """
+    stream から 1 行ずつパッチを当て，変わっていれば interval 秒に 1 回まで描き直す．
+    stream が終わったら戻る
+    """
+    q = queue.Queue()
+    threading.Thread(target=_read_lines, args=(stream, q), name="live-input", daemon=True).start()
+    last_render = 0.0
+    while True:
+        wait = None
+        if live.dirty:
+            wait = max(0.0, last_render + interval - time.monotonic())
+        try:
+            line = q.get(timeout=wait)
+        except queue.Empty:
+            line = ""
+        if line is None:
+            return
+        line = line.strip()
+        if line:
+            try:
+                live.apply(json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                # JSON の誤り・PatchError・value の無い操作．このパッチだけ捨てる
+                print(f"WARN: パッチを当てられません（捨てます）: {e}: {line[:200]}")
+        if live.dirty and time.monotonic() - last_render >= interval:
+            try:
+                live.render()
+            except Exception:
+                # 描画の失敗で入力の受け付けは止めない．soup は次に作り直す
+                print(f"WARN: プレビューの描画に失敗\n{traceback.format_exc()}")
+                live.soup = None
+                live.dirty.update(print_report.SECTION_UPDATERS)
+            last_render = time.monotonic()
+
+
+def main():
+    here = Path(__file__).resolve().parent
+    p = argparse.ArgumentParser(description="JSON Patch を受けて検査中のレポートを逐次描画する")
+    p.add_argument("--template", default=str(here / "report.html"))
+    p.add_argument("--initial", default=None, help="最初の report.json（省略時は空のレポート）")
+    p.add_argument("--input", default="-", help="パッチの入力（JSON Lines．- は標準入力）")
+    p.add_argument("--lang", default=DEFAULT_LOCALE, choices=available_locales())
+    p.add_argument("--base", default=None,
+                   help="画像パスの基準ディレクトリ（既定: --initial の場所．無ければカレント）")
+    p.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                   help="プレビューを描き直す最短間隔 [秒]")
+    p.add_argument("--out-dir", default=str(DEFAULT_OUT_DIR), help="プレビュー（live.pdf）の出力先")
+    p.add_argument("--out", default=None, help="入力が終わったときに書く最終 PDF")
+    p.add_argument("--final-json", default=None, help="入力が終わったときの report.json の保存先")
+    args = p.parse_args()
+
+    if args.initial:
+        data = json.loads(Path(args.initial).read_text(encoding="utf-8"))
+        base_dir = args.base or Path(args.initial).resolve().parent
+    else:
+        data = copy.deepcopy(print_report.EMPTY_REPORT)
+        base_dir = args.base
+    live = LiveReport(args.template, data, args.out_dir, args.lang, base_dir)
+    print(f"LIVE: preview {live.pdf.resolve()}")
+
+    if args.input == "-":
+        stream = open(sys.stdin.fileno(), encoding="utf-8", closefd=False)
+    else:
+        stream = open(args.input, encoding="utf-8")
+    with stream:
+        run(live, stream, args.interval)
+
+    if args.final_json:
+        Path(args.final_json).write_text(json.dumps(live.data, ensure_ascii=False, indent=2),
+                                         encoding="utf-8")
+        print(f"JSON: {Path(args.final_json).resolve()}")
+    if args.out:
+        t0 = time.perf_counter()
+        print(f"PDF: {live.finish(args.out)} ({time.perf_counter() - t0:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""
+描画の負荷試験（レイテンシの分位点・スループット・CPU/RSS）
+
+ジョブを指定の到着率（ポアソン到着）と同時実行数で投入し，ジョブごとの
+  キュー待ち（プールに投入されてからワーカーが取るまで）
+  描画時間（ワーカーでの処理時間）
+  E2E（到着予定時刻から PDF を受け取るまで．クライアント側の待ちも含む）
+を記録して p50/p95/p99 とスループットを出す．試験中は CPU と RSS を定期的に記録する．
+
+対象は 2 通り
+  pool : このプロセス内で RenderPool を起動して直接投入する
+  http : render_server.py に POST /render する
+
+ジョブは
+  --jobs JOBS.jsonl   … バッチと同じ形式の実ジョブ（記録したもの）を繰り返し流す
+  --report report.json … 1 件の report.json を少しずつ変えた合成ジョブを作る
+
+    python load_test.py pool --report report.json --count 200 --rate 2 --workers 4
+    python load_test.py http --url http://127.0.0.1:8765 --report report.json --concurrency 8
+    python load_test.py pool --jobs jobs.jsonl --out v2.json --compare v1.json
+
+結果は --out に JSON で保存し，要約表を表示する（--compare で以前の結果と比較）．
+CPU 使用率の取得には psutil を使う（無ければ RSS とロードアベレージのみ）．
+"""
+import argparse
+import asyncio
+import copy
+import concurrent.futures
+import datetime
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+from render_pool import MB, RenderPool, load_jobs, process_rss
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DEFAULT_OUT_DIR = Path(__file__).resolve().parent / ".cache" / "load_test"
+
+METRICS = ("queue_wait", "render", "e2e")
+
+
+# ---------- ジョブ ----------
+def synthetic_jobs(report_json, count, out_dir, template, lang=None, gallery_scale=1):
+    """
+    report.json を元に count 件の合成ジョブを作る．
+    内容のダイジェストが重ならないよう header に連番を入れる．
+    gallery_scale でギャラリーのブロックを繰り返し，重い検査を模擬する
+    """
+    report_json = Path(report_json).resolve()
+    base = json.loads(report_json.read_text(encoding="utf-8"))
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    for i in range(count):
+        data = copy.deepcopy(base)
+        data.setdefault("header", {})["load_test_seq"] = i
+        data["gallery"] = data.get("gallery", []) * gallery_scale
+        path = out_dir / f"job_{i:05d}.json"
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        jobs.append({"template": template, "json": str(path), "pdf": str(out_dir / f"job_{i:05d}.pdf"),
+                     "lang": lang, "base_dir": str(report_json.parent)})
+    return jobs
+
+
+def recorded_jobs(jobs_path, count, out_dir, template):
+    """
+    記録済みのジョブ一覧を count 件になるまで繰り返す（出力先は out_dir に振り直す）
+    """
+    src = load_jobs(jobs_path, default_template=template)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    for i in range(count):
+        job = dict(src[i % len(src)])
+        job.setdefault("base_dir", str(Path(job["json"]).resolve().parent))
+        job["pdf"] = str(out_dir / f"job_{i:05d}.pdf")
+        job["index_db"] = None
+        jobs.append(job)
+    return jobs
+
+
+# ---------- 対象 ----------
+class PoolTarget:
+    """
+    このプロセス内の RenderPool に投入する
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def pids(self):
+        return [os.getpid()] + self.pool.worker_pids()
+
+    async def run(self, job):
+        res = await asyncio.wrap_future(self.pool.submit(job))
+        return {"queue_wait": res["started"] - res["queued"],
+                "render": res["finished"] - res["started"], "pages": res.get("pages")}
+
+
+class HttpTarget:
+    """
+    render_server.py に POST /render する（wait=1）
+    """
+
+    def __init__(self, url, timeout, concurrency, server_pid=None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.server_pid = server_pid
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+
+    def pids(self):
+        if self.server_pid and psutil is not None:
+            try:
+                proc = psutil.Process(self.server_pid)
+                return [proc.pid] + [c.pid for c in proc.children(recursive=True)]
+            except psutil.Error:
+                return []
+        return [self.server_pid] if self.server_pid else []
+
+    def _post(self, job):
+        body = Path(job["json"]).read_bytes()
+        query = {"timeout": self.timeout}
+        if job.get("lang"):
+            query["lang"] = job["lang"]
+        if job.get("template"):
+            query["template"] = Path(job["template"]).name
+        req = urllib.request.Request(f"{self.url}/render?{urllib.parse.urlencode(query)}",
+                                     data=body, method="POST",
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout + 30) as resp:
+                resp.read()
+                return {"queue_wait": float(resp.headers.get("X-Queue-Wait", "nan")),
+                        "render": float(resp.headers.get("X-Render-Seconds", "nan"))}
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                return {"status": "rejected"}
+            raise RuntimeError(f"HTTP {e.code}: {e.read().decode('utf-8', 'replace')[:200]}")
+
+    async def run(self, job):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._post, job)
+
+
+# ---------- 計測 ----------
+class ResourceSampler(threading.Thread):
+    """
+    対象プロセス群の CPU 使用率（%，1 コア = 100）と RSS 合計を interval 秒ごとに記録する
+    """
+
+    def __init__(self, pids_fn, interval=0.5):
+        super().__init__(name="load-test-sampler", daemon=True)
+        self.pids_fn = pids_fn
+        self.interval = interval
+        self.samples = []
+        self._halt = threading.Event()
+        self._procs = {}
+
+    def _sample(self, t0):
+        pids = [p for p in self.pids_fn() if p]
+        cpu = None
+        rss = 0
+        if psutil is not None:
+            cpu = 0.0
+            procs = {}
+            for pid in pids:
+                proc = self._procs.get(pid)
+                try:
+                    if proc is None:
+                        proc = psutil.Process(pid)
+                        proc.cpu_percent(None)
+                    cpu += proc.cpu_percent(None)
+                    rss += proc.memory_info().rss
+                    procs[pid] = proc
+                except psutil.Error:
+                    continue
+            self._procs = procs
+            if not pids:
+                # プロセスが分からない場合はホスト全体
+                cpu = psutil.cpu_percent(None) * (os.cpu_count() or 1)
+                rss = psutil.virtual_memory().used
+        elif pids:
+            rss = sum(process_rss(pid) or 0 for pid in pids)
+        else:
+            rss = None
+        sample = {"t": time.time() - t0, "cpu": cpu, "rss_mb": rss / MB if rss is not None else None,
+                  "procs": len(pids)}
+        if hasattr(os, "getloadavg"):
+            sample["load"] = os.getloadavg()[0]
+        self.samples.append(sample)
+
+    def run(self):
+        t0 = time.time()
+        while not self._halt.wait(self.interval):
+            self._sample(t0)
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+
+def percentile(values, q):
+    """
+    線形補間の分位点（q は 0〜100）
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    pos = (len(values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def distribution(values):
+    values = [v for v in values if v is not None and v == v]
+    if not values:
+        return None
+    return {"n": len(values), "mean": sum(values) / len(values), "min": min(values),
+            "p50": percentile(values, 50), "p95": percentile(values, 95),
+            "p99": percentile(values, 99), "max": max(values)}
+
+
+async def drive(target, jobs, rate=0.0, concurrency=4, seed=0):
+    """
+    jobs を到着率 rate（件/秒，0 なら一斉）で投入し，同時実行数を concurrency に抑える．
+    ジョブごとの記録のリストを返す
+    """
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(concurrency)
+    rng = random.Random(seed)
+    t0 = time.time()
+    records = []
+
+    async def one(i, job, arrival):
+        async with sem:
+            sent = time.time()
+            rec = {"i": i, "json": job["json"], "arrival": arrival - t0, "client_wait": sent - arrival}
+            try:
+                rec.update(status="ok")
+                rec.update(await target.run(job))
+            except Exception as e:
+                lines = str(e).strip().splitlines()
+                rec.update(status="failed", error=lines[-1] if lines else repr(e))
+            rec["e2e"] = time.time() - arrival
+            records.append(rec)
+
+    tasks = []
+    due = loop.time()
+    for i, job in enumerate(jobs):
+        if rate > 0:
+            due += rng.expovariate(rate)
+            await asyncio.sleep(max(0.0, due - loop.time()))
+        tasks.append(asyncio.create_task(one(i, job, time.time())))
+    await asyncio.gather(*tasks)
+    return sorted(records, key=lambda r: r["i"])
+
+
+def summarize(records, samples, duration):
+    ok = [r for r in records if r["status"] == "ok"]
+    cpu = [s["cpu"] for s in samples if s.get("cpu") is not None]
+    rss = [s["rss_mb"] for s in samples if s["rss_mb"] is not None]
+    return {
+        "jobs": len(records),
+        "ok": len(ok),
+        "failed": sum(r["status"] == "failed" for r in records),
+        "rejected": sum(r["status"] == "rejected" for r in records),
+        "duration": duration,
+        "throughput_per_hour": len(ok) / duration * 3600 if duration else None,
+        "latency": {m: distribution([r.get(m) for r in ok]) for m in METRICS},
+        "cpu_percent": {"mean": sum(cpu) / len(cpu), "max": max(cpu)} if cpu else None,
+        "rss_mb": {"mean": sum(rss) / len(rss), "max": max(rss)} if rss else None,
+    }
+
+
+def print_summary(summary, baseline=None):
+    """
+    要約表（baseline を渡すと p95 の比較列を付ける）
+    """
+    head = f"{'':<12}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    if baseline:
+        head += f"{'base p95':>11}{'diff':>9}"
+    print(head)
+    for m in METRICS:
+        d = summary["latency"][m]
+        if d is None:
+            print(f"{m:<12}{'-':>9}")
+            continue
+        line = f"{m:<12}" + "".join(f"{d[k]:>8.2f}s" for k in ("p50", "p95", "p99", "max"))
+        b = (baseline or {}).get("latency", {}).get(m)
+        if b:
+            diff = (d["p95"] - b["p95"]) / b["p95"] * 100 if b["p95"] else 0.0
+            line += f"{b['p95']:>10.2f}s{diff:>+8.1f}%"
+        print(line)
+
+    tput = summary["throughput_per_hour"] or 0.0
+    line = (f"jobs: {summary['ok']}/{summary['jobs']} ok, {summary['failed']} failed, "
+            f"{summary['rejected']} rejected  ({summary['duration']:.1f}s, {tput:.0f} jobs/h)")
+    if baseline and baseline.get("throughput_per_hour"):
+        line += f"  base {baseline['throughput_per_hour']:.0f} jobs/h"
+    print(line)
+    if summary["cpu_percent"]:
+        print(f"cpu : mean {summary['cpu_percent']['mean']:.0f}%  max {summary['cpu_percent']['max']:.0f}%")
+    if summary["rss_mb"]:
+        print(f"rss : mean {summary['rss_mb']['mean']:.0f}MB  max {summary['rss_mb']['max']:.0f}MB")
+
+
+def main():
+    p = argparse.ArgumentParser(description="描画の負荷試験")
+    p.add_argument("target", choices=["pool", "http"], help="投入先（プロセス内プール / HTTPサービス）")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--jobs", help="記録済みジョブ一覧（--batch と同じ JSON Lines）")
+    src.add_argument("--report", help="合成ジョブの元にする report.json")
+    p.add_argument("--template", default="report.html")
+    p.add_argument("--lang", default=None)
+    p.add_argument("--gallery-scale", type=int, default=1, help="合成ジョブのギャラリーを何倍にするか")
+    p.add_argument("--count", type=int, default=50, help="投入するジョブ数")
+    p.add_argument("--rate", type=float, default=0.0, help="到着率（件/秒，0 で一斉投入）")
+    p.add_argument("--concurrency", type=int, default=8, help="同時に投入中にするジョブ数の上限")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--sample-interval", type=float, default=0.5, help="CPU/RSS の記録間隔（秒）")
+    p.add_argument("--out-dir", default=str(DEFAULT_OUT_DIR), help="合成ジョブと PDF の出力先")
+    p.add_argument("--out", default=None, help="結果 JSON の保存先")
+    p.add_argument("--compare", default=None, help="比較する以前の結果 JSON")
+    g = p.add_argument_group("pool")
+    g.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    g.add_argument("--max-jobs", type=int, default=50)
+    g.add_argument("--max-rss-mb", type=int, default=0)
+    g = p.add_argument_group("http")
+    g.add_argument("--url", default="http://127.0.0.1:8765")
+    g.add_argument("--timeout", type=float, default=120.0)
+    g.add_argument("--server-pid", type=int, default=None, help="CPU/RSS を記録するサーバのPID")
+    args = p.parse_args()
+
+    if args.jobs:
+        jobs = recorded_jobs(args.jobs, args.count, args.out_dir, args.template)
+    else:
+        jobs = synthetic_jobs(args.report, args.count, args.out_dir, args.template,
+                              args.lang, args.gallery_scale)
+
+    pool = None
+    if args.target == "pool":
+        pool = RenderPool(workers=args.workers, max_jobs=args.max_jobs, max_rss_mb=args.max_rss_mb,
+                          templates=sorted({j["template"] for j in jobs}))
+        pool.start()
+        target = PoolTarget(pool)
+    else:
+        target = HttpTarget(args.url, args.timeout, args.concurrency, args.server_pid)
+
+    sampler = ResourceSampler(target.pids, args.sample_interval)
+    sampler.start()
+    t0 = time.time()
+    try:
+        records = asyncio.run(drive(target, jobs, args.rate, args.concurrency, args.seed))
+    finally:
+        duration = time.time() - t0
+        sampler.stop()
+        if pool is not None:
+            pool.close()
+
+    summary = summarize(records, sampler.samples, duration)
+    report = {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "summary": summary,
+        "samples": sampler.samples,
+        "jobs": records,
+    }
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"RESULT: {args.out}")
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))["summary"]
+    print_summary(summary, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+描画パイプラインのメトリクス（Prometheus テキスト形式）
+
+カウンタ・ゲージ・ヒストグラムをプロセス内のレジストリに持ち，
+  start_http_server(port)      … http://127.0.0.1:<port>/metrics で公開
+  write_textfile(path)         … ファイルに書き出す（node_exporter の textfile collector 用）
+  start_file_dumper(path, 15)  … 一定間隔でファイルに書き出す（ネットワークの無いホスト用）
+で取り出す．render_server.py は /metrics で同じ内容を返す．
+
+ワーカープロセス内の数値は親に届かないので，ワーカーはジョブの結果
+（工程ごとの時間・キャッシュの当たり外れ）を返し，親の RenderPool が
+observe_job() でここに記録する．
+"""
+import bisect
+import os
+import threading
+import time
+from collections import Counter as _Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name}: ラベルは {self.labels} です（{tuple(labels)}）")
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def lines(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def remove(self, **labels):
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def set_function(self, fn):
+        """
+        出力のたびに fn() を呼んで値を取る（戻り値は {ラベル値のタプル: 値} か数値）
+        """
+        self._function = fn
+
+    def lines(self):
+        if self._function is not None:
+            values = self._function()
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}"
+                for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # ラベル値 → [バケットごとの件数..., +Inf の件数, 合計]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def lines(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        out = []
+        for key, counts in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = (("le", _format_value(bound)),)
+                out.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(counts[-1])}")
+            out.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"メトリクス名が重複しています: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._add(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        """
+        Prometheus テキスト形式
+        """
+        out = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines = metric.lines()
+            except Exception as e:
+                print(f"WARN: メトリクス {metric.name} を取得できません ({e})")
+                continue
+            out += metric.header() + lines
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---------- 描画パイプラインのメトリクス ----------
+JOBS = REGISTRY.counter("report_jobs_total", "完了したジョブ数", ("status", "priority"))
+STAGE_SECONDS = REGISTRY.histogram("report_stage_seconds", "工程ごとの時間（秒）", ("stage",))
+QUEUE_WAIT = REGISTRY.histogram("report_queue_wait_seconds", "キュー待ち時間（秒）", ("priority",))
+JOB_SECONDS = REGISTRY.histogram("report_job_seconds", "投入から完了までの時間（秒）", ("priority",))
+QUEUE_DEPTH = REGISTRY.gauge("report_queue_depth", "キュー待ちのジョブ数", ("priority",))
+BUSY_WORKERS = REGISTRY.gauge("report_busy_workers", "ジョブ実行中のワーカー数")
+WORKER_RSS = REGISTRY.gauge("report_worker_rss_bytes", "ワーカーの直近ジョブ後の RSS", ("pid",))
+CACHE_REQUESTS = REGISTRY.counter("report_cache_requests_total", "キャッシュの参照数",
+                                  ("cache", "result"))
+PDF_BYTES = REGISTRY.counter("report_pdf_bytes_total", "出力した PDF のバイト数")
+PDF_PAGES = REGISTRY.counter("report_pdf_pages_total", "出力した PDF のページ数")
+IMAGES = REGISTRY.counter("report_images_total", "描画したレポートが参照する画像の枚数")
+SLOW_PROFILES = REGISTRY.counter("report_slow_profiles_total", "閾値を超えてプロファイルを保存した描画の数")
+
+# このプロセスでのキャッシュ参照数（ワーカーからジョブごとの差分を親に返すため）
+_CACHE_EVENTS = _Counter()
+
+
+def cache_event(cache, hit, count=1):
+    """
+    キャッシュの当たり外れを記録する（cache: template / asset / image / font_subset / result など）
+    """
+    result = "hit" if hit else "miss"
+    _CACHE_EVENTS[(cache, result)] += count
+    CACHE_REQUESTS.inc(count, cache=cache, result=result)
+
+
+def cache_snapshot():
+    return dict(_CACHE_EVENTS)
+
+
+def cache_delta(before):
+    """
+    cache_snapshot() からの差分（{"キャッシュ名:hit|miss": 件数}，JSON にそのまま載る形）
+    """
+    return {f"{cache}:{result}": n - before.get((cache, result), 0)
+            for (cache, result), n in _CACHE_EVENTS.items()
+            if n != before.get((cache, result), 0)}
+
+
+def observe_job(status, priority, result=None, queue_wait=None, seconds=None):
+    """
+    ジョブ 1 件の結果を記録する（RenderPool の親プロセスで呼ぶ）
+    """
+    JOBS.inc(status=status, priority=priority)
+    if queue_wait is not None:
+        QUEUE_WAIT.observe(queue_wait, priority=priority)
+    if seconds is not None:
+        JOB_SECONDS.observe(seconds, priority=priority)
+    if not result:
+        return
+    for stage, sec in (result.get("timings") or {}).items():
+        STAGE_SECONDS.observe(sec, stage=stage)
+    for key, n in (result.get("cache") or {}).items():
+        cache, _, res = key.partition(":")
+        CACHE_REQUESTS.inc(n, cache=cache, result=res)
+    if result.get("pages"):
+        PDF_PAGES.inc(result["pages"])
+    if result.get("images"):
+        IMAGES.inc(result["images"])
+    if result.get("slow_profile"):
+        SLOW_PROFILES.inc()
+    try:
+        PDF_BYTES.inc(os.path.getsize(result["pdf"]))
+    except (KeyError, OSError):
+        pass
+
+
+# ---------- 出力 ----------
+def write_textfile(path, registry=REGISTRY):
+    """
+    ファイルに書き出す（一時ファイルから置き換えるので読み手が書きかけを見ない）
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp, path)
+
+
+def start_file_dumper(path, interval=15.0, registry=REGISTRY):
+    """
+    interval 秒ごとに write_textfile する daemon スレッドを起動する
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_textfile(path, registry)
+            except OSError as e:
+                print(f"WARN: メトリクスを書き出せません {path} ({e})")
+
+    thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_http_server(port, host="127.0.0.1", registry=REGISTRY):
+    """
+    GET /metrics を返す HTTP サーバを daemon スレッドで起動する
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"METRICS: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,179 @@
+"""
+描画エンジンの見た目の一致確認（weasyprint と reportlab）
+
+同じ report.json を両方のエンジンで描き，
+  1. ページ数
+  2. 文字の位置 … ページごとに文字を行にまとめ（pypdf），同じ文字列の行どうしの
+                  開始位置のずれ [mm] を比べる．片方にしか無い行も数える
+  3. 画素       … pypdfium2 があれば両方をラスタライズし，濃淡が閾値以上違う画素の
+                  割合を出して差分画像（赤）を --out-dir に保存する
+  4. 時間       … 各エンジンの描画時間の中央値（--repeat 回）
+を表示する．位置のずれ・画素の差が閾値を超えたら終了コード 1．
+
+    python parity_check.py --report report.json [--lang en] [--repeat 5]
+    python parity_check.py --gallery-scale 4 --max-offset 1.5 --max-pixels 2.0
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+from pypdf import PdfReader
+
+import print_report
+
+DEFAULT_OUT_DIR = Path(__file__).resolve().parent / ".cache" / "parity"
+PT = 25.4 / 72
+
+
+def text_lines(pdf_path):
+    """
+    ページごとの [(行の文字列（空白除く）, x [mm], y [mm]), ...]．y は下端からの位置
+    """
+    pages = []
+    for page in PdfReader(str(pdf_path)).pages:
+        chunks = []
+
+        def visit(text, cm, tm, font_dict, font_size):
+            if text.strip():
+                # 文字の位置 = テキスト行列 × 変換行列
+                x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+                y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+                chunks.append((round(y * PT, 1), x * PT, text))
+
+        page.extract_text(visitor_text=visit)
+        lines = []
+        for y, x, text in sorted(chunks, key=lambda c: (-c[0], c[1])):
+            if lines and abs(lines[-1][2] - y) < 1.0:
+                lines[-1][0] += text
+            else:
+                lines.append([text, x, y])
+        pages.append([("".join(t.split()), x, y) for t, x, y in lines])
+    return pages
+
+
+def compare_text(pages_a, pages_b):
+    """
+    戻り値: {"matched", "missing", "extra", "max_offset", "mean_offset", "worst"}
+    """
+    offsets, missing, worst = [], [], None
+    extra = 0
+    for page_no, (a, b) in enumerate(zip(pages_a, pages_b)):
+        rest = list(b)
+        for text, x, y in a:
+            same = [r for r in rest if r[0] == text]
+            if not same:
+                missing.append((page_no + 1, text))
+                continue
+            best = min(same, key=lambda r: abs(r[1] - x) + abs(r[2] - y))
+            rest.remove(best)
+            d = max(abs(best[1] - x), abs(best[2] - y))
+            offsets.append(d)
+            if worst is None or d > worst[0]:
+                worst = (d, page_no + 1, text)
+        extra += len(rest)
+    return {"matched": len(offsets), "missing": missing, "extra": extra,
+            "max_offset": max(offsets, default=0.0),
+            "mean_offset": statistics.mean(offsets) if offsets else 0.0, "worst": worst}
+
+
+def compare_pixels(pdf_a, pdf_b, out_dir, dpi=72, threshold=64):
+    """
+    差のある画素の割合 [%]（ページごと）．pypdfium2 が無ければ None
+    """
+    try:
+        import pypdfium2
+    except ImportError:
+        return None
+    from PIL import Image, ImageChops
+
+    doc_a, doc_b = pypdfium2.PdfDocument(str(pdf_a)), pypdfium2.PdfDocument(str(pdf_b))
+    ratios = []
+    for i in range(min(len(doc_a), len(doc_b))):
+        img_a = doc_a[i].render(scale=dpi / 72).to_pil().convert("L")
+        img_b = doc_b[i].render(scale=dpi / 72).to_pil().convert("L").resize(img_a.size)
+        diff = ImageChops.difference(img_a, img_b).point(lambda v: 255 if v >= threshold else 0)
+        ratios.append(100 * diff.histogram()[255] / (diff.width * diff.height))
+        overlay = Image.merge("RGB", (ImageChops.lighter(img_a, diff), img_a, img_a))
+        overlay.save(out_dir / f"diff_p{i + 1}.png")
+    return ratios
+
+
+def render(engine, template, report_json, pdf, lang, repeat, base_dir):
+    seconds = []
+    result = None
+    for _ in range(repeat + 1):   # 1 回目はフォント読込などを含むので捨てる
+        t0 = time.perf_counter()
+        result = print_report.render_report(template, str(report_json), str(pdf), locale=lang,
+                                            base_dir=base_dir, engine=engine)
+        seconds.append(time.perf_counter() - t0)
+    return result, statistics.median(seconds[1:])
+
+
+def main():
+    here = Path(__file__).resolve().parent
+    p = argparse.ArgumentParser(description="weasyprint と reportlab の描画結果の一致確認")
+    p.add_argument("--template", default=str(here / "report.html"))
+    p.add_argument("--report", default=str(here / "report.json"))
+    p.add_argument("--lang", default=None)
+    p.add_argument("--repeat", type=int, default=3, help="時間を測る描画回数（エンジンごと）")
+    p.add_argument("--gallery-scale", type=int, default=1,
+                   help="ギャラリーのブロックを N 倍にして続きのシートも比べる")
+    p.add_argument("--max-offset", type=float, default=1.5, help="許す文字位置のずれ [mm]")
+    p.add_argument("--max-pixels", type=float, default=3.0, help="許す画素の差 [%%]（ページごと）")
+    p.add_argument("--out-dir", default=str(DEFAULT_OUT_DIR), help="PDF・差分画像の出力先")
+    args = p.parse_args()
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    report_json = Path(args.report).resolve()
+    if args.gallery_scale > 1:
+        data = json.loads(report_json.read_text(encoding="utf-8"))
+        data["gallery"] = data.get("gallery", []) * args.gallery_scale
+        scaled = out_dir / f"scaled_{report_json.name}"
+        scaled.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        json_path = scaled
+    else:
+        json_path = report_json
+
+    pdfs = {}
+    results = {}
+    for engine in print_report.ENGINES:
+        pdfs[engine] = out_dir / f"{engine}.pdf"
+        # 画像の相対パスは元の report.json の場所から解決する
+        results[engine] = render(engine, args.template, json_path, pdfs[engine], args.lang,
+                                 args.repeat, report_json.parent)
+
+    html, canvas = print_report.ENGINES
+    failed = False
+    pages = {e: results[e][0]["pages"] for e in results}
+    print(f"pages  : {html} {pages[html]} / {canvas} {pages[canvas]}")
+    failed |= pages[html] != pages[canvas]
+
+    text = compare_text(text_lines(pdfs[html]), text_lines(pdfs[canvas]))
+    print(f"text   : {text['matched']} lines matched, max offset {text['max_offset']:.2f}mm, "
+          f"mean {text['mean_offset']:.2f}mm, missing {len(text['missing'])}, extra {text['extra']}")
+    if text["worst"] and text["worst"][0] > args.max_offset:
+        print(f"         worst: p{text['worst'][1]} {text['worst'][2]!r} {text['worst'][0]:.2f}mm")
+    for page_no, line in text["missing"][:10]:
+        print(f"         missing: p{page_no} {line!r}")
+    failed |= text["max_offset"] > args.max_offset or bool(text["missing"])
+
+    ratios = compare_pixels(pdfs[html], pdfs[canvas], out_dir)
+    if ratios is None:
+        print("pixels : pypdfium2 が無いため省略")
+    else:
+        print("pixels : " + ", ".join(f"p{i + 1} {r:.2f}%" for i, r in enumerate(ratios)) +
+              f"  (diff: {out_dir}/diff_p*.png)")
+        failed |= any(r > args.max_pixels for r in ratios)
+
+    t_html, t_canvas = results[html][1], results[canvas][1]
+    print(f"time   : {html} {t_html:.3f}s / {canvas} {t_canvas:.3f}s "
+          f"({t_html / max(t_canvas, 1e-9):.1f}x)")
+    print("NG" if failed else "OK")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+PDF 内・PDF 間の画像 XObject / フォントの重複排除
+
+体位図（position.png）やロゴは各レポートに毎回埋め込まれ，印刷・保管用に
+複数レポートを結合すると文書の数だけ同じ画像が入る．ここでは
+ページのリソース（/XObject, /Font とそのフォントプログラム）を内容ハッシュで
+索引し，同じものは最初の 1 つを参照するよう付け替える．
+
+pypdf の PdfWriter.compress_identical_objects は書き出し前に全オブジェクトを
+走査するが，こちらは追加したページのリソースだけを見るので，
+文書を 1 つずつ結合しながら索引を使い回せる．追加したページから辿れる
+オブジェクトの被参照数を数えておき，付け替えで 0 になったものだけを削除する
+（削除のために文書全体を辿り直さない）．
+
+    python pdf_dedup.py merge out.pdf a.pdf b.pdf ...   # 結合＋重複排除
+    python pdf_dedup.py dedupe in.pdf [out.pdf]          # 1 ファイル内の重複排除
+"""
+import argparse
+import hashlib
+import os
+from collections import Counter
+from pathlib import Path
+
+from pypdf import PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    StreamObject,
+)
+
+# 重複判定に使わないキー（/Parent は循環するので辿らない）
+_SKIP_KEYS = {"/Length", "/Parent"}
+
+# フォント記述子内のフォントプログラム
+_FONT_FILE_KEYS = ("/FontFile", "/FontFile2", "/FontFile3")
+
+
+class DedupIndex:
+    """
+    PdfWriter に追加されたページのリソースを内容ハッシュで索引する
+    """
+
+    def __init__(self, writer: PdfWriter):
+        self.writer = writer
+        self._canonical = {}     # ハッシュ → 残す IndirectObject
+        self._hash_memo = {}     # idnum → ハッシュ
+        self._refs = Counter()   # idnum → 数えたオブジェクトからの被参照数
+        self._counted = set()    # 参照を数え済みのオブジェクトの idnum
+        self._dead = set()       # 被参照数が 0 になった idnum（削除の対象）
+        self.stats = {"images": 0, "fonts": 0, "font_files": 0}
+
+    # ---------- ハッシュ ----------
+    def _digest(self, obj, h, visiting):
+        if isinstance(obj, IndirectObject):
+            h.update(self._hash_ref(obj, visiting))
+        elif isinstance(obj, DictionaryObject):
+            h.update(b"<<")
+            for k in sorted(obj.keys()):
+                if k in _SKIP_KEYS:
+                    continue
+                h.update(k.encode("latin-1"))
+                self._digest(obj.raw_get(k), h, visiting)
+            h.update(b">>")
+            if isinstance(obj, StreamObject):
+                h.update(b"stream")
+                h.update(obj._data)
+        elif isinstance(obj, ArrayObject):
+            h.update(b"[")
+            for v in obj:
+                self._digest(v, h, visiting)
+            h.update(b"]")
+        else:
+            h.update(repr(obj).encode("utf-8", "surrogatepass"))
+
+    def _hash_ref(self, ref, visiting=None):
+        idnum = ref.idnum
+        if idnum in self._hash_memo:
+            return self._hash_memo[idnum]
+        visiting = visiting if visiting is not None else set()
+        if idnum in visiting:
+            # 循環参照は番号で代用（辿らない）
+            return f"cycle:{idnum}".encode()
+        visiting.add(idnum)
+        h = hashlib.sha256()
+        self._digest(ref.get_object(), h, visiting)
+        visiting.discard(idnum)
+        self._hash_memo[idnum] = h.digest()
+        return self._hash_memo[idnum]
+
+    # ---------- 被参照数 ----------
+    @staticmethod
+    def _children(obj):
+        """obj が直接持つ間接参照（/Parent は除く．直接オブジェクトの中は辿る）"""
+        todo = [obj]
+        while todo:
+            o = todo.pop()
+            if isinstance(o, IndirectObject):
+                yield o
+            elif isinstance(o, DictionaryObject):
+                todo.extend(o.raw_get(k) for k in o.keys() if k != "/Parent")
+            elif isinstance(o, ArrayObject):
+                todo.extend(o)
+
+    def _count(self, page):
+        """ページから辿れるオブジェクトの参照を数える（数え済みのオブジェクトの先は辿らない）"""
+        todo = [page]
+        while todo:
+            for ref in self._children(todo.pop()):
+                self._refs[ref.idnum] += 1
+                if ref.idnum not in self._counted:
+                    self._counted.add(ref.idnum)
+                    todo.append(ref.get_object())
+
+    def _release(self, ref):
+        """参照を 1 つ外し，0 になったらその先の参照も外す"""
+        todo = [ref]
+        while todo:
+            r = todo.pop()
+            self._refs[r.idnum] -= 1
+            if self._refs[r.idnum] <= 0 and r.idnum not in self._dead:
+                self._dead.add(r.idnum)
+                todo.extend(self._children(r.get_object()))
+
+    # ---------- 付け替え ----------
+    def _canonicalize(self, container, key, kind):
+        """
+        container[key]（間接参照）を同一内容の既存オブジェクトへ付け替える．
+        新規なら索引に登録して True を返す
+        """
+        ref = container.raw_get(key)
+        if not isinstance(ref, IndirectObject):
+            return False
+        h = kind.encode() + self._hash_ref(ref)
+        first = self._canonical.get(h)
+        if first is None:
+            self._canonical[h] = ref
+            return True
+        if first.idnum != ref.idnum:
+            container[NameObject(key)] = first
+            self._refs[first.idnum] += 1
+            self._release(ref)
+            self.stats[kind] += 1
+        return False
+
+    def _dedupe_font(self, font):
+        """フォント辞書そのものが新規でも，中のフォントプログラムは共有できる"""
+        fonts = [font]
+        for desc in font.get("/DescendantFonts", []):
+            fonts.append(desc.get_object())
+        for f in fonts:
+            descriptor = f.get("/FontDescriptor")
+            if descriptor is None:
+                continue
+            descriptor = descriptor.get_object()
+            for key in _FONT_FILE_KEYS:
+                if key in descriptor:
+                    self._canonicalize(descriptor, key, "font_files")
+
+    def _dedupe_resources(self, resources):
+        if resources is None:
+            return
+        resources = resources.get_object()
+
+        xobjects = resources.get("/XObject")
+        if xobjects is not None:
+            xobjects = xobjects.get_object()
+            for name in list(xobjects.keys()):
+                if self._canonicalize(xobjects, name, "images"):
+                    xobj = xobjects[name]
+                    # Form XObject の中のリソースも対象にする
+                    if xobj.get("/Subtype") == "/Form":
+                        self._dedupe_resources(xobj.get("/Resources"))
+
+        fonts = resources.get("/Font")
+        if fonts is not None:
+            fonts = fonts.get_object()
+            for name in list(fonts.keys()):
+                if self._canonicalize(fonts, name, "fonts"):
+                    self._dedupe_font(fonts[name])
+
+    def add_pages(self, pages):
+        """
+        追加したページのリソースを索引に登録し，既存と同じものは付け替える
+        """
+        # ページ間で共有しているリソースが途中で 0 にならないよう，先に全部数える
+        for page in pages:
+            self._count(page)
+        for page in pages:
+            self._dedupe_resources(page.get("/Resources"))
+
+    def _pinned(self):
+        """
+        ページ以外（AcroForm の /DR・文書情報など）から参照されているもの．
+        ページの木には入らず，ページの中で付け替えても消してはいけない
+        """
+        found = set()
+        root = self.writer.root_object
+        todo = [root.raw_get(k) for k in root.keys() if k != "/Pages"]
+        todo.append(getattr(self.writer, "_info", None))
+        while todo:
+            o = todo.pop()
+            if isinstance(o, IndirectObject):
+                if o.idnum not in found:
+                    found.add(o.idnum)
+                    todo.append(o.get_object())
+            elif isinstance(o, DictionaryObject):
+                # しおり・リンク先のページの中は辿らない
+                if o.get("/Type") not in ("/Page", "/Pages"):
+                    todo.extend(o.raw_get(k) for k in o.keys() if k != "/Parent")
+            elif isinstance(o, ArrayObject):
+                todo.extend(o)
+        return found
+
+    def prune(self):
+        """
+        付け替えで被参照数が 0 になったオブジェクトを書き出し対象から外す．
+        新規のフォント辞書の中のフォントプログラムなど，後から付け替えたものも
+        付け替えた時点で数が減っているので拾える
+        """
+        removed = 0
+        dead = self._dead - self._pinned() if self._dead else set()
+        for idnum in dead:
+            if self.writer._objects[idnum - 1] is not None:
+                self.writer._objects[idnum - 1] = None
+                removed += 1
+        self._dead.clear()
+        return removed
+
+
+def _write_atomic(writer, out_path):
+    out_path = Path(out_path)
+    tmp = out_path.with_name(out_path.name + ".part")
+    with open(tmp, "wb") as f:
+        writer.write(f)
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def merge_pdfs(pdf_paths, out_path):
+    """
+    複数の PDF を結合し，共通の画像・フォントを 1 つにまとめて書き出す
+    """
+    writer = PdfWriter()
+    index = DedupIndex(writer)
+    for path in pdf_paths:
+        start = len(writer.pages)
+        writer.append(str(path))
+        index.add_pages(writer.pages[start:])
+    removed = index.prune()
+    _write_atomic(writer, out_path)
+    print(f"DEDUP: {index.stats} / 削除オブジェクト {removed}")
+    return index.stats
+
+
+def dedupe_pdf(pdf_path, out_path=None):
+    """
+    1 つの PDF 内で重複している画像・フォントをまとめる（out_path 省略時は上書き）
+    """
+    writer = PdfWriter(clone_from=str(pdf_path))
+    index = DedupIndex(writer)
+    index.add_pages(writer.pages)
+    removed = index.prune()
+    _write_atomic(writer, out_path or pdf_path)
+    print(f"DEDUP: {index.stats} / 削除オブジェクト {removed}")
+    return index.stats
+
+
+def main():
+    p = argparse.ArgumentParser(description="PDFの画像・フォント重複排除／結合")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("merge", help="複数PDFを結合して重複排除")
+    m.add_argument("out", help="出力PDF")
+    m.add_argument("inputs", nargs="+", help="入力PDF（この順に結合）")
+    d = sub.add_parser("dedupe", help="1ファイル内の重複排除")
+    d.add_argument("pdf", help="入力PDF")
+    d.add_argument("out", nargs="?", default=None, help="出力PDF（省略時は上書き）")
+    args = p.parse_args()
+
+    if args.cmd == "merge":
+        merge_pdfs(args.inputs, args.out)
+    else:
+        dedupe_pdf(args.pdf, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+PDF の出力プロファイル
+
+用途ごとに WeasyPrint の write_pdf オプションと書き出し後の処理を決めておき，
+ジョブごとに名前で選ぶ（--profile / ジョブの "profile"）．指定しなければ WeasyPrint の既定．
+
+  print    … 印刷用．作る速さ優先：フォントはサブセット化せず丸ごと，ストリームは無圧縮．
+             SumatraPDF に渡してすぐ捨てるのでサイズは気にしない
+  archive  … 保管用．サイズ優先：オブジェクトストリーム＋Flate 圧縮（WeasyPrint の既定），
+             フォントはサブセット，画像は 200dpi に縮小して再圧縮（JPEG 品質 80）
+  preview  … 病棟の端末での閲覧用．画像は画面向けに 110dpi まで縮小し，qpdf があれば
+             線形化（1 ページ目から表示できる形）する．qpdf が無ければ線形化だけ省く
+
+どのプロファイルも 1 回の write_pdf で済ませ，描画をやり直さない．
+サイズと時間の比較は bench_profiles.py で取る．
+"""
+import os
+import shutil
+import subprocess
+import time
+
+PROFILES = {
+    "print": {
+        "options": {"full_fonts": True, "uncompressed_pdf": True, "optimize_images": False},
+        "linearize": False,
+    },
+    "archive": {
+        "options": {"full_fonts": False, "uncompressed_pdf": False, "optimize_images": True,
+                    "dpi": 200, "jpeg_quality": 80},
+        "linearize": False,
+    },
+    "preview": {
+        "options": {"full_fonts": False, "uncompressed_pdf": False, "optimize_images": True,
+                    "dpi": 110, "jpeg_quality": 75},
+        "linearize": True,
+    },
+}
+
+_WARNED = set()
+
+
+def check_profile(name):
+    if name is not None and name not in PROFILES:
+        raise ValueError(f"不明な出力プロファイル: {name}（{', '.join(PROFILES)}）")
+    return name
+
+
+def write_options(name):
+    """
+    write_pdf に渡すオプション（name が None なら空）
+    """
+    if check_profile(name) is None:
+        return {}
+    return dict(PROFILES[name]["options"])
+
+
+def finish(pdf_path, name):
+    """
+    書き出した PDF にプロファイルの後処理をする（pdf_path をその場で置き換える）
+    戻り値: かかった秒数
+    """
+    if check_profile(name) is None or not PROFILES[name]["linearize"]:
+        return 0.0
+    t0 = time.perf_counter()
+    linearize(pdf_path)
+    return time.perf_counter() - t0
+
+
+def linearize(pdf_path):
+    """
+    qpdf --linearize で線形化する．qpdf が PATH に無ければ何もしない（False を返す）
+    """
+    qpdf = shutil.which("qpdf")
+    if qpdf is None:
+        if "qpdf" not in _WARNED:
+            _WARNED.add("qpdf")
+            print("WARN: qpdf が見つからないため線形化を省きます")
+        return False
+    tmp = f"{pdf_path}.lin"
+    try:
+        proc = subprocess.run([qpdf, "--linearize", str(pdf_path), tmp],
+                              capture_output=True, text=True)
+        # 終了コード 3 は警告付きの成功
+        if proc.returncode not in (0, 3):
+            raise RuntimeError(f"qpdf --linearize に失敗: {proc.stderr.strip()}")
+        os.replace(tmp, pdf_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return True
@@ -1,10 +1,20 @@
 import os, time, subprocess, argparse, sys
-from weasyprint import HTML
+from weasyprint import HTML, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
 from bs4 import BeautifulSoup
-import json, tempfile
+import copy, json, multiprocessing, tempfile
 from pathlib import Path
 import re
 
+import metrics
+import pdf_profiles
+import report_index
+from i18n import DEFAULT_LOCALE, available_locales, catalog_mtime, load_catalog, localize
+from gallery_layout import gallery_geometry, paginate
+from render_pool import ENGINES
+from report_schema import validate
+from timeline_svg import build_timeline_svg
+
 # Windows の場合だけ win32print を使う
 if sys.platform.startswith("win"):
     import win32print
@@ -16,8 +26,35 @@ if os.path.isdir(DLL_DIR):
 
 DEFAULT_SUMATRA = os.path.join(os.path.dirname(__file__), "bin", "SumatraPDF.exe")
 
+# 解析済みテンプレート（パス → (更新時刻, soup)）
+_PARSED_CACHE = {}
+
+# 言語ごとに文字列を差し込んだテンプレート（(パス, 言語) → ((更新時刻, カタログ更新時刻), soup)）
+_TEMPLATE_CACHE = {}
+
+# 常駐・バッチ時に使い回すフォント設定（@font-face の読込結果を保持）
+_FONT_CONFIG = None
+
+# アセットストアごとの url_fetcher（常駐・バッチ時はジョブをまたいで使い回す）
+_ASSET_FETCHERS = {}
+
+# 分割描画の子プロセスに fork で引き継ぐ状態（画像キャッシュなど）
+_CHUNK_STATE = {}
 
-def update_report_meta(soup, data):
+# 複数テンプレート描画時に fork 先へ渡す共有データ（data, fetcher, 画像キャッシュなど）
+_SHARED_TARGET_STATE = {}
+
+# ウォームアップ用の空データ
+EMPTY_REPORT = {
+    "header": {"date": ""},
+    "checks": {"rows": [], "biopsy": {}, "times": {"start": "", "end": ""}},
+    "timeline": [],
+    "gallery": [],
+}
+
+
+def update_report_meta(soup, data, msgs=None):
+    msgs = msgs or load_catalog()
     meta_div = soup.find("div", class_="report-meta")
     if not meta_div:
         return
@@ -25,19 +62,20 @@ def update_report_meta(soup, data):
 
     # 日付
     new_date = soup.new_tag("div")
-    new_date.string = data["header"]["date"]
+    new_date.string = msgs["date"].format(date=data["header"]["date"])
     meta_div.append(new_date)
 
     # 患者ID
     new_id = soup.new_tag("div")
-    new_id.string = f"【患者ID 　　　　】"
+    new_id.string = msgs["patient_id"]
     meta_div.append(new_id)
 
 
-def update_exam_summary(soup, data):
+def update_exam_summary(soup, data, msgs=None):
     """
     検査サマリー（表、biopsy、開始/終了時刻）の更新
     """
+    msgs = msgs or load_catalog()
     # --- 表 (tbody) ---
     tbody = soup.select_one(".exam-summary__table tbody")
     if tbody:
@@ -65,18 +103,19 @@ def update_exam_summary(soup, data):
     if aside:
         aside.clear()
         start_div = soup.new_tag("div", **{"lang": "en"})
-        start_div.string = f"検査開始時刻　{data['checks']['times']['start']}"
+        start_div.string = msgs["start_time"].format(time=data['checks']['times']['start'])
         end_div = soup.new_tag("div", **{"lang": "en"})
-        end_div.string = f"終了時刻　　{data['checks']['times']['end']}"
+        end_div.string = msgs["end_time"].format(time=data['checks']['times']['end'])
         img_div = soup.new_tag("div", **{"class": "exam-summary__position-image"})
-        img_tag = soup.new_tag("img", src="position.png", alt="検査体位図")
+        img_tag = soup.new_tag("img", src="position.png", alt=msgs["position_alt"])
         img_div.append(img_tag)
         aside.extend([start_div, end_div, img_div])
 
-def update_exam_timeline(soup, data):
+def update_exam_timeline(soup, data, msgs=None):
     """
     タイムライン部分を JSON データから更新する
     """
+    msgs = msgs or load_catalog()
     section = soup.find("section", class_="exam-timeline")
     if not section:
         return
@@ -127,33 +166,31 @@ def update_exam_timeline(soup, data):
                 em_container.append(marker)
             track_div.append(em_container)
 
-        # 画像
-        img = soup.new_tag("img", src=tl["img"], alt=f"{tl['caption']}タイムライン")
-        track_div.append(img)
+        # 区間データがあればベクター描画，無ければC++側のPNGを使う
+        alt = msgs["timeline_alt"].format(caption=tl["caption"])
+        if tl.get("track"):
+            track_div.append(build_timeline_svg(soup, tl["track"], alt=alt))
+        else:
+            img = soup.new_tag("img", src=tl["img"], alt=alt)
+            track_div.append(img)
 
         row_div.append(track_div)
         section.append(row_div)
 
 
-def update_exam_gallery(soup, data):
-    """
-    サムネイルギャラリー部分を JSON データから更新する
-    """
-    section = soup.find("section", class_="exam-gallery")
-    if not section:
-        return
+def _gallery_block(soup, block, images, continued, msgs):
+    block_div = soup.new_tag("div", **{"class": "exam-gallery__block"})
 
-    section.clear()
-
-    for block in data.get("gallery", []):
-        block_div = soup.new_tag("div", **{"class": "exam-gallery__block"})
-
-        # 左カラム（キャプション）
-        caption_div = soup.new_tag("div", **{"class": "exam-gallery__caption"})
-        strong = soup.new_tag("strong", lang="en")
-        strong.string = block["label"]
-        caption_div.append(strong)
+    # 左カラム（キャプション）
+    caption_div = soup.new_tag("div", **{"class": "exam-gallery__caption"})
+    strong = soup.new_tag("strong", lang="en")
+    strong.string = block["label"]
+    caption_div.append(strong)
 
+    if continued:
+        caption_div.append(soup.new_tag("br"))
+        caption_div.append(msgs["continued"])
+    else:
         # JSONのcaptionは list[ { organ, method } ]
         for cap in block.get("caption", []):
             if "organ" in cap:
@@ -162,100 +199,636 @@ def update_exam_gallery(soup, data):
             if "method" in cap:
                 caption_div.append(soup.new_tag("br"))
                 caption_div.append(cap["method"])
-        block_div.append(caption_div)
+    block_div.append(caption_div)
+
+    # 右カラム（サムネイル群）
+    thumbs_div = soup.new_tag("div", **{"class": "exam-gallery__thumbnails"})
+    for img in images:
+        thumb_div = soup.new_tag("div", **{"class": "exam-gallery__thumb"})
+
+        # サムネイルラベル
+        label_span = soup.new_tag("span", **{"class": "exam-gallery__thumb-label"}, lang="en")
+        label_span.append(block["label"])
+        small = soup.new_tag("small"); small.string = str(img["index"])
+        label_span.append(small)
+        time_span = soup.new_tag("span"); time_span.string = f" {img['time']}"
+        label_span.append(time_span)
+        thumb_div.append(label_span)
+
+        # 画像
+        img_tag = soup.new_tag("img", src=img["src"], alt="")
+        thumb_div.append(img_tag)
+
+        thumbs_div.append(thumb_div)
+
+    block_div.append(thumbs_div)
+    return block_div
+
+
+def update_exam_gallery(soup, data, msgs=None):
+    """
+    サムネイルギャラリー部分を JSON データから更新する．
+    テンプレートの寸法（gallery_layout 参照）から改ページ位置を決め，
+    1 枚目に入らない分はヘッダーを繰り返した続きのシートに置く
+    """
+    msgs = msgs or load_catalog()
+    section = soup.find("section", class_="exam-gallery")
+    if not section:
+        return
+
+    section.clear()
+    # 前回の更新で作った続きのシートを消す（同じ soup を更新し直す場合）
+    for sheet in soup.select(".sheet--continuation"):
+        sheet.decompose()
+
+    blocks = data.get("gallery", [])
+    pages = paginate(blocks, *gallery_geometry(section))
+
+    header = soup.find("header", class_="report-header")
+    divider = soup.find("hr", class_="divider--header")
+    last_sheet = section.find_parent(class_="sheet")
+    for page_no, page in enumerate(pages):
+        if page_no == 0:
+            target = section
+        elif not page:
+            continue
+        else:
+            sheet = soup.new_tag("main", **{"class": "sheet sheet--continuation"})
+            for tag in (header, divider):
+                if tag is not None:
+                    sheet.append(copy.copy(tag))
+            target = soup.new_tag("section", **{"class": "exam-gallery"})
+            sheet.append(target)
+            last_sheet.insert_after(sheet)
+            last_sheet = sheet
+        for bi, start, end in page:
+            block = blocks[bi]
+            target.append(_gallery_block(soup, block, block["images"][start:end], start > 0, msgs))
+
+
+# report.json の最上位の項目 → その項目から作る部分の更新処理．
+# 続きのシートはヘッダーを複製して持つので，header が変わったらギャラリーも作り直す
+SECTION_UPDATERS = {
+    "header": (update_report_meta, update_exam_gallery),
+    "checks": (update_exam_summary,),
+    "timeline": (update_exam_timeline,),
+    "gallery": (update_exam_gallery,),
+}
+_UPDATE_ORDER = (update_report_meta, update_exam_summary, update_exam_timeline, update_exam_gallery)
+
+
+def changed_sections(old, new):
+    """
+    2 つの report.json で中身が変わった項目（SECTION_UPDATERS のキー）
+    """
+    return [key for key in SECTION_UPDATERS if (old or {}).get(key) != new.get(key)]
 
-        # 右カラム（サムネイル群）
-        thumbs_div = soup.new_tag("div", **{"class": "exam-gallery__thumbnails"})
-        for img in block["images"]:
-            thumb_div = soup.new_tag("div", **{"class": "exam-gallery__thumb"})
 
-            # サムネイルラベル
-            label_span = soup.new_tag("span", **{"class": "exam-gallery__thumb-label"}, lang="en")
-            label_span.append(block["label"])
-            small = soup.new_tag("small"); small.string = str(img["index"])
-            label_span.append(small)
-            time_span = soup.new_tag("span"); time_span.string = f" {img['time']}"
-            label_span.append(time_span)
-            thumb_div.append(label_span)
+def update_sections(soup, data, sections=None, msgs=None):
+    """
+    sections（report.json の項目名）に関わる部分だけ soup を作り直す（None なら全部）
+    戻り値: 実行した更新処理の名前
+    """
+    msgs = msgs or load_catalog()
+    keys = SECTION_UPDATERS if sections is None else sections
+    wanted = {f for key in keys for f in SECTION_UPDATERS.get(key, ())}
+    done = []
+    for update in _UPDATE_ORDER:
+        if update in wanted:
+            update(soup, data, msgs)
+            done.append(update.__name__)
+    return done
+
+
+def _parse_template(path: Path):
+    mtime = path.stat().st_mtime_ns
+    cached = _PARSED_CACHE.get(path)
+    if cached is None or cached[0] != mtime:
+        soup = BeautifulSoup(path.read_text(encoding="utf-8"), "lxml")
+        cached = _PARSED_CACHE[path] = (mtime, soup)
+    return cached
+
+
+def load_template(template_html: str, locale=None):
+    """
+    テンプレートを解析・言語ごとに文字列を差し込んでキャッシュし，書き換え用のコピーを返す
+    （テンプレートやカタログの更新時刻が変わったら作り直す．解析は言語によらず 1 回）
+    """
+    path = Path(template_html).resolve()
+    locale = locale or DEFAULT_LOCALE
+    mtime, parsed = _parse_template(path)
+    stamp = (mtime, catalog_mtime(locale))
+    cached = _TEMPLATE_CACHE.get((path, locale))
+    hit = cached is not None and cached[0] == stamp
+    metrics.cache_event("template", hit)
+    if not hit:
+        cached = _TEMPLATE_CACHE[(path, locale)] = (stamp, localize(copy.copy(parsed), locale))
+    return copy.copy(cached[1])
+
+
+def build_soup(template_html: str, data, locale=None):
+    """
+    テンプレートに JSON データを埋め込んだ soup を返す
+    """
+    soup = load_template(template_html, locale)
+    update_sections(soup, data, msgs=load_catalog(locale))
+    return soup
 
-            # 画像
-            img_tag = soup.new_tag("img", src=img["src"], alt="")
-            thumb_div.append(img_tag)
 
-            thumbs_div.append(thumb_div)
+def load_report_data(json_path: str, optimize_images: bool = False, base_dir=None,
+                     confine=False):
+    data = json.loads(Path(json_path).read_text(encoding="utf-8"))
+    # 形や画像の誤りはテンプレート・描画の前にまとめて出す（report_schema.ReportValidationError）
+    validate(data, base_dir=base_dir, source=json_path, confine=confine)
 
-        block_div.append(thumbs_div)
-        section.append(block_div)
+    # タイムラインPNGをパレット化・再圧縮したものに差し替え
+    if optimize_images:
+        from image_optimize import optimize_timeline_images
+        optimize_timeline_images(data, base_dir or Path.cwd())
+    return data
 
 
-def build_static_html_from_json(template_html: str, json_path: str) -> str:
+def build_static_html_from_json(template_html: str, json_path: str,
+                                optimize_images: bool = False, base_dir=None,
+                                debug_html="debug_output.html", locale=None) -> str:
 
     print("TEMPLATE_ABS:", Path(template_html).resolve())
     print("JSON_ABS    :", Path(json_path).resolve())
 
-    html_text = Path(template_html).read_text(encoding="utf-8")
-    data = json.loads(Path(json_path).read_text(encoding="utf-8"))
-    soup = BeautifulSoup(html_text, "lxml")
+    data = load_report_data(json_path, optimize_images, base_dir)
+    return write_static_html(template_html, data, debug_html, locale)
+
 
-    # 更新処理を呼び出す
-    update_report_meta(soup, data)
-    update_exam_summary(soup, data)
-    update_exam_timeline(soup, data)
-    update_exam_gallery(soup, data)
+def write_static_html(template_html: str, data, debug_html=None, locale=None) -> str:
+    return _write_soup(build_soup(template_html, data, locale), debug_html)
 
+
+def _write_soup(soup, debug_html=None) -> str:
     # --- 一時HTMLを書き出し ---
     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".html")
+    tmp.close()
     Path(tmp.name).write_text(str(soup), encoding="utf-8")
 
-    # デバッグ用にも保存
-    debug_html = Path("debug_output.html")
-    debug_html.write_text(soup.prettify(), encoding="utf-8")
-    print(f"DEBUG: also copied to {debug_html.resolve()}")
+    # デバッグ用にも保存（並列実行時は None で無効化）
+    if debug_html:
+        debug_html = Path(debug_html)
+        debug_html.write_text(soup.prettify(), encoding="utf-8")
+        print(f"DEBUG: also copied to {debug_html.resolve()}")
 
     return tmp.name
 
-def html_to_pdf(html_path: str, pdf_path: str) -> str:
+def get_asset_fetcher(store_dir, root=None):
+    """
+    アセットストア経由で画像を読む url_fetcher（ストア・root ごとに 1 つ）
+    root を指定するとその中のファイルしか読まない（AssetFetcher の root）
+    """
+    from asset_fetcher import AssetFetcher
+    from asset_store import AssetStore
+    key = (str(Path(store_dir).resolve()) if store_dir else None,
+           str(Path(root).resolve()) if root else None)
+    if key not in _ASSET_FETCHERS:
+        _ASSET_FETCHERS[key] = AssetFetcher(store=AssetStore(store_dir) if store_dir else None,
+                                            root=root)
+    return _ASSET_FETCHERS[key]
+
+
+def get_font_config():
+    global _FONT_CONFIG
+    if _FONT_CONFIG is None:
+        _FONT_CONFIG = FontConfiguration()
+    return _FONT_CONFIG
+
+
+def reset_fonts():
+    """
+    フォント設定を捨てる（fonts/ のファイルを差し替えたとき，次の描画で読み直す）
+    """
+    global _FONT_CONFIG
+    _FONT_CONFIG = None
+
+def html_to_pdf(html_path: str, pdf_path: str, url_fetcher=None, cache=None, stats=None,
+                base_dir=None, profile=None, finish=True) -> str:
+    """
+    静的HTML → PDF．stats に dict を渡すとレイアウト・書き出し時間とページ数を入れて返す
+    画像・フォントの相対パスは base_dir（省略時は PDF の出力先ディレクトリ）から解決する
+    profile は出力プロファイル（pdf_profiles: print / archive / preview，None で既定）
+    finish=False なら書き出しのオプションだけ使い，後処理（線形化）はしない（結合してから行う場合）
+    """
     html_abs = os.path.abspath(html_path)
     pdf_abs  = os.path.abspath(pdf_path)
     if not os.path.exists(html_abs):
         raise FileNotFoundError(html_abs)
-    if os.path.exists(pdf_abs):
-        try: os.remove(pdf_abs)
-        except PermissionError: raise RuntimeError(f"PDF使用中: {pdf_abs}")
-    
-    base = Path(pdf_abs).parent.resolve()   # ← 元の grok.html があるディレクトリ
+
+    base = Path(base_dir or Path(pdf_abs).parent).resolve()   # ← 元の grok.html があるディレクトリ
     print(f"base: {base}")
-    HTML(filename=html_path, base_url=base).write_pdf(pdf_path)
-    for _ in range(10):
-        if os.path.exists(pdf_abs) and os.path.getsize(pdf_abs) > 0:
-            return pdf_abs
-        time.sleep(0.1)
-    raise RuntimeError("PDF生成に失敗（サイズ0バイト）")
+    options = {} if cache is None else {"cache": cache}
+    options.update(pdf_profiles.write_options(profile))
+    t0 = time.perf_counter()
+    document = HTML(filename=html_path, base_url=base, url_fetcher=url_fetcher or default_url_fetcher) \
+        .render(font_config=get_font_config(), **options)
+    t1 = time.perf_counter()
+    # 一時ファイルに書き切ってから置き換える（途中で落ちても書きかけの PDF を残さない）
+    part = f"{pdf_abs}.{os.getpid()}.part"
+    try:
+        with open(part, "wb") as f:
+            document.write_pdf(f, **options)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.getsize(part) == 0:
+            raise RuntimeError("PDF生成に失敗（サイズ0バイト）")
+        if finish:
+            pdf_profiles.finish(part, profile)
+        try:
+            os.replace(part, pdf_abs)
+        except PermissionError:
+            raise RuntimeError(f"PDF使用中: {pdf_abs}")
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+    if stats is not None:
+        stats.update(layout=t1 - t0, write_pdf=time.perf_counter() - t1, pages=len(document.pages))
+    return pdf_abs
 
 def print_with_sumatra(pdf_abs: str, printer: str, sumatra_exe: str):
     exe = sumatra_exe or DEFAULT_SUMATRA
     if not os.path.exists(exe):
         raise FileNotFoundError(f"SumatraPDF.exe が見つかりません: {exe}")
+    t0 = time.perf_counter()
     subprocess.run([exe, "-print-to", printer, "-exit-on-print", pdf_abs], check=True)
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="print")
+
+
+def _render_data(template_html: str, data, pdf_path: str, locale=None,
+                 debug_html=None, url_fetcher=None, cache=None, base_dir=None, chunks=0,
+                 profile=None, engine=None) -> dict:
+    if engine == "reportlab":
+        return _render_canvas(template_html, data, pdf_path, locale, base_dir, profile)
+    t0 = time.perf_counter()
+    soup = build_soup(template_html, data, locale)
+    if chunks > 1 and _can_fork() and len(soup.select("main.sheet")) > 1:
+        return _render_chunked(soup, data, pdf_path, chunks, debug_html, url_fetcher, cache,
+                               base_dir, profile, time.perf_counter() - t0)
+    static_html = _write_soup(soup, debug_html)
+    t1 = time.perf_counter()
+    stats = {}
+    try:
+        pdf_abs = html_to_pdf(static_html, pdf_path, url_fetcher=url_fetcher, cache=cache,
+                              stats=stats, base_dir=base_dir, profile=profile)
+    finally:
+        os.remove(static_html)
+    timings = {"build_dom": t1 - t0, "layout": stats["layout"], "write_pdf": stats["write_pdf"]}
+    return {"pdf": pdf_abs, "pages": stats["pages"], "timings": timings}
+
+
+def _render_canvas(template_html, data, pdf_path, locale, base_dir, profile) -> dict:
+    """
+    reportlab エンジン．改ページの寸法だけテンプレートの .exam-gallery から読む
+    （画像はアセットストア・url_fetcher を通さずファイルから直接読む）
+    """
+    from report_canvas import render_canvas
+    section = _parse_template(Path(template_html).resolve())[1] \
+        .find("section", class_="exam-gallery")
+    options = pdf_profiles.write_options(profile)
+    stats = {}
+    pdf_abs = render_canvas(data, pdf_path, locale, base_dir,
+                            geometry=dict(section.attrs) if section is not None else None,
+                            compress=not options.get("uncompressed_pdf"), stats=stats)
+    t1 = time.perf_counter()
+    pdf_profiles.finish(pdf_abs, profile)
+    timings = {"layout": stats["layout"], "write_pdf": stats["write_pdf"] + time.perf_counter() - t1}
+    return {"pdf": pdf_abs, "pages": stats["pages"], "timings": timings, "engine": "reportlab"}
+
+
+def _can_fork():
+    # ワーカープール（daemon プロセス）の中からは子プロセスを作れない
+    return "fork" in multiprocessing.get_all_start_methods() \
+        and not multiprocessing.current_process().daemon
+
+
+def _render_chunk(html: str, pdf_path: str, base_dir, profile) -> dict:
+    state = _CHUNK_STATE
+    tmp = Path(pdf_path).with_suffix(".html")
+    tmp.write_text(html, encoding="utf-8")
+    stats = {}
+    try:
+        html_to_pdf(str(tmp), pdf_path, url_fetcher=state["fetcher"], cache=state["image_cache"],
+                    stats=stats, base_dir=base_dir, profile=profile, finish=False)
+    finally:
+        tmp.unlink()
+    return stats
+
+
+def _render_chunked(soup, data, pdf_path, chunks, debug_html, url_fetcher, cache, base_dir,
+                    profile, build_dom) -> dict:
+    """
+    シート（1 枚目・ギャラリーの続き）を chunks 組に分けて別プロセスでレイアウトし，
+    pypdf で結合する．画像と同じフォント辞書は pdf_dedup で共通化するが，フォントの
+    サブセットは組ごとに中身が違うので共通化できず，1 組の描画より PDF が大きくなる
+    （速さとサイズの兼ね合いは bench_chunks.py で確かめる）
+    """
+    global _CHUNK_STATE
+    from asset_fetcher import AssetFetcher, report_asset_urls
+    from pdf_dedup import merge_pdfs
+
+    t0 = time.perf_counter()
+    if debug_html:
+        os.remove(_write_soup(soup, debug_html))
+    n_sheets = len(soup.select("main.sheet"))
+    size = -(-n_sheets // chunks)
+    groups = [range(i, min(i + size, n_sheets)) for i in range(0, n_sheets, size)]
+    htmls = []
+    for group in groups:
+        part = copy.copy(soup)
+        for i, sheet in enumerate(part.select("main.sheet")):
+            if i not in group:
+                sheet.decompose()
+        htmls.append(str(part))
+
+    # 画像は fork 前に読んで子プロセスに引き継ぐ
+    base = Path(base_dir or Path(pdf_path).resolve().parent)
+    fetcher = url_fetcher or AssetFetcher()
+    fetcher.prefetch(report_asset_urls(data, base))
+    _CHUNK_STATE = {"fetcher": fetcher, "image_cache": cache if cache is not None else {}}
+    build_dom += time.perf_counter() - t0
+
+    with tempfile.TemporaryDirectory(prefix="report_chunks_") as tmp_dir:
+        parts = [str(Path(tmp_dir, f"part{i:03d}.pdf")) for i in range(len(groups))]
+        t1 = time.perf_counter()
+        with multiprocessing.get_context("fork").Pool(len(groups)) as pool:
+            stats = pool.starmap(_render_chunk,
+                                 [(h, p, base, profile) for h, p in zip(htmls, parts)])
+        t2 = time.perf_counter()
+        merge_pdfs(parts, pdf_path)
+    # 線形化は結合した PDF に 1 回だけ（各組は書き出しのオプションだけ使う）
+    pdf_profiles.finish(pdf_path, profile)
+    print(f"CHUNKS: {n_sheets} sheets → {len(groups)} processes "
+          f"(layout max {max(s['layout'] for s in stats):.2f}s / wall {t2 - t1:.2f}s)")
+    timings = {"build_dom": build_dom, "layout": t2 - t1, "write_pdf": time.perf_counter() - t2}
+    return {"pdf": str(Path(pdf_path).resolve()), "pages": sum(s["pages"] for s in stats),
+            "timings": timings, "chunks": len(groups)}
+
+
+def _index_result(index_db, data, digest, template_html, locale, result):
+    if not index_db:
+        return
+    try:
+        report_index.record(index_db, data, digest, template_html, locale or DEFAULT_LOCALE,
+                            result["pdf"], result["pages"], result["timings"])
+    except Exception as e:
+        # 索引への記録失敗でレポート出力は止めない
+        print(f"WARN: 索引への記録に失敗 ({e})")
+
+
+def render_report(template_html: str, json_path: str, pdf_path: str,
+                  optimize_images: bool = False, debug_html=None, locale=None,
+                  index_db=None, asset_store=None, base_dir=None,
+                  profile_slow=None, profile_dir=None, chunks=0, profile=None,
+                  engine=None, confine=False) -> dict:
+    """
+    テンプレート + report.json → PDF を一括で行う
+    戻り値: {"pdf": 絶対パス, "pages": ページ数, "timings": 工程ごとの秒数,
+            "cache": このジョブでのキャッシュ参照数（metrics.cache_delta）}
+    index_db を指定すると結果を索引（report_index）に記録する
+    asset_store を指定すると画像をアセットストアに取り込み，ストア経由で読む
+    base_dir は画像パスの基準ディレクトリ（省略時は PDF の出力先）
+    profile_slow [秒] を指定すると，それより遅かった描画のスタックサンプリング結果・
+    report.json・時間を profile_dir に保存する（結果の "slow_profile" に保存先が入る）
+    chunks > 1 でシートが複数ある場合は，シートを chunks 組に分けて並列にレイアウトし結合する
+    profile は出力プロファイル（pdf_profiles: print / archive / preview）
+    engine は描画エンジン（ENGINES．省略時は weasyprint）
+    confine=True なら画像は base_dir の中のファイルしか読まない（render_server 用．
+    report.json の URL・外を指すパスは ReportValidationError）
+    """
+    pdf_profiles.check_profile(profile)
+    _check_engine(engine)
+    print("TEMPLATE_ABS:", Path(template_html).resolve())
+    print("JSON_ABS    :", Path(json_path).resolve())
+
+    args = (template_html, json_path, pdf_path, optimize_images, debug_html, locale,
+            index_db, asset_store, base_dir, chunks, profile, engine, confine)
+    if not profile_slow:
+        return _render_report(*args)
+
+    from slow_profile import SlowRenderCapture
+    info = {"template": str(Path(template_html).resolve()), "lang": locale,
+            "pdf": str(Path(pdf_path).resolve()), "profile": profile, "engine": engine}
+    with SlowRenderCapture(profile_slow, json_path, profile_dir, info) as cap:
+        result = _render_report(*args)
+        cap.timings = result["timings"]
+    if cap.saved:
+        result["slow_profile"] = str(cap.saved)
+    return result
+
+
+def _render_report(template_html, json_path, pdf_path, optimize_images, debug_html, locale,
+                   index_db, asset_store, base_dir, chunks, profile, engine, confine) -> dict:
+    t0 = time.perf_counter()
+    cache_before = metrics.cache_snapshot()
+    base_dir = Path(base_dir or Path(pdf_path).resolve().parent)
+    data = load_report_data(json_path, optimize_images, base_dir=base_dir, confine=confine)
+    load_json = time.perf_counter() - t0
+
+    fetcher = None
+    if asset_store or confine:
+        fetcher = get_asset_fetcher(asset_store, root=base_dir if confine else None)
+    if asset_store:
+        fetcher.store.ingest_report(json_path, base_dir=base_dir, data=data, copy=False)
+
+    result = _render_data(template_html, data, pdf_path, locale, debug_html=debug_html,
+                          url_fetcher=fetcher, base_dir=base_dir, chunks=chunks, profile=profile,
+                          engine=engine)
+    result["timings"] = {"load_json": load_json, **result["timings"]}
+    result["cache"] = metrics.cache_delta(cache_before)
+    _index_result(index_db, data, report_index.file_digest(json_path), template_html, locale, result)
+    return result
+
+
+def _check_engine(engine):
+    if engine is not None and engine not in ENGINES:
+        raise ValueError(f"不明な描画エンジン: {engine}（{', '.join(ENGINES)}）")
+    return engine
+
+
+def _render_target(template_html: str, pdf_path: str, locale=None) -> str:
+    state = _SHARED_TARGET_STATE
+    result = _render_data(template_html, state["data"], pdf_path, locale,
+                          url_fetcher=state["fetcher"], cache=state["image_cache"],
+                          profile=state["profile"], engine=state["engine"])
+    result["timings"] = {"load_json": state["load_json"], **result["timings"]}
+    _index_result(state["index_db"], state["data"], state["digest"], template_html, locale, result)
+    return result["pdf"]
+
+
+def render_targets(json_path: str, targets, optimize_images: bool = False,
+                   parallel: bool = True, index_db=None, asset_store=None, profile=None,
+                   engine=None) -> list:
+    """
+    1 つの report.json から複数のテンプレート・言語（日本語・英語など）を描画する．
+    targets: [(template_html, pdf_path, locale), ...]
+
+    JSON の読込・画像の先読み・フォント設定は 1 回だけ行い，全テンプレートで共有する．
+    fork できる環境では先読み後にテンプレートごとに fork して並列に描画する．
+    戻り値は targets と同じ順の PDF 絶対パス
+    """
+    global _SHARED_TARGET_STATE
+    from asset_fetcher import AssetFetcher, report_asset_urls
+
+    print("JSON_ABS    :", Path(json_path).resolve())
+    bases = {Path(t[1]).resolve().parent for t in targets}
+    t0 = time.perf_counter()
+    data = load_report_data(json_path, optimize_images, base_dir=next(iter(bases)))
+    load_json = time.perf_counter() - t0
+
+    fetcher = get_asset_fetcher(asset_store) if asset_store else AssetFetcher()
+    for base in bases:
+        if asset_store:
+            fetcher.store.ingest_report(json_path, base_dir=base, data=data, copy=False)
+        fetcher.prefetch(report_asset_urls(data, base))
+    _SHARED_TARGET_STATE = {
+        "data": data, "fetcher": fetcher, "image_cache": {}, "load_json": load_json,
+        "digest": report_index.file_digest(json_path), "index_db": index_db,
+        "profile": pdf_profiles.check_profile(profile), "engine": _check_engine(engine),
+    }
+
+    if parallel and _can_fork() and len(targets) > 1:
+        # テンプレート解析とフォント読込も fork 前に済ませて子へ引き継ぐ
+        warm_up(sorted({t[0] for t in targets}), sorted({t[2] for t in targets}))
+        with multiprocessing.get_context("fork").Pool(len(targets)) as pool:
+            return pool.starmap(_render_target, targets)
+    return [_render_target(*t) for t in targets]
+
+
+def warm_up(templates=(), locales=None):
+    """
+    フォント読込・CSS解析・Pango初期化を済ませておく（結果は捨てる）
+    """
+    for template_html in templates:
+        for locale in locales or available_locales():
+            soup = build_soup(template_html, EMPTY_REPORT, locale)
+            base = Path(template_html).resolve().parent
+            HTML(string=str(soup), base_url=str(base)).write_pdf(font_config=get_font_config())
 
 def main():
     p = argparse.ArgumentParser(description="HTML→PDF→印刷（SumatraPDF利用）")
-    p.add_argument("html", help="入力HTMLファイル")
-    p.add_argument("pdf", help="出力PDFファイル")
+    p.add_argument("html", nargs="?", help="入力HTMLファイル（バッチ・常駐時は既定テンプレート）")
+    p.add_argument("pdf", nargs="?", help="出力PDFファイル")
     p.add_argument("--mode", choices=["device", "pdf"], default="device",
                    help='device=実機プリンタ / pdf=Microsoft Print to PDF')
     p.add_argument("--printer", default="", help="実機プリンタ名（mode=device時）")
     p.add_argument("--sumatra", default="", help="SumatraPDF.exe のパス（未指定で ./bin/SumatraPDF.exe）")
+    p.add_argument("--optimize-images", action="store_true",
+                   help="タイムラインPNGをパレット化・再圧縮してから埋め込む")
+    p.add_argument("--lang", default=DEFAULT_LOCALE, choices=available_locales(),
+                   help="レポートの言語（locales/<lang>.json）")
+    p.add_argument("--also", nargs=2, action="append", default=[], metavar=("LANG", "PDF"),
+                   help="同じ report.json から別の言語でも描画する（複数指定可）")
+    p.add_argument("--index", default=str(report_index.DEFAULT_DB),
+                   help="出力を記録する索引DB（SQLite）")
+    p.add_argument("--no-index", action="store_true", help="索引に記録しない")
+    p.add_argument("--asset-store", default=None, metavar="DIR",
+                   help="画像を内容ハッシュのアセットストアに取り込み，ストア経由で読む")
+    p.add_argument("--profile", default=None, choices=sorted(pdf_profiles.PROFILES),
+                   help="出力プロファイル（print=速さ優先 / archive=サイズ優先 / preview=線形化）．"
+                        "バッチ・常駐時は profile を書いていないジョブに使う")
+    p.add_argument("--engine", default=None, choices=ENGINES,
+                   help="描画エンジン（既定 weasyprint．reportlab は report_canvas.py で直接描く）．"
+                        "バッチ・常駐時は engine を書いていないジョブに使う")
+    p.add_argument("--chunks", type=int, default=0, metavar="N",
+                   help="複数シートのレポートを N プロセスに分けてレイアウトし結合する（0=しない）．"
+                        "フォントが組ごとに埋め込まれるため PDF は 1 組より大きくなる．"
+                        "使う前に bench_chunks.py で速さとサイズを確かめること")
+
+    # バッチ・常駐モード（事前ロード済みワーカープールで描画）
+    p.add_argument("--batch", metavar="JOBS", help="ジョブ一覧（JSON Lines）をまとめて描画")
+    p.add_argument("--daemon", metavar="SPOOL", help="SPOOL に置かれたジョブファイルを監視して描画")
+    p.add_argument("--journal", default=None,
+                   help="バッチのジャーナル（既定 JOBS.journal）．完了済みのジョブは再実行時に飛ばす")
+    p.add_argument("--fresh", action="store_true", help="ジャーナルを無視して全件描画し直す")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="ワーカー数")
+    p.add_argument("--max-jobs", type=int, default=50, help="ワーカーを入れ替えるまでのジョブ数（0=無制限）")
+    p.add_argument("--max-rss-mb", type=int, default=0, help="ワーカーを入れ替える RSS [MB]（0=無制限）")
+    p.add_argument("--kill-rss-mb", type=int, default=0,
+                   help="ジョブ実行中にこの RSS [MB] を超えたワーカーを止めてジョブを再投入（0=無効）")
+    p.add_argument("--memory-log", default=None, help="ジョブごとのメモリ記録（JSON Lines）の出力先")
+    p.add_argument("--profile-slow", type=float, default=0, metavar="SEC",
+                   help="描画が SEC 秒を超えたらスタックのプロファイルと report.json を保存する")
+    p.add_argument("--profile-dir", default=None, help="遅い描画のプロファイルの保存先（既定 slow_profiles/）")
+    p.add_argument("--metrics-port", type=int, default=0,
+                   help="http://127.0.0.1:PORT/metrics でメトリクスを公開する（0=しない）")
+    p.add_argument("--metrics-file", default=None,
+                   help="メトリクスを Prometheus テキスト形式で定期的に書き出すファイル")
+    p.add_argument("--priority", default=None, choices=["interactive", "normal", "bulk"],
+                   help="priority を書いていないジョブの優先度（既定 normal）")
+    p.add_argument("--reserve-interactive", type=int, default=0, metavar="N",
+                   help="interactive 専用にするワーカー数")
+    p.add_argument("--aging", type=float, default=60.0,
+                   help="normal / bulk の優先度を 1 段上げるまでの待ち時間 [秒]（0=繰り上げなし）")
     args = p.parse_args()
+    index_db = None if args.no_index else args.index
+
+    if args.batch or args.daemon:
+        import render_pool
+        templates = [args.html] if args.html else []
+        pool = render_pool.RenderPool(workers=args.workers, max_jobs=args.max_jobs,
+                                      max_rss_mb=args.max_rss_mb, templates=templates,
+                                      kill_rss_mb=args.kill_rss_mb, memory_log=args.memory_log,
+                                      reserved_workers=args.reserve_interactive, aging=args.aging)
+        if args.metrics_port:
+            metrics.start_http_server(args.metrics_port)
+        if args.metrics_file:
+            metrics.start_file_dumper(args.metrics_file)
+        with pool:
+            if args.batch:
+                jobs = render_pool.load_jobs(args.batch, default_template=args.html,
+                                             index_db=index_db, asset_store=args.asset_store,
+                                             default_priority=args.priority,
+                                             profile_slow=args.profile_slow,
+                                             profile_dir=args.profile_dir,
+                                             default_profile=args.profile,
+                                             default_engine=args.engine)
+                from batch_journal import BatchJournal
+                journal_path = args.journal or args.batch + ".journal"
+                if args.fresh and os.path.exists(journal_path):
+                    os.remove(journal_path)
+                with BatchJournal(journal_path) as journal:
+                    failed = render_pool.run_batch(pool, jobs, journal=journal)
+            else:
+                failed = 0
+                render_pool.run_daemon(pool, args.daemon, default_template=args.html,
+                                       index_db=index_db, asset_store=args.asset_store,
+                                       default_priority=args.priority,
+                                       profile_slow=args.profile_slow,
+                                       profile_dir=args.profile_dir,
+                                       default_profile=args.profile,
+                                       default_engine=args.engine)
+        if args.metrics_file:
+            metrics.write_textfile(args.metrics_file)
+        sys.exit(1 if failed else 0)
+
+    if not args.html or not args.pdf:
+        p.error("html と pdf を指定してください（--batch / --daemon 以外）")
 
     template_html = args.html
     json_path = os.path.join(os.path.dirname(args.html), "report.json")
 
-    # HTML + JSON → 静的HTML
-    static_html = build_static_html_from_json(template_html, json_path)
+    # 複数テンプレート（日本語・英語など）を 1 回のデータ読込で描画
+    if args.also:
+        targets = [(template_html, args.pdf, args.lang)] + \
+            [(template_html, pdf, lang) for lang, pdf in args.also]
+        for pdf_abs in render_targets(json_path, targets, optimize_images=args.optimize_images,
+                                      index_db=index_db, asset_store=args.asset_store,
+                                      profile=args.profile, engine=args.engine):
+            print(f"PDF: {pdf_abs}")
+        return
 
-    # 静的HTML → PDF
-    pdf_abs = html_to_pdf(static_html, args.pdf)
+    # HTML + JSON → 静的HTML → PDF
+    result = render_report(template_html, json_path, args.pdf,
+                           optimize_images=args.optimize_images,
+                           debug_html="debug_output.html", locale=args.lang,
+                           index_db=index_db, asset_store=args.asset_store,
+                           profile_slow=args.profile_slow, profile_dir=args.profile_dir,
+                           chunks=args.chunks, profile=args.profile, engine=args.engine)
+    pdf_abs = result["pdf"]
 
 
     # if args.mode == "pdf":
@@ -0,0 +1,692 @@
+"""
+レポート描画用のワーカープール（バッチ・常駐モード）
+
+WeasyPrint / cffi / Pango の import とフォント読込は数秒・数百MBかかるため，
+親プロセスで一度だけ
+  1. モジュールの import
+  2. テンプレートの解析
+  3. フォント読込を兼ねたウォームアップ描画
+を済ませてからワーカーを fork する．ワーカーは親のメモリを copy-on-write で
+共有するので，起動はミリ秒単位で済む．
+
+fork が使えない環境（Windows）では spawn で起動し，各ワーカーが自分で
+同じ前処理を行う．
+
+ワーカーは max_jobs 件処理するか，ジョブ後の RSS が max_rss_mb を超えると
+自ら終了し，プールが新しいワーカーを補充する．ジョブ実行中に RSS が
+kill_rss_mb を超えた場合は親がワーカーを止め，そのジョブを再投入する
+（キューに残ったジョブは親が持っているので失われない）．
+
+ジョブごとのメモリ使用量（前後の RSS，画像枚数）は memory_history() で
+参照でき，memory_log を指定すると JSON Lines で追記される．
+
+ジョブには優先度 job["priority"]（interactive / normal / bulk，既定 normal）を付けられる．
+interactive は常に次に空いたワーカーに入り，reserved_workers 台のワーカーは
+interactive 専用にできる．normal と bulk は待ち時間で優先度を上げる（aging 秒
+待つごとに 1 段）ので，大量の bulk があっても止まったままにはならない．
+クラスごとの投入数・待ち時間は scheduler_stats() で参照できる．
+"""
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from pathlib import Path
+
+import metrics
+
+MB = 1024 * 1024
+
+# ワーカー異常終了時にジョブを再投入する回数
+MAX_ATTEMPTS = 2
+
+# 優先度（先頭ほど高い）
+PRIORITIES = ("interactive", "normal", "bulk")
+DEFAULT_PRIORITY = "normal"
+
+# 描画エンジン（weasyprint: report.html を HTML/CSS でレイアウト / reportlab: report_canvas で直接描く）
+ENGINES = ("weasyprint", "reportlab")
+
+# クラスごとに保持する直近の待ち時間の件数
+_WAIT_SAMPLES = 1000
+
+
+def process_rss(pid=None):
+    """
+    プロセスの現在の RSS（バイト）．取得できなければ None
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            with open(f"/proc/{pid or 'self'}/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            return None
+
+    if sys.platform.startswith("win") and pid is None:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD),
+                        ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t),
+                        ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t),
+                        ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+
+    if pid is None:
+        # macOS など：現在値が取れないのでピーク値で代用
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return None
+
+
+def preload(templates=()):
+    """
+    重いモジュールの import・テンプレート解析・ウォームアップ描画
+    """
+    t0 = time.perf_counter()
+    import print_report
+    for template_html in templates:
+        for locale in print_report.available_locales():
+            print_report.load_template(template_html, locale)
+    print_report.warm_up(templates)
+    print(f"POOL: preload {time.perf_counter() - t0:.2f}s ({len(templates)} templates)")
+
+
+def count_images(json_path):
+    """
+    report.json が参照する画像の枚数（メモリ使用量の目安）
+    """
+    try:
+        data = json.loads(Path(json_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    n = sum(1 for tl in data.get("timeline", []) if tl.get("img"))
+    n += sum(len(block.get("images", [])) for block in data.get("gallery", []))
+    return n
+
+
+def run_job(job):
+    """
+    1 件のジョブを描画する（ワーカー内で実行）
+    job: {"template": ..., "json": ..., "pdf": ..., "lang": ..., "optimize_images": bool,
+          "profile": 出力プロファイル, "engine": 描画エンジン,
+          "confine": 画像を base_dir の中に限るか（render_server は True）}
+    """
+    import print_report
+    result = print_report.render_report(job["template"], job["json"], job["pdf"],
+                                        optimize_images=job.get("optimize_images", False),
+                                        locale=job.get("lang"), index_db=job.get("index_db"),
+                                        asset_store=job.get("asset_store"),
+                                        base_dir=job.get("base_dir"),
+                                        profile_slow=job.get("profile_slow"),
+                                        profile_dir=job.get("profile_dir"),
+                                        chunks=job.get("chunks") or 0,
+                                        profile=job.get("profile"), engine=job.get("engine"),
+                                        confine=job.get("confine", False))
+    result["images"] = count_images(job["json"])
+    return result
+
+
+def _worker_main(conn, max_jobs, max_rss_mb, templates, need_preload):
+    if need_preload:
+        preload(templates)
+
+    done = 0
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        job_id, job = msg
+
+        rss_before = process_rss()
+        started = time.time()
+        try:
+            result, status = run_job(job), "ok"
+        except Exception:
+            result, status = traceback.format_exc(), "error"
+        finished = time.time()
+        done += 1
+
+        rss = process_rss()
+        retire = bool(max_jobs and done >= max_jobs) or \
+            bool(max_rss_mb and rss and rss > max_rss_mb * MB)
+        conn.send({"job_id": job_id, "status": status, "result": result,
+                   "started": started, "finished": finished,
+                   "rss_before": rss_before, "rss": rss, "retire": retire})
+        if retire:
+            break
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, proc, conn, reserved=False):
+        self.proc = proc
+        self.conn = conn
+        self.reserved = reserved
+        self.job_id = None
+        self.retiring = False
+        self.killed = False
+        self.jobs_done = 0
+
+
+class RenderPool:
+    """
+    事前ロード済みの親から fork したワーカーでレポートを描画するプール
+
+        pool = RenderPool(workers=4, templates=["report.html"], reserved_workers=1)
+        pool.start()
+        fut = pool.submit({"template": ..., "json": ..., "pdf": ..., "priority": "interactive"})
+        fut.result()
+        pool.close()
+    """
+
+    def __init__(self, workers=2, max_jobs=50, max_rss_mb=0, templates=(), start_method=None,
+                 kill_rss_mb=0, memory_log=None, history_size=10000, poll_interval=0.5,
+                 reserved_workers=0, aging=60.0):
+        self.n_workers = max(1, workers)
+        # 少なくとも 1 台は全クラスを受け付ける
+        self.reserved_workers = max(0, min(reserved_workers, self.n_workers - 1))
+        self.aging = aging
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.kill_rss_mb = kill_rss_mb
+        self.memory_log = Path(memory_log) if memory_log else None
+        self.poll_interval = poll_interval
+        self.templates = [str(Path(t).resolve()) for t in templates]
+        if start_method is None:
+            start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        self.ctx = multiprocessing.get_context(start_method)
+
+        self._lock = threading.Lock()
+        self._pending = {cls: deque() for cls in PRIORITIES}
+        self._futures = {}
+        self._queued_at = {}
+        self._jobs = {}
+        self._attempts = {}
+        self._sched = {cls: {"submitted": 0, "dispatched": 0, "aged": 0, "wait_sum": 0.0,
+                             "wait_max": 0.0, "waits": deque(maxlen=_WAIT_SAMPLES)}
+                       for cls in PRIORITIES}
+        self._history = deque(maxlen=history_size)
+        self._ids = itertools.count(1)
+        self._workers = []
+        self._wake_r, self._wake_w = multiprocessing.Pipe(duplex=False)
+        self._closing = False
+        self._thread = None
+
+    # ---------- 公開 API ----------
+    def start(self):
+        # fork 前に親で前処理を済ませる（spawn の場合は各ワーカーで行う）
+        if self.ctx.get_start_method() == "fork":
+            preload(self.templates)
+        for i in range(self.n_workers):
+            self._workers.append(self._spawn(reserved=i < self.reserved_workers))
+        metrics.QUEUE_DEPTH.set_function(
+            lambda: {(cls,): self.pending_count(cls) for cls in PRIORITIES})
+        metrics.BUSY_WORKERS.set_function(
+            lambda: sum(w.job_id is not None for w in list(self._workers)))
+        self._thread = threading.Thread(target=self._loop, name="render-pool", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, job) -> concurrent.futures.Future:
+        priority = job.get("priority") or DEFAULT_PRIORITY
+        if priority not in PRIORITIES:
+            raise ValueError(f"未対応の優先度です: {priority}（{', '.join(PRIORITIES)}）")
+        fut = concurrent.futures.Future()
+        with self._lock:
+            if self._closing:
+                raise RuntimeError("プールは終了処理中です")
+            job_id = next(self._ids)
+            self._futures[job_id] = fut
+            self._queued_at[job_id] = time.time()
+            self._jobs[job_id] = job
+            self._pending[priority].append((job_id, job))
+            self._sched[priority]["submitted"] += 1
+        self._wake()
+        return fut
+
+    def pending_count(self, priority=None):
+        """
+        キュー待ちのジョブ数（実行中は含まない．priority 指定でそのクラスのみ）
+        """
+        with self._lock:
+            if priority is not None:
+                return len(self._pending[priority])
+            return sum(len(q) for q in self._pending.values())
+
+    def scheduler_stats(self):
+        """
+        優先度クラスごとのスケジューリング統計
+        {cls: {"queued", "submitted", "dispatched", "aged", "wait_mean", "wait_p95", "wait_max"}}
+        aged は待ち時間による繰り上げで上位クラスより先に割り当てた件数
+        """
+        with self._lock:
+            stats = {}
+            for cls, st in self._sched.items():
+                waits = sorted(st["waits"])
+                stats[cls] = {
+                    "queued": len(self._pending[cls]),
+                    "submitted": st["submitted"],
+                    "dispatched": st["dispatched"],
+                    "aged": st["aged"],
+                    "wait_mean": st["wait_sum"] / st["dispatched"] if st["dispatched"] else 0.0,
+                    "wait_p95": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                    "wait_max": st["wait_max"],
+                }
+            return stats
+
+    def worker_pids(self):
+        """
+        現在のワーカーの PID 一覧
+        """
+        return [w.proc.pid for w in list(self._workers)]
+
+    def memory_history(self):
+        """
+        ジョブごとのメモリ記録（古い順）
+        {"job_id", "json", "pid", "rss_before", "rss_after", "delta", "images", "seconds", "status"}
+        """
+        with self._lock:
+            return list(self._history)
+
+    def close(self, wait=True):
+        """
+        新規受付を止め，キューに残ったジョブを処理してからワーカーを止める
+        """
+        with self._lock:
+            self._closing = True
+        self._wake()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- 内部 ----------
+    def _spawn(self, reserved=False):
+        parent_conn, child_conn = self.ctx.Pipe()
+        need_preload = self.ctx.get_start_method() != "fork"
+        proc = self.ctx.Process(target=_worker_main, name="render-worker", daemon=True,
+                                args=(child_conn, self.max_jobs, self.max_rss_mb,
+                                      self.templates, need_preload))
+        proc.start()
+        child_conn.close()
+        return _Worker(proc, parent_conn, reserved)
+
+    def _wake(self):
+        self._wake_w.send(None)
+
+    def _forget(self, job_id):
+        self._futures.pop(job_id, None)
+        self._queued_at.pop(job_id, None)
+        self._jobs.pop(job_id, None)
+        self._attempts.pop(job_id, None)
+
+    def _next_job(self, reserved, now):
+        """
+        次に割り当てるジョブをキューから取り出す（ロック内で呼ぶ）．
+        interactive は常に先．normal / bulk は「段数 - 待ち時間 / aging」の小さい方
+        """
+        if self._pending["interactive"]:
+            return "interactive", self._pending["interactive"].popleft()
+        if reserved:
+            return None
+        best = None
+        for rank, cls in enumerate(PRIORITIES):
+            q = self._pending[cls]
+            if not q:
+                continue
+            score = rank
+            if self.aging > 0:
+                score -= (now - self._queued_at[q[0][0]]) / self.aging
+            if best is None or score < best[0]:
+                best = (score, cls, rank)
+        if best is None:
+            return None
+        _, cls, rank = best
+        if any(self._pending[c] for c in PRIORITIES[:rank]):
+            self._sched[cls]["aged"] += 1
+        return cls, self._pending[cls].popleft()
+
+    def _dispatch(self):
+        with self._lock:
+            now = time.time()
+            # interactive が専用ワーカーから埋まるように専用ワーカーを先に回す
+            idle = sorted((w for w in self._workers if w.job_id is None and not w.retiring),
+                          key=lambda w: not w.reserved)
+            for w in idle:
+                while True:
+                    picked = self._next_job(w.reserved, now)
+                    if picked is None:
+                        break
+                    cls, (job_id, job) = picked
+                    fut = self._futures[job_id]
+                    # 待ち中に取り消されたジョブは捨てる（再投入されたジョブは実行中のまま）
+                    if not fut.running() and not fut.set_running_or_notify_cancel():
+                        self._forget(job_id)
+                        continue
+                    wait = now - self._queued_at[job_id]
+                    st = self._sched[cls]
+                    st["dispatched"] += 1
+                    st["wait_sum"] += wait
+                    st["wait_max"] = max(st["wait_max"], wait)
+                    st["waits"].append(wait)
+                    w.job_id = job_id
+                    w.conn.send((job_id, job))
+                    break
+
+    def _record_memory(self, w, msg):
+        result = msg["result"] if msg["status"] == "ok" else {}
+        before, after = msg.get("rss_before"), msg.get("rss")
+        rec = {
+            "job_id": msg["job_id"],
+            "json": str(self._jobs[msg["job_id"]].get("json")),
+            "priority": self._jobs[msg["job_id"]].get("priority") or DEFAULT_PRIORITY,
+            "pid": w.proc.pid,
+            "worker_jobs": w.jobs_done,
+            "rss_before": before,
+            "rss_after": after,
+            "delta": after - before if before is not None and after is not None else None,
+            "images": result.get("images"),
+            "seconds": msg["finished"] - msg["started"],
+            "status": msg["status"],
+        }
+        with self._lock:
+            self._history.append(rec)
+        if after is not None:
+            metrics.WORKER_RSS.set(after, pid=w.proc.pid)
+        if self.memory_log:
+            with open(self.memory_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+    def _finish(self, msg):
+        with self._lock:
+            fut = self._futures[msg["job_id"]]
+            queued = self._queued_at[msg["job_id"]]
+            priority = self._jobs[msg["job_id"]].get("priority") or DEFAULT_PRIORITY
+            self._forget(msg["job_id"])
+        started, finished = msg.get("started"), msg.get("finished")
+        metrics.observe_job("ok" if msg["status"] == "ok" else "failed", priority,
+                            result=msg["result"] if msg["status"] == "ok" else None,
+                            queue_wait=started - queued if started else None,
+                            seconds=(finished or time.time()) - queued)
+        if msg["status"] == "ok":
+            result = dict(msg["result"])
+            result.update(queued=queued, started=started, finished=finished, rss=msg["rss"])
+            fut.set_result(result)
+        else:
+            fut.set_exception(RuntimeError(msg["result"]))
+
+    def _lost(self, w):
+        """
+        ジョブ実行中にワーカーが落ちた（RSS 上限で停止した）場合の後始末．
+        再投入回数が残っていればキューの先頭に戻す
+        """
+        job_id = w.job_id
+        reason = "RSS上限超過で停止" if w.killed else f"異常終了 (exitcode={w.proc.exitcode})"
+        print(f"POOL: worker {w.proc.pid} {reason}")
+        if job_id is None:
+            return
+        with self._lock:
+            attempts = self._attempts.get(job_id, 0) + 1
+            self._attempts[job_id] = attempts
+            if attempts < MAX_ATTEMPTS:
+                job = self._jobs[job_id]
+                self._pending[job.get("priority") or DEFAULT_PRIORITY].appendleft((job_id, job))
+                return
+        self._finish({"job_id": job_id, "status": "error",
+                      "result": f"ワーカー{reason}（{attempts}回）"})
+
+    def _check_rss(self):
+        """
+        実行中のワーカーの RSS を見て，kill_rss_mb を超えていれば止める
+        """
+        for w in self._workers:
+            if w.job_id is None or w.killed:
+                continue
+            rss = process_rss(w.proc.pid)
+            if rss and rss > self.kill_rss_mb * MB:
+                w.killed = True
+                w.proc.terminate()
+
+    def _replace(self, w):
+        w.conn.close()
+        w.proc.join()
+        metrics.WORKER_RSS.remove(pid=w.proc.pid)
+        self._workers.remove(w)
+        with self._lock:
+            needed = not self._closing or any(self._pending.values())
+        if needed:
+            self._workers.append(self._spawn(w.reserved))
+
+    def _loop(self):
+        while True:
+            self._dispatch()
+            with self._lock:
+                idle = self._closing and not any(self._pending.values()) and \
+                    all(w.job_id is None for w in self._workers)
+            if idle:
+                break
+
+            conns = [w.conn for w in self._workers] + [self._wake_r]
+            timeout = self.poll_interval if self.kill_rss_mb else None
+            ready = multiprocessing.connection.wait(conns, timeout=timeout)
+            if self.kill_rss_mb:
+                self._check_rss()
+            for conn in ready:
+                if conn is self._wake_r:
+                    self._wake_r.recv()
+                    continue
+                w = next(w for w in self._workers if w.conn is conn)
+                try:
+                    msg = conn.recv()
+                except EOFError:
+                    # ワーカーが異常終了した（または RSS 上限で止めた）
+                    w.proc.join()
+                    self._lost(w)
+                    self._replace(w)
+                    continue
+                w.job_id = None
+                w.jobs_done += 1
+                self._record_memory(w, msg)
+                self._finish(msg)
+                if msg["retire"]:
+                    w.retiring = True
+                    self._replace(w)
+
+        for w in self._workers:
+            w.conn.send(None)
+            w.conn.close()
+            w.proc.join()
+        self._workers.clear()
+
+
+def load_jobs(jobs_path, default_template=None, index_db=None, asset_store=None,
+              default_priority=None, profile_slow=None, profile_dir=None, default_profile=None,
+              default_engine=None):
+    """
+    バッチのジョブ一覧（JSON Lines: {"json", "pdf", "template"?, "lang"?, "priority"?,
+    "profile"?, "engine"?}）を読む
+    """
+    jobs = []
+    for line in Path(jobs_path).read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        job.setdefault("template", default_template)
+        job.setdefault("index_db", index_db)
+        job.setdefault("asset_store", asset_store)
+        job.setdefault("priority", default_priority)
+        job.setdefault("profile_slow", profile_slow)
+        job.setdefault("profile_dir", profile_dir)
+        job.setdefault("profile", default_profile)
+        job.setdefault("engine", default_engine)
+        if not job["template"]:
+            raise ValueError(f"template が指定されていません: {line}")
+        jobs.append(job)
+    return jobs
+
+
+def run_batch(pool, jobs, journal=None):
+    """
+    ジョブを全件投入して完了を待つ．失敗件数を返す
+    journal（batch_journal.BatchJournal）を渡すと完了済み・入力が変わっていないジョブは
+    飛ばし，完了するたびに結果を追記する
+    """
+    digests = {}
+    todo = []
+    for i, job in enumerate(jobs):
+        if journal is not None:
+            try:
+                digests[i] = journal.digest(job)
+            except OSError as e:
+                # 入力が読めないジョブは投入して失敗として記録させる
+                print(f"WARN: ダイジェストを計算できません {job['json']} ({e})")
+                digests[i] = None
+            done = bool(digests[i]) and journal.is_done(job, digests[i])
+            metrics.cache_event("result", done)
+            if done:
+                continue
+        todo.append(i)
+    if journal is not None:
+        print(f"RESUME: {len(jobs) - len(todo)}/{len(jobs)} 件は完了済みのためスキップ")
+
+    futures = {pool.submit(jobs[i]): i for i in todo}
+    failed = 0
+    for fut in concurrent.futures.as_completed(futures):
+        job = jobs[futures[fut]]
+        try:
+            res = fut.result()
+            print(f"OK  : {job['json']} -> {res['pdf']} ({res['finished'] - res['queued']:.2f}s)")
+            if journal is not None:
+                journal.record(job, digests[futures[fut]], "ok", pdf=res["pdf"])
+        except Exception as e:
+            failed += 1
+            print(f"FAIL: {job['json']}\n{e}")
+            if journal is not None:
+                journal.record(job, digests[futures[fut]], "failed",
+                               error=(str(e).strip().splitlines() or [repr(e)])[-1])
+    print(f"BATCH: {len(todo) - failed}/{len(todo)} 件成功")
+    print_scheduler_summary(pool.scheduler_stats())
+    print_memory_summary(pool.memory_history())
+    return failed
+
+
+def print_scheduler_summary(stats):
+    """
+    優先度クラスごとの件数とキュー待ち時間を表示する
+    """
+    for cls, st in stats.items():
+        if not st["dispatched"]:
+            continue
+        print(f"QUEUE: {cls:<11} {st['dispatched']:5d} jobs  待ち 平均 {st['wait_mean']:.2f}s, "
+              f"p95 {st['wait_p95']:.2f}s, 最大 {st['wait_max']:.2f}s  (繰り上げ {st['aged']})")
+
+
+def print_memory_summary(history, top=5):
+    """
+    ジョブあたりの RSS 増加量の分布と，増加量の大きいレポートを表示する
+    """
+    deltas = sorted(r["delta"] for r in history if r["delta"] is not None)
+    if not deltas:
+        return
+    median = deltas[len(deltas) // 2]
+    print(f"MEMORY: {len(deltas)} jobs / 増加量 中央値 {median / MB:.1f}MB, 最大 {deltas[-1] / MB:.1f}MB")
+    worst = sorted((r for r in history if r["delta"] is not None),
+                   key=lambda r: r["delta"], reverse=True)[:top]
+    for r in worst:
+        print(f"  {r['delta'] / MB:7.1f}MB  images={r['images']}  {r['json']}")
+
+
+def run_daemon(pool, spool_dir, default_template=None, interval=1.0, index_db=None,
+               asset_store=None, default_priority=None, profile_slow=None, profile_dir=None,
+               default_profile=None, default_engine=None):
+    """
+    spool_dir に置かれたジョブファイル（*.json，内容は load_jobs の 1 行と同じ）を
+    監視して描画する．処理後は done/ または failed/ に移す（failed/ には <名前>.error に理由も書く）．
+    ジョブファイルは別名（*.tmp など）で書き切ってから *.json に rename して置くこと
+    （書きかけを読まない）．前回の停止で processing/ に残ったジョブは起動時に投入し直す
+    """
+    spool = Path(spool_dir)
+    for sub in ("processing", "done", "failed"):
+        (spool / sub).mkdir(parents=True, exist_ok=True)
+
+    def fail(path, error):
+        # 1 件の誤りでデーモンは止めない．理由はジョブファイルの隣に残す
+        print(f"FAIL: {path.name}\n{error}")
+        dest = spool / "failed" / path.name
+        os.replace(path, dest)
+        dest.with_name(dest.name + ".error").write_text(f"{error}\n", encoding="utf-8")
+
+    for path in sorted((spool / "processing").glob("*.json")):
+        if (spool / path.name).exists():
+            fail(path, "同名のジョブが spool にあるため投入し直せません")
+        else:
+            print(f"DAEMON: 前回の処理中のジョブを投入し直します: {path.name}")
+            os.replace(path, spool / path.name)
+    print(f"DAEMON: watching {spool.resolve()} (Ctrl+C で終了)")
+
+    def on_done(fut, path):
+        try:
+            res = fut.result()
+        except Exception as e:
+            fail(path, e)
+            return
+        print(f"OK  : {path.name} -> {res['pdf']}")
+        os.replace(path, spool / "done" / path.name)
+
+    try:
+        while True:
+            for path in sorted(spool.glob("[!.]*.json")):
+                moved = spool / "processing" / path.name
+                try:
+                    os.replace(path, moved)
+                except FileNotFoundError:
+                    continue   # 他のデーモンが先に取った
+                try:
+                    job = json.loads(moved.read_text(encoding="utf-8"))
+                    if not isinstance(job, dict):
+                        raise ValueError("ジョブはオブジェクトにしてください")
+                    job.setdefault("template", default_template)
+                    job.setdefault("index_db", index_db)
+                    job.setdefault("asset_store", asset_store)
+                    job.setdefault("priority", default_priority)
+                    job.setdefault("profile_slow", profile_slow)
+                    job.setdefault("profile_dir", profile_dir)
+                    job.setdefault("profile", default_profile)
+                    job.setdefault("engine", default_engine)
+                    fut = pool.submit(job)
+                except Exception as e:
+                    # 壊れた JSON・未対応の優先度など．このジョブだけ failed/ に移す
+                    fail(moved, e)
+                    continue
+                fut.add_done_callback(lambda f, p=moved: on_done(f, p))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("DAEMON: 停止します（処理中のジョブは完了まで待ちます）")
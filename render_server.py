@@ -0,0 +1,410 @@
+"""
+レポート描画のローカル HTTP サービス（asyncio）
+
+受付・応答は asyncio の 1 スレッドで行い，描画（CPU 処理）は render_pool.RenderPool の
+ワーカープロセスに回す．キュー待ち + 実行中のジョブが max_queue に達したら
+429（Retry-After 付き）を返して受付を止める．
+
+    python render_server.py --port 8765 --workers 4
+
+    POST /render                 … 本文は report.json そのもの（?lang=en&template=report.html&wait=0）
+                                   または {"report": {...}, "lang", "template", "wait", "timeout", "priority", "profile",
+                                                     "engine"}
+                                   wait=1（既定）: 完了まで待って PDF を返す．timeout 超過で 504
+                                   wait=0        : 202 とジョブIDを返す
+    GET  /jobs/<id>              … ジョブの状態（queued / running / done / failed）
+    GET  /jobs/<id>/pdf          … 完了したジョブの PDF
+    GET  /metrics                … メトリクス（Prometheus テキスト形式）
+    GET  /healthz                … ワーカー数・キューの状態（優先度クラスごとの待ち時間を含む）
+
+priority（interactive / normal / bulk）を省略したリクエストは --priority（既定 interactive）で
+投入する．アーカイブの一括再描画は priority=bulk で送ると検査中のレポートを待たせない．
+profile（print / archive / preview，pdf_profiles 参照）・engine（weasyprint / reportlab）を
+省略したリクエストは --profile・--engine を使う．
+
+report.json 内の画像の相対パスは --base から解決する（URL や --base の外を指すパスは 400．
+描画時も --base の外は読まない）．受け付けた report.json と
+PDF は --jobs-dir に置き，直近 --keep 件を超えた古いジョブは削除する．
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+import pdf_profiles
+import report_index
+from i18n import DEFAULT_LOCALE, available_locales
+from render_pool import ENGINES, PRIORITIES, RenderPool
+from report_schema import ReportValidationError, validate
+
+DEFAULT_JOBS_DIR = Path(__file__).resolve().parent / ".cache" / "server_jobs"
+
+# リクエスト本文の上限（report.json は数十KB程度）
+MAX_BODY = 8 * 1024 * 1024
+# ヘッダ読込のタイムアウト（秒）
+HEADER_TIMEOUT = 30
+# 本文読込のタイムアウト（秒．MAX_BODY を送り切るのに十分な長さ）
+BODY_TIMEOUT = 30
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.lower() not in ("0", "false", "no", "")
+    return bool(value)
+
+
+class RenderService:
+    """
+    HTTP リクエストをジョブに変換してプールに投入する
+    templates: {名前: パス}（クライアントはこの中から名前で選ぶ）
+    """
+
+    def __init__(self, pool, templates, base_dir=".", jobs_dir=DEFAULT_JOBS_DIR,
+                 max_queue=16, timeout=60.0, keep=1000, index_db=None, asset_store=None,
+                 priority="interactive", profile_slow=None, profile_dir=None, profile=None,
+                 engine=None):
+        self.pool = pool
+        self.templates = {name: str(Path(path).resolve()) for name, path in templates.items()}
+        self.default_template = next(iter(self.templates))
+        self.base_dir = str(Path(base_dir).resolve())
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.keep = keep
+        self.index_db = index_db
+        self.asset_store = asset_store
+        self.priority = priority
+        self.profile_slow = profile_slow
+        self.profile_dir = profile_dir
+        self.profile = pdf_profiles.check_profile(profile)
+        self.engine = engine
+        self.locales = set(available_locales())
+        self._jobs = OrderedDict()
+        self._inflight = 0
+        self._seq = itertools.count(1)
+        self._started = time.time()
+
+    # ---------- ジョブ ----------
+    def _new_id(self):
+        return f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{next(self._seq):06d}"
+
+    def _parse_render(self, query, body):
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"JSON を解析できません: {e}")
+        if not isinstance(payload, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "本文は report.json のオブジェクトにしてください")
+        opts = {k: v[-1] for k, v in query.items()}
+        if "report" in payload:
+            opts.update({k: v for k, v in payload.items() if k != "report"})
+            report = payload["report"]
+        else:
+            report = payload
+
+        lang = opts.get("lang") or DEFAULT_LOCALE
+        if lang not in self.locales:
+            raise HTTPError(HTTPStatus.BAD_REQUEST,
+                            f"未対応の言語です: {lang}（{', '.join(sorted(self.locales))}）")
+        template = opts.get("template") or self.default_template
+        if template not in self.templates:
+            raise HTTPError(HTTPStatus.BAD_REQUEST,
+                            f"未登録のテンプレートです: {template}（{', '.join(self.templates)}）")
+        priority = opts.get("priority") or self.priority
+        if priority not in PRIORITIES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST,
+                            f"未対応の優先度です: {priority}（{', '.join(PRIORITIES)}）")
+        profile = opts.get("profile") or self.profile
+        if profile is not None and profile not in pdf_profiles.PROFILES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST,
+                            f"未対応の出力プロファイルです: {profile}（{', '.join(pdf_profiles.PROFILES)}）")
+        engine = opts.get("engine") or self.engine
+        if engine is not None and engine not in ENGINES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST,
+                            f"未対応の描画エンジンです: {engine}（{', '.join(ENGINES)}）")
+        try:
+            timeout = float(opts.get("timeout", self.timeout))
+        except (TypeError, ValueError):
+            timeout = None
+        # nan・inf・0 以下は待ち時間にならない（inf はジョブが終わるまで接続を握り続ける）
+        if timeout is None or not math.isfinite(timeout) or timeout <= 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "timeout は正の秒数で指定してください")
+        # 壊れた report.json はワーカーに渡さずここで返す（描画 1 回分の時間を使わない）．
+        # 画像は --base の中のファイルに限る（URL や外のパスでサーバのファイルを読ませない）
+        try:
+            validate(report, base_dir=self.base_dir, confine=True)
+        except ReportValidationError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+        return (report, lang, template, priority, profile, engine,
+                _flag(opts.get("wait", True)), timeout)
+
+    def _status(self, entry):
+        fut = entry["future"]
+        info = {k: entry[k] for k in ("id", "lang", "template", "priority", "profile", "engine",
+                                      "submitted")}
+        if not fut.done():
+            info["status"] = "running" if fut.running() else "queued"
+            return info
+        info["finished"] = entry["finished"]
+        if fut.exception() is not None:
+            info.update(status="failed", error=str(fut.exception()))
+        else:
+            res = fut.result()
+            info.update(status="done", pages=res["pages"], timings=res["timings"],
+                        queue_wait=res["started"] - res["queued"], pdf=f"/jobs/{entry['id']}/pdf")
+        return info
+
+    def _done(self, entry):
+        # イベントループのスレッドで呼ばれる
+        self._inflight -= 1
+        entry["finished"] = time.time()
+        self._evict()
+
+    def _evict(self):
+        """
+        完了したジョブを古い順に削除して keep 件に収める
+        """
+        while len(self._jobs) > self.keep:
+            job_id, entry = next(iter(self._jobs.items()))
+            if not entry["future"].done():
+                break
+            del self._jobs[job_id]
+            for path in (entry["json"], entry["pdf"]):
+                if path.exists():
+                    path.unlink()
+            if self.asset_store:
+                from asset_store import AssetStore
+                AssetStore(self.asset_store).release(entry["json"])
+
+    async def render(self, query, body):
+        report, lang, template, priority, profile, engine, wait, timeout = \
+            self._parse_render(query, body)
+        if self._inflight >= self.max_queue:
+            raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, "キューが満杯です",
+                            {"Retry-After": str(max(1, round(self.timeout / 10)))})
+
+        job_id = self._new_id()
+        json_path = self.jobs_dir / f"{job_id}.json"
+        pdf_path = self.jobs_dir / f"{job_id}.pdf"
+        json_path.write_text(json.dumps(report, ensure_ascii=False), encoding="utf-8")
+        job = {"template": self.templates[template], "json": str(json_path), "pdf": str(pdf_path),
+               "lang": lang, "base_dir": self.base_dir, "index_db": self.index_db,
+               "asset_store": self.asset_store, "priority": priority,
+               "profile_slow": self.profile_slow, "profile_dir": self.profile_dir,
+               "profile": profile, "engine": engine, "confine": True}
+        try:
+            fut = self.pool.submit(job)
+        except RuntimeError as e:
+            json_path.unlink()
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+
+        entry = {"id": job_id, "lang": lang, "template": template, "priority": priority,
+                 "profile": profile, "engine": engine, "submitted": time.time(),
+                 "finished": None, "json": json_path, "pdf": pdf_path, "future": fut}
+        self._jobs[job_id] = entry
+        self._inflight += 1
+        afut = asyncio.wrap_future(fut)
+        afut.add_done_callback(lambda _: self._done(entry))
+
+        if not wait:
+            return HTTPStatus.ACCEPTED, {"Location": f"/jobs/{job_id}"}, self._status(entry)
+        try:
+            # タイムアウトしてもジョブは止めない（後で /jobs/<id> から取れる）
+            await asyncio.wait_for(asyncio.shield(afut), timeout)
+        except asyncio.TimeoutError:
+            raise HTTPError(HTTPStatus.GATEWAY_TIMEOUT,
+                            f"{timeout:g}秒以内に完了しませんでした（ジョブID {job_id}）",
+                            {"Location": f"/jobs/{job_id}"})
+        except Exception as e:
+            raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, f"描画に失敗しました: {e}")
+        return self._pdf_response(entry)
+
+    def _pdf_response(self, entry):
+        res = entry["future"].result()
+        headers = {"Content-Type": "application/pdf", "X-Job-Id": entry["id"],
+                   "Content-Disposition": f'inline; filename="{entry["id"]}.pdf"',
+                   "X-Queue-Wait": f"{res['started'] - res['queued']:.4f}",
+                   "X-Render-Seconds": f"{res['finished'] - res['started']:.4f}"}
+        return HTTPStatus.OK, headers, entry["pdf"].read_bytes()
+
+    def job(self, job_id, pdf=False):
+        entry = self._jobs.get(job_id)
+        if entry is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"ジョブがありません: {job_id}")
+        if not pdf:
+            return HTTPStatus.OK, {}, self._status(entry)
+        fut = entry["future"]
+        if not fut.done():
+            raise HTTPError(HTTPStatus.CONFLICT, "まだ完了していません")
+        if fut.exception() is not None:
+            raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, str(fut.exception()))
+        return self._pdf_response(entry)
+
+    def health(self):
+        queued = self.pool.pending_count()
+        return HTTPStatus.OK, {}, {
+            "workers": self.pool.n_workers, "queued": queued,
+            "running": self._inflight - queued, "max_queue": self.max_queue,
+            "jobs": len(self._jobs), "uptime": time.time() - self._started,
+            "classes": self.pool.scheduler_stats(),
+        }
+
+    # ---------- HTTP ----------
+    async def route(self, method, target, body):
+        url = urlsplit(target)
+        parts = [p for p in url.path.split("/") if p]
+        if method == "POST" and parts == ["render"]:
+            return await self.render(parse_qs(url.query), body)
+        if method == "GET" and parts == ["healthz"]:
+            return self.health()
+        if method == "GET" and parts == ["metrics"]:
+            return HTTPStatus.OK, {"Content-Type": metrics.CONTENT_TYPE}, \
+                metrics.REGISTRY.render().encode("utf-8")
+        if method == "GET" and len(parts) in (2, 3) and parts[0] == "jobs":
+            if len(parts) == 3 and parts[2] != "pdf":
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"{url.path} はありません")
+            return self.job(parts[1], pdf=len(parts) == 3)
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"{method} {url.path} はありません")
+
+    async def _read_request(self, reader):
+        line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "リクエスト行が不正です")
+        headers = {}
+        while True:
+            h = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+            if h in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = h.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Content-Length が不正です")
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Content-Length が不正です")
+        if length > MAX_BODY:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"本文は {MAX_BODY} バイトまでです")
+        # Content-Length だけ送って止まる接続に本文のバッファと接続を握らせ続けない
+        try:
+            body = await asyncio.wait_for(reader.readexactly(length), BODY_TIMEOUT) if length else b""
+        except asyncio.TimeoutError:
+            raise HTTPError(HTTPStatus.REQUEST_TIMEOUT, f"本文を {BODY_TIMEOUT} 秒以内に送り切れませんでした")
+        return method.upper(), target, body
+
+    async def handle(self, reader, writer):
+        t0 = time.perf_counter()
+        request = None
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            status, headers, payload = await self.route(*request)
+        except HTTPError as e:
+            status, headers, payload = e.status, e.headers, {"error": str(e)}
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            status, headers, payload = HTTPStatus.BAD_REQUEST, {}, {"error": "リクエストを読み切れませんでした"}
+        except Exception as e:
+            status, headers, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {}, {"error": repr(e)}
+
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            headers = {"Content-Type": "application/json; charset=utf-8", **headers}
+        head = [f"HTTP/1.1 {status.value} {status.phrase}",
+                f"Content-Length: {len(payload)}", "Connection: close"]
+        head += [f"{k}: {v}" for k, v in headers.items()]
+        try:
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+        if request is not None:
+            print(f"HTTP: {request[0]} {request[1]} {status.value} "
+                  f"({time.perf_counter() - t0:.2f}s)")
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"SERVER: http://{host}:{port}/ (Ctrl+C で終了)")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    p = argparse.ArgumentParser(description="レポート描画の HTTP サービス")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--template", action="append", default=None,
+                   help="受け付けるテンプレート（複数可，先頭が既定．既定 report.html）")
+    p.add_argument("--base", default=".", help="report.json 内の画像パスの基準ディレクトリ")
+    p.add_argument("--jobs-dir", default=str(DEFAULT_JOBS_DIR), help="受け付けたジョブの保存先")
+    p.add_argument("--keep", type=int, default=1000, help="保持する完了ジョブ数")
+    p.add_argument("--max-queue", type=int, default=16,
+                   help="キュー待ち + 実行中のジョブ数の上限（超えると 429）")
+    p.add_argument("--timeout", type=float, default=60.0, help="wait=1 の既定タイムアウト（秒）")
+    p.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    p.add_argument("--priority", default="interactive", choices=PRIORITIES,
+                   help="priority を指定しないリクエストの優先度")
+    p.add_argument("--reserve-interactive", type=int, default=0, metavar="N",
+                   help="interactive 専用にするワーカー数")
+    p.add_argument("--aging", type=float, default=60.0,
+                   help="normal / bulk の優先度を 1 段上げるまでの待ち時間 [秒]")
+    p.add_argument("--max-jobs", type=int, default=50)
+    p.add_argument("--max-rss-mb", type=int, default=0)
+    p.add_argument("--kill-rss-mb", type=int, default=0)
+    p.add_argument("--memory-log", default=None)
+    p.add_argument("--index", default=str(report_index.DEFAULT_DB), help="レポート索引DB")
+    p.add_argument("--no-index", action="store_true", help="索引に記録しない")
+    p.add_argument("--asset-store", default=None, help="画像のアセットストア")
+    p.add_argument("--profile-slow", type=float, default=0, metavar="SEC",
+                   help="描画が SEC 秒を超えたらスタックのプロファイルと report.json を保存する")
+    p.add_argument("--profile-dir", default=None, help="遅い描画のプロファイルの保存先")
+    p.add_argument("--profile", default=None, choices=sorted(pdf_profiles.PROFILES),
+                   help="profile を指定しないリクエストの出力プロファイル（既定は WeasyPrint の既定）")
+    p.add_argument("--engine", default=None, choices=ENGINES,
+                   help="engine を指定しないリクエストの描画エンジン（既定 weasyprint）")
+    args = p.parse_args()
+
+    templates = {Path(t).name: t for t in (args.template or ["report.html"])}
+    pool = RenderPool(workers=args.workers, max_jobs=args.max_jobs, max_rss_mb=args.max_rss_mb,
+                      templates=list(templates.values()), kill_rss_mb=args.kill_rss_mb,
+                      memory_log=args.memory_log, reserved_workers=args.reserve_interactive,
+                      aging=args.aging)
+    pool.start()
+    service = RenderService(pool, templates, base_dir=args.base, jobs_dir=args.jobs_dir,
+                            max_queue=args.max_queue, timeout=args.timeout, keep=args.keep,
+                            index_db=None if args.no_index else args.index,
+                            asset_store=args.asset_store, priority=args.priority,
+                            profile_slow=args.profile_slow, profile_dir=args.profile_dir,
+                            profile=args.profile, engine=args.engine)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("SERVER: 停止します（処理中のジョブは完了まで待ちます）")
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+"""
+reportlab による描画エンジン（--engine reportlab）
+
+report.html と同じ配置（ヘッダー・サマリー表・時刻と体位図・タイムライン・
+サムネイルギャラリー）を report.json から reportlab.pdfgen.canvas で直接描く．
+HTML/CSS のレイアウト（WeasyPrint・Pango）を通さないので 1 件あたりの時間と
+メモリが小さい．寸法は report.html の CSS をそのまま mm で写してあり，
+改ページはテンプレートの data-* 属性（gallery_layout）で HTML と同じように決める．
+CSS を変えたらここの定数も合わせ，parity_check.py で HTML 版と比べること．
+
+フォントも同じものを使う．欧文は fonts/segoeui*.ttf，和文は
+fonts/BIZUDPGothic-*.ttf（無ければ reportlab 内蔵の HeiseiKakuGo-W5）で，
+ブラウザと同じく欧文フォントに無い文字だけ和文フォントで描く．
+
+    python report_canvas.py report.json out.pdf [--lang en]
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfgen import canvas
+
+from font_cache import load_ttfont
+from gallery_layout import gallery_geometry, paginate
+from i18n import DEFAULT_LOCALE, load_catalog
+from report_schema import validate
+from timeline_svg import DEFAULT_EVENT_COLOR, EVENT_W, VIEW_W, segment_color
+
+FONTS_DIR = Path(__file__).resolve().parent / "fonts"
+
+# ---------- report.html の寸法（mm / pt） ----------
+PAGE_W, PAGE_H = 210.0, 297.0          # @page size: A4
+MARGIN = 5.0                           # --page-margin
+CONTENT_W = PAGE_W - MARGIN * 2
+PT = 25.4 / 72                         # 1pt [mm]
+PX = 25.4 / 96                         # 1px [mm]
+LINE_HEIGHT = 1.2
+LETTER_SPACING = 0.04                  # em
+INK = (0x11 / 255,) * 3                # color: #111
+RULE = 0.8                             # --rule-thick
+BORDER = 2 * PX                        # 表・タイムラインの枠線 2px
+
+HEADER = {"title_pt": 32, "meta_pt": 16, "gap": 6.0, "meta_gap": 8.0}
+DIVIDER_HEADER = (3.0, 5.0)            # margin: 3mm 0 5mm
+DIVIDER_SECTION = (8.0, 5.0)           # margin: 8mm 0 5mm
+SUMMARY = {"pt": 16, "label_w": 70.0, "width": 0.95, "biopsy_gap": 3.0,
+           "times_pt": 14, "times_gap": 3.0, "position_gap": 6.0, "position_max_w": 60.0}
+TIMELINE = {"padding": 6.0, "gap": 4.0, "caption_pt": 18, "header_pt": 14, "header_gap": 4.0,
+            "time_marker_pt": 14, "time_marker_top": -8.0, "marker_pt": 20, "marker_outline_pt": 22.5,
+            "marker_color": (60 / 255,) * 3, "svg_h": 10.0}
+GALLERY = {"caption_w": 50.0, "caption_pt": 14, "caption_lh": 1.5, "label_pt": 24,
+           "gap": 4.0, "block_gap": 4.0, "thumb_h": 43.0,
+           "thumb_label_pt": 12, "thumb_index_pt": 10, "thumb_label_inset": 4 * PX}
+
+_FONTS = None
+# 画像（パス → (更新時刻, ImageReader)）．常駐・バッチ時はジョブをまたいで使い回す
+_IMAGES = {}
+
+
+# ---------- フォント ----------
+def _register(name, filename, fallback):
+    path = FONTS_DIR / filename
+    if name in pdfmetrics.getRegisteredFontNames():
+        return name
+    if path.exists():
+        # 解析結果は font_cache に保存してあり，2 回目以降のプロセスでは読むだけ
+        pdfmetrics.registerFont(load_ttfont(name, path))
+        return name
+    if fallback not in pdfmetrics.getRegisteredFontNames() and fallback.startswith("Heisei"):
+        pdfmetrics.registerFont(UnicodeCIDFont(fallback))
+    return fallback
+
+
+def fonts():
+    """
+    {(欧文/和文, 太字): フォント名} を返す（初回に登録する）
+    """
+    global _FONTS
+    if _FONTS is None:
+        _FONTS = {
+            ("latin", False): _register("SegoeUI", "segoeui.ttf", "Helvetica"),
+            ("latin", True): _register("SegoeUI-Bold", "segoeuib.ttf", "Helvetica-Bold"),
+            ("jp", False): _register("BIZUDPGothic", "BIZUDPGothic-Regular.ttf", "HeiseiKakuGo-W5"),
+            ("jp", True): _register("BIZUDPGothic-Bold", "BIZUDPGothic-Bold.ttf", "HeiseiKakuGo-W5"),
+        }
+    return _FONTS
+
+
+def _covers(font_name, ch):
+    face = getattr(pdfmetrics.getFont(font_name), "face", None)
+    if face is not None and hasattr(face, "charToGlyph"):
+        return ord(ch) in face.charToGlyph
+    return ord(ch) < 0x100
+
+
+def _runs(text, bold=False):
+    """
+    text を（フォント名, 文字列）の並びに分ける（欧文フォントに無い文字は和文フォント）
+    """
+    f = fonts()
+    latin, jp = f[("latin", bold)], f[("jp", bold)]
+    runs = []
+    for ch in text:
+        name = latin if _covers(latin, ch) else jp
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += ch
+        else:
+            runs.append([name, ch])
+    return runs
+
+
+def text_width(text, size, bold=False):
+    """
+    文字列の幅 [mm]（letter-spacing を含む）
+    """
+    width = sum(pdfmetrics.stringWidth(s, name, size) for name, s in _runs(text, bold))
+    return (width + LETTER_SPACING * size * len(text)) * PT
+
+
+def baseline(size, line_height=LINE_HEIGHT):
+    """
+    行ボックスの上端からベースラインまで [mm]（欧文フォントの ascent / descent で決める）
+    """
+    ascent, descent = pdfmetrics.getAscentDescent(fonts()[("latin", False)], size)
+    return ((line_height * size - (ascent - descent)) / 2 + ascent) * PT
+
+
+def line_h(size, line_height=LINE_HEIGHT):
+    return line_height * size * PT
+
+
+class Page:
+    """
+    mm・左上原点で描く canvas の薄いラッパー
+    """
+
+    def __init__(self, c):
+        self.c = c
+
+    def y(self, top):
+        return (PAGE_H - top) * mm
+
+    def text(self, x, base, text, size, bold=False, color=INK, align="left"):
+        if not text:
+            return
+        if align != "left":
+            w = text_width(text, size, bold)
+            x -= w if align == "right" else w / 2
+        t = self.c.beginText(x * mm, self.y(base))
+        t.setCharSpace(LETTER_SPACING * size)
+        t.setFillColorRGB(*color)
+        for name, s in _runs(text, bold):
+            t.setFont(name, size)
+            t.textOut(s)
+        self.c.drawText(t)
+
+    def rule(self, x, top, w, h):
+        self.c.setFillColorRGB(0, 0, 0)
+        self.c.rect(x * mm, self.y(top + h), w * mm, h * mm, stroke=0, fill=1)
+
+    def box(self, x, top, w, h, width=BORDER):
+        # 枠線は border-box の内側に描く（CSS の box-sizing: border-box と同じ）
+        self.c.setStrokeColorRGB(0, 0, 0)
+        self.c.setLineWidth(width * mm)
+        self.c.rect((x + width / 2) * mm, self.y(top + h - width / 2),
+                    (w - width) * mm, (h - width) * mm, stroke=1, fill=0)
+
+    def image(self, reader, x, top, w, h, cover=False):
+        if not cover:
+            self.c.drawImage(reader, x * mm, self.y(top + h), w * mm, h * mm, mask="auto")
+            return
+        # object-fit: cover（はみ出した分は切り取る）
+        iw, ih = reader.getSize()
+        scale = max(w / iw, h / ih)
+        dw, dh = iw * scale, ih * scale
+        self.c.saveState()
+        path = self.c.beginPath()
+        path.rect(x * mm, self.y(top + h), w * mm, h * mm)
+        self.c.clipPath(path, stroke=0, fill=0)
+        self.c.drawImage(reader, (x - (dw - w) / 2) * mm, self.y(top + (h + dh) / 2),
+                         dw * mm, dh * mm, mask="auto")
+        self.c.restoreState()
+
+
+def _image(path):
+    path = str(path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        print(f"WARN: 画像がありません {path}")
+        return None
+    cached = _IMAGES.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _IMAGES[path] = (mtime, ImageReader(path))
+    return cached[1]
+
+
+def _percent(value):
+    return float(str(value).strip().rstrip("%")) / 100
+
+
+# ---------- 各部分（戻り値は描いた部分の下端 [mm]） ----------
+def draw_header(page, data, msgs):
+    top = MARGIN
+    title_pt, meta_pt = HEADER["title_pt"], HEADER["meta_pt"]
+    bottom = top + max(line_h(title_pt), line_h(meta_pt))
+    page.text(MARGIN, bottom - line_h(title_pt) + baseline(title_pt), msgs["report_title"],
+              title_pt, bold=True)
+
+    # タイトルとメタ情報は flex: 1 で半分ずつ．メタ情報が入りきらなければタイトル側が縮む
+    date = msgs["date"].format(date=data.get("header", {}).get("date", ""))
+    patient = msgs["patient_id"]
+    meta_w = text_width(date, meta_pt) + HEADER["meta_gap"] + text_width(patient, meta_pt)
+    x = MARGIN + CONTENT_W - max(meta_w, (CONTENT_W - HEADER["gap"]) / 2)
+    base = bottom - line_h(meta_pt) + baseline(meta_pt)
+    page.text(x, base, date, meta_pt)
+    page.text(x + text_width(date, meta_pt) + HEADER["meta_gap"], base, patient, meta_pt)
+
+    rule_top = bottom + DIVIDER_HEADER[0]
+    page.rule(MARGIN, rule_top, CONTENT_W, RULE)
+    return rule_top + RULE + DIVIDER_HEADER[1]
+
+
+def draw_summary(page, data, msgs, top, base_dir):
+    checks = data.get("checks", {})
+    pt, times_pt = SUMMARY["pt"], SUMMARY["times_pt"]
+
+    # 右カラム（開始・終了時刻と体位図，右寄せ）
+    start = msgs["start_time"].format(time=checks.get("times", {}).get("start", ""))
+    end = msgs["end_time"].format(time=checks.get("times", {}).get("end", ""))
+    right = MARGIN + CONTENT_W
+    aside_w = max(text_width(start, times_pt), text_width(end, times_pt))
+    y = top
+    for s in (start, end):
+        page.text(right, y + baseline(times_pt), s, times_pt, align="right")
+        y += line_h(times_pt) + SUMMARY["times_gap"]
+    y += SUMMARY["position_gap"]
+    position = _image(base_dir / "position.png")
+    if position is not None:
+        iw, ih = position.getSize()
+        w = min(iw * PX, SUMMARY["position_max_w"])
+        h = w * ih / iw
+        page.image(position, right - w, y, w, h)
+        aside_w = max(aside_w, w)
+        y += h
+    aside_bottom = y
+
+    # 左カラム（表と生検）
+    table_w = (CONTENT_W - aside_w) * SUMMARY["width"]
+    pad = 0.4 * pt * PT
+    row_h = line_h(pt) + pad * 2 + BORDER
+    rows = [(None, msgs["col_used"], msgs["col_time"])] + \
+        [(r["label"], r["mark"], r["time"]) for r in checks.get("rows", [])]
+    # 2・3 列目は自動レイアウトと同じく内容の幅に比例して残りを分ける
+    natural = [max(text_width(r[i] or "", pt, bold=r[0] is None) for r in rows) + pad * 2
+               for i in (1, 2)]
+    rest = max(table_w - SUMMARY["label_w"], 0)
+    widths = [SUMMARY["label_w"]] + [rest * n / (sum(natural) or 1) for n in natural]
+
+    y = top
+    for r in rows:
+        x = MARGIN
+        for i, (text, w) in enumerate(zip(r, widths)):
+            page.box(x, y, w + BORDER, row_h + BORDER)
+            base = y + BORDER + pad + baseline(pt)
+            if i == 0:
+                page.text(x + BORDER + pad, base, text, pt)
+            else:
+                page.text(x + BORDER / 2 + w / 2, base, text, pt, bold=r[0] is None, align="center")
+            x += w
+        y += row_h
+
+    biopsy = checks.get("biopsy", {})
+    y += BORDER + SUMMARY["biopsy_gap"]
+    h = line_h(pt) + pad * 2 + BORDER * 2
+    page.box(MARGIN, y, table_w, h)
+    base = y + BORDER + pad + baseline(pt)
+    page.text(MARGIN + BORDER + pad, base, biopsy.get("method", ""), pt)
+    page.text(MARGIN + BORDER + pad + SUMMARY["label_w"], base, biopsy.get("target", ""), pt)
+    return max(y + h, aside_bottom)
+
+
+def _draw_track(page, track, x, top, w, h):
+    duration = float(track.get("duration", 0))
+
+    def px(t):
+        return 0.0 if duration <= 0 else min(max(float(t) / duration, 0.0), 1.0) * w
+
+    c = page.c
+    for seg in track.get("segments", []):
+        x0, x1 = px(seg["start"]), px(seg["end"])
+        if x1 > x0:
+            c.setFillColor(segment_color(seg))
+            c.rect((x + x0) * mm, page.y(top + h), (x1 - x0) * mm, h * mm, stroke=0, fill=1)
+    event_w = w * EVENT_W / VIEW_W
+    for ev in track.get("events", []):
+        ex = min(max(px(ev["time"]) - event_w / 2, 0.0), w - event_w)
+        c.setFillColor(ev.get("color", DEFAULT_EVENT_COLOR))
+        c.rect((x + ex) * mm, page.y(top + h), event_w * mm, h * mm, stroke=0, fill=1)
+
+
+def draw_timeline(page, data, msgs, top, base_dir):
+    t = TIMELINE
+    left = MARGIN + t["padding"]
+    width = CONTENT_W - t["padding"] * 2
+    page.text(left, top + baseline(t["header_pt"]), msgs["elapsed_time"], t["header_pt"])
+    y = top + line_h(t["header_pt"]) + t["header_gap"]
+
+    for tl in data.get("timeline", []):
+        y += t["gap"]
+        caption_w = text_width(tl["caption"], t["caption_pt"])
+        tx = left + caption_w + t["gap"]
+        tw = width - caption_w - t["gap"]
+        reader = None
+        if tl.get("track"):
+            th = t["svg_h"]
+        else:
+            reader = _image(base_dir / tl["img"])
+            if reader is not None:
+                iw, ih = reader.getSize()
+                th = (tw - BORDER * 2) * ih / iw + BORDER * 2
+            else:
+                th = t["svg_h"]
+        row_h = max(line_h(t["caption_pt"]), th)
+        caption_top = y + (row_h - line_h(t["caption_pt"])) / 2
+        page.text(left, caption_top + baseline(t["caption_pt"]), tl["caption"], t["caption_pt"])
+
+        track_top = y + (row_h - th) / 2
+        inner = (tx + BORDER, track_top + BORDER, tw - BORDER * 2, th - BORDER * 2)
+        if tl.get("track"):
+            _draw_track(page, tl["track"], *inner)
+        elif reader is not None:
+            page.image(reader, *inner)
+        page.box(tx, track_top, tw, th)
+
+        for m in tl.get("time_markers", []):
+            page.text(tx + tw * _percent(m["x"]), track_top + t["time_marker_top"] +
+                      baseline(t["time_marker_pt"]), m["label"], t["time_marker_pt"], align="center")
+        # イベントマーカー：白い太字を下に敷いて縁取りに見せる
+        pt, outline_pt = t["marker_pt"], t["marker_outline_pt"]
+        center = track_top + line_h(pt) / 2
+        for m in tl.get("event_markers", []):
+            mx = tx + tw * _percent(m["x"])
+            char = m.get("char", m["label"])
+            page.text(mx, center - line_h(outline_pt) / 2 + baseline(outline_pt), char,
+                      outline_pt, bold=True, color=(1, 1, 1), align="center")
+            page.text(mx, track_top + baseline(pt), m["label"], pt,
+                      color=t["marker_color"], align="center")
+        y += row_h
+
+    rule_top = y + DIVIDER_SECTION[0]
+    page.rule(MARGIN, rule_top, CONTENT_W, RULE)
+    return rule_top + RULE + DIVIDER_SECTION[1]
+
+
+def _draw_thumb_label(page, x, top, label, index, time_text):
+    g = GALLERY
+    pt, small = g["thumb_label_pt"], g["thumb_index_pt"]
+    parts = [(label, pt), (str(index), small), (f" {time_text}", pt)]
+    w = sum(text_width(s, size, bold=True) for s, size in parts) + 12 * PX
+    h = line_h(pt) + 4 * PX
+    c = page.c
+    c.setFillColorRGB(1, 1, 1)
+    c.setStrokeColorRGB(0, 0, 0)
+    c.setLineWidth(PX * mm)
+    c.roundRect(x * mm, page.y(top + h), w * mm, h * mm, 4 * PX * mm, stroke=1, fill=1)
+    tx, base = x + 7 * PX, top + 3 * PX + baseline(pt)
+    for s, size in parts:
+        page.text(tx, base, s, size, bold=True)
+        tx += text_width(s, size, bold=True)
+
+
+def draw_gallery_block(page, block, images, continued, msgs, top, base_dir, columns):
+    g = GALLERY
+    top += g["block_gap"]
+
+    # キャプション（1 行目はラベルを大きく）
+    first_h = g["caption_lh"] * g["label_pt"] * PT
+    page.text(MARGIN, top + baseline(g["label_pt"], g["caption_lh"]), block["label"],
+              g["label_pt"], bold=True)
+    lines = [msgs["continued"]] if continued else \
+        [cap[k] for cap in block.get("caption", []) for k in ("organ", "method") if k in cap]
+    y = top + first_h
+    for text in lines:
+        page.text(MARGIN, y + baseline(g["caption_pt"], g["caption_lh"]), text, g["caption_pt"])
+        y += line_h(g["caption_pt"], g["caption_lh"])
+    caption_bottom = y
+
+    x0 = MARGIN + g["caption_w"]
+    col_w = (CONTENT_W - g["caption_w"] - g["gap"] * (columns - 1)) / columns
+    bottom = top
+    for i, img in enumerate(images):
+        row, col = divmod(i, columns)
+        x = x0 + col * (col_w + g["gap"])
+        y = top + row * (g["thumb_h"] + g["gap"])
+        reader = _image(base_dir / img["src"])
+        if reader is not None:
+            page.image(reader, x, y, col_w, g["thumb_h"], cover=True)
+        inset = g["thumb_label_inset"]
+        _draw_thumb_label(page, x + inset, y + inset, block["label"], img["index"], img["time"])
+        bottom = y + g["thumb_h"]
+    return max(bottom, caption_bottom)
+
+
+def render_canvas(data, pdf_path, locale=None, base_dir=None, geometry=None, compress=True,
+                  stats=None):
+    """
+    report.json のデータ → PDF．geometry はテンプレートの .exam-gallery の data-* 属性
+    （省略時は report.html と同じ値）．stats に dict を渡すと描画・書き出し時間とページ数を入れる
+    戻り値: PDF の絶対パス
+    """
+    msgs = load_catalog(locale or DEFAULT_LOCALE)
+    pdf_abs = os.path.abspath(pdf_path)
+    base_dir = Path(base_dir or Path(pdf_abs).parent).resolve()
+    geometry = geometry or {"data-columns": "3", "data-row-mm": "47",
+                            "data-first-mm": "96", "data-page-mm": "262"}
+    columns, rows_first, rows_per_page = gallery_geometry(geometry)
+    blocks = data.get("gallery", [])
+    pages = paginate(blocks, columns, rows_first, rows_per_page)
+
+    t0 = time.perf_counter()
+    part = f"{pdf_abs}.{os.getpid()}.part"
+    c = canvas.Canvas(part, pagesize=(PAGE_W * mm, PAGE_H * mm), pageCompression=int(compress))
+    c.setTitle(msgs["title"])
+    page = Page(c)
+    n_pages = 0
+    try:
+        for page_no, items in enumerate(pages):
+            if page_no > 0 and not items:
+                continue
+            if n_pages:
+                c.showPage()
+            n_pages += 1
+            y = draw_header(page, data, msgs)
+            if page_no == 0:
+                y = draw_summary(page, data, msgs, y, base_dir)
+                y = draw_timeline(page, data, msgs, y, base_dir)
+            for bi, start, end in items:
+                block = blocks[bi]
+                y = draw_gallery_block(page, block, block["images"][start:end], start > 0, msgs,
+                                       y, base_dir, columns)
+        c.showPage()
+        t1 = time.perf_counter()
+        c.save()
+        os.replace(part, pdf_abs)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+    if stats is not None:
+        stats.update(layout=t1 - t0, write_pdf=time.perf_counter() - t1, pages=n_pages)
+    return pdf_abs
+
+
+def main():
+    p = argparse.ArgumentParser(description="report.json → PDF（reportlab で直接描画）")
+    p.add_argument("json", help="report.json")
+    p.add_argument("pdf", help="出力PDF")
+    p.add_argument("--lang", default=DEFAULT_LOCALE)
+    p.add_argument("--base", default=None, help="画像パスの基準ディレクトリ（既定: report.json の場所）")
+    args = p.parse_args()
+
+    base_dir = args.base or Path(args.json).resolve().parent
+    data = validate(json.loads(Path(args.json).read_text(encoding="utf-8")), base_dir=base_dir,
+                    source=args.json)
+    stats = {}
+    pdf = render_canvas(data, args.pdf, args.lang, base_dir, stats=stats)
+    print(f"PDF: {pdf} ({stats['pages']} pages, layout {stats['layout']:.3f}s, "
+          f"write {stats['write_pdf']:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+生成したレポートPDFの索引（SQLite）
+
+描画のたびに，検査ID（outputs/<検査ID>/ のディレクトリ名）・検査日・テンプレート・
+言語・report.json のダイジェスト・PDFパス・ページ数・サイズ・工程ごとの時間を記録する．
+再印刷や過去レポートの検索はディレクトリを走査せずにこの索引で引く．
+
+    python report_index.py find --exam 20211021093634_000001-003
+    python report_index.py find --date 2025/10/18 --lang en
+    python report_index.py reprint --exam 20211021093634_000001-003 --printer "..."
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from pathlib import Path
+
+DEFAULT_DB = Path(__file__).resolve().parent / "report_index.sqlite3"
+
+# outputs/<検査ID>/... から検査IDを取り出す
+_EXAM_RE = re.compile(r"(?:^|[\\/])outputs[\\/]([^\\/]+)[\\/]")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id          INTEGER PRIMARY KEY,
+    exam_id     TEXT,
+    exam_date   TEXT,
+    template    TEXT NOT NULL,
+    lang        TEXT,
+    digest      TEXT NOT NULL,
+    pdf_path    TEXT NOT NULL,
+    pages       INTEGER,
+    size        INTEGER,
+    timings     TEXT,
+    created_at  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_exam ON reports (exam_id, created_at);
+CREATE INDEX IF NOT EXISTS reports_date ON reports (exam_date);
+CREATE INDEX IF NOT EXISTS reports_digest ON reports (digest);
+CREATE INDEX IF NOT EXISTS reports_pdf ON reports (pdf_path);
+"""
+
+_COLUMNS = ("id", "exam_id", "exam_date", "template", "lang", "digest",
+            "pdf_path", "pages", "size", "timings", "created_at")
+
+
+def connect(db_path=DEFAULT_DB):
+    conn = sqlite3.connect(str(db_path), timeout=30)
+    # バッチの複数ワーカーから同時に書き込むため WAL にする
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def exam_id_from(data):
+    """
+    report.json の画像パスから検査IDを推定する（見つからなければ None）
+    """
+    paths = [tl.get("img", "") for tl in data.get("timeline", [])]
+    paths += [img.get("src", "") for block in data.get("gallery", [])
+              for img in block.get("images", [])]
+    for path in paths:
+        m = _EXAM_RE.search(path)
+        if m:
+            return m.group(1)
+    return None
+
+
+def file_digest(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def record(db_path, data, digest, template, lang, pdf_path, pages, timings):
+    """
+    1 件の描画結果を索引に追加する
+    """
+    pdf_abs = str(Path(pdf_path).resolve())
+    row = (
+        exam_id_from(data),
+        data.get("header", {}).get("date"),
+        str(Path(template).name),
+        lang,
+        digest,
+        pdf_abs,
+        pages,
+        os.path.getsize(pdf_abs),
+        json.dumps(timings),
+        datetime.datetime.now().isoformat(timespec="seconds"),
+    )
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO reports (exam_id, exam_date, template, lang, digest,"
+                " pdf_path, pages, size, timings, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+    finally:
+        conn.close()
+
+
+def find(db_path=DEFAULT_DB, exam_id=None, date=None, lang=None, digest=None, limit=50):
+    """
+    条件に合うレポートを新しい順に返す（dict のリスト）
+    """
+    where, params = [], []
+    for column, value in (("exam_id", exam_id), ("exam_date", date),
+                          ("lang", lang), ("digest", digest)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    sql = f"SELECT {', '.join(_COLUMNS)} FROM reports"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit)
+
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+    return [dict(zip(_COLUMNS, r)) for r in rows]
+
+
+def main():
+    p = argparse.ArgumentParser(description="レポートPDFの索引検索・再印刷")
+    p.add_argument("--db", default=str(DEFAULT_DB), help="索引DBのパス")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    for name, help_text in (("find", "レポートを検索"), ("reprint", "最新のレポートを再印刷")):
+        s = sub.add_parser(name, help=help_text)
+        s.add_argument("--exam", help="検査ID")
+        s.add_argument("--date", help="検査日（header.date と同じ書式）")
+        s.add_argument("--lang", help="言語")
+        s.add_argument("--digest", help="report.json のダイジェスト")
+        if name == "find":
+            s.add_argument("--limit", type=int, default=50)
+        else:
+            s.add_argument("--printer", default="", help="プリンタ名（未指定で既定のプリンタ）")
+            s.add_argument("--sumatra", default="", help="SumatraPDF.exe のパス")
+    args = p.parse_args()
+
+    if args.cmd == "find":
+        for r in find(args.db, args.exam, args.date, args.lang, args.digest, args.limit):
+            print(f"{r['created_at']}  {r['exam_id']}  {r['exam_date']}  {r['lang']}  "
+                  f"{r['pages']}p  {r['size']}B  {r['pdf_path']}")
+        return
+
+    rows = [r for r in find(args.db, args.exam, args.date, args.lang, args.digest, limit=20)
+            if os.path.exists(r["pdf_path"])]
+    if not rows:
+        raise SystemExit("該当するレポートPDFがありません")
+    from print_report import print_with_sumatra
+    printer = args.printer
+    if not printer:
+        import win32print
+        printer = win32print.GetDefaultPrinter()
+    print_with_sumatra(rows[0]["pdf_path"], printer, args.sumatra)
+    print(f"送信: {rows[0]['pdf_path']} → {printer}")
+
+
+if __name__ == "__main__":
+    main()
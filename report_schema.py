@@ -0,0 +1,208 @@
+"""
+report.json の検証
+
+C++ 側が出力した report.json の形（header / checks / timeline / gallery）と，
+参照している画像ファイルの有無を，テンプレートの読込や描画を始める前に調べる．
+壊れた入力は update_* の奥の KeyError や，描画し終えた PDF の空の枠として
+見つかるのではなく，全部の誤りをまとめた ReportValidationError になる．
+
+スキーマは import 時に 1 回だけ検査関数の木に組み立てておく（validate は
+その関数をたどるだけ）．画像の有無はディレクトリごとに 1 回だけ一覧を読んで調べる．
+知らないキーは無視する（C++ 側が先に項目を増やしても止めない）．
+
+    python report_schema.py outputs/*/report.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from asset_store import is_url
+
+
+class ReportValidationError(ValueError):
+    """
+    report.json の誤り（errors: ["場所: 内容", ...]）
+    """
+
+    def __init__(self, errors, source=None):
+        self.errors = list(errors)
+        self.source = source
+        head = f"report.json が不正です（{len(self.errors)} 件）"
+        if source:
+            head += f": {source}"
+        super().__init__("\n  ".join([head, *self.errors]))
+
+
+# ---------- スキーマの部品（検査関数を返す） ----------
+# 検査関数は (値, 場所, errors, assets) を受け取り，誤りを errors に足す．
+# 画像のパスはその場では調べず assets に (場所, src) を集めておく
+
+def _type(types, name):
+    def check(value, where, errors, assets):
+        if not isinstance(value, types) or isinstance(value, bool):
+            errors.append(f"{where}: {name}ではありません（{type(value).__name__}）")
+    return check
+
+
+STR = _type(str, "文字列")
+INT = _type(int, "整数")
+NUMBER = _type((int, float), "数値")
+
+
+def _asset(value, where, errors, assets):
+    if not isinstance(value, str) or not value:
+        errors.append(f"{where}: 画像のパスが空か文字列ではありません")
+    else:
+        assets.append((where, value))
+
+
+def _list(item):
+    def check(value, where, errors, assets):
+        if not isinstance(value, list):
+            errors.append(f"{where}: 配列ではありません（{type(value).__name__}）")
+            return
+        for i, v in enumerate(value):
+            item(v, f"{where}[{i}]", errors, assets)
+    return check
+
+
+def _obj(required=None, optional=None, any_of=()):
+    """
+    required / optional: {キー: 検査関数}．any_of のキーは少なくとも 1 つ必要
+    """
+    required = tuple((required or {}).items())
+    optional = tuple((optional or {}).items())
+
+    def check(value, where, errors, assets):
+        if not isinstance(value, dict):
+            errors.append(f"{where}: オブジェクトではありません（{type(value).__name__}）")
+            return
+        for key, item in required:
+            if key in value:
+                item(value[key], f"{where}.{key}", errors, assets)
+            else:
+                errors.append(f"{where}.{key}: 必須です")
+        for key, item in optional:
+            if key in value:
+                item(value[key], f"{where}.{key}", errors, assets)
+        if any_of and not any(value.get(key) for key in any_of):
+            errors.append(f"{where}: {' か '.join(any_of)} のどちらかが必須です")
+    return check
+
+
+_MARKER = {"x": STR, "label": STR}
+
+SCHEMA = _obj({
+    "header": _obj({"date": STR}),
+    "checks": _obj({
+        "rows": _list(_obj({"label": STR, "mark": STR, "time": STR})),
+        "biopsy": _obj(optional={"method": STR, "target": STR}),
+        "times": _obj({"start": STR, "end": STR}),
+    }),
+}, {
+    "timeline": _list(_obj({"caption": STR}, {
+        "img": _asset,
+        "time_markers": _list(_obj(_MARKER)),
+        "event_markers": _list(_obj(_MARKER, {"char": STR})),
+        "track": _obj(optional={
+            "duration": NUMBER,
+            "segments": _list(_obj({"start": NUMBER, "end": NUMBER},
+                                   {"class_id": INT, "color": STR})),
+            "events": _list(_obj({"time": NUMBER}, {"color": STR})),
+        }),
+    }, any_of=("img", "track"))),
+    "gallery": _list(_obj({
+        "label": STR,
+        "images": _list(_obj({"src": _asset, "time": STR, "index": INT})),
+    }, {
+        "caption": _list(_obj(optional={"organ": STR, "method": STR})),
+    })),
+})
+
+
+def missing_assets(assets, base_dir):
+    """
+    [(場所, src), ...] のうちファイルが無いものの誤り一覧（URL は調べない）
+    """
+    listings = {}
+    errors = []
+    for where, src in assets:
+        if is_url(src):
+            continue
+        path = os.path.join(base_dir, src)
+        parent, name = os.path.split(path)
+        names = listings.get(parent)
+        if names is None:
+            try:
+                names = listings[parent] = set(os.listdir(parent))
+            except OSError:
+                names = listings[parent] = frozenset()
+        if name not in names:
+            errors.append(f"{where}: 画像がありません（{src}）")
+    return errors
+
+
+def outside_assets(assets, base_dir):
+    """
+    [(場所, src), ...] のうち URL・base_dir の外（絶対パス・..・外へのシンボリックリンク）を
+    指すものの誤り一覧と，中を指す残りの [(場所, src), ...] を返す
+    """
+    base = Path(base_dir).resolve()
+    errors, inside = [], []
+    for where, src in assets:
+        if is_url(src):
+            errors.append(f"{where}: URL は使えません（{src}）")
+        elif not Path(base, src).resolve().is_relative_to(base):
+            errors.append(f"{where}: 画像の基準ディレクトリの外です（{src}）")
+        else:
+            inside.append((where, src))
+    return errors, inside
+
+
+def validate(data, base_dir=None, source=None, confine=False):
+    """
+    data が report.json の形になっているか調べ，誤りがあれば全部まとめて
+    ReportValidationError を出す．base_dir を渡すと画像ファイルの有無も調べる．
+    confine=True なら画像は base_dir の中のファイルに限る（URL・外のパスは誤り．
+    ネットワーク越しに受けた report.json で他の検査や任意のファイルを読ませない）
+    """
+    errors, assets = [], []
+    SCHEMA(data, "report", errors, assets)
+    if confine:
+        if base_dir is None:
+            raise ValueError("confine には base_dir が必要です")
+        # 外を指すものはファイルの有無を調べない
+        outside, assets = outside_assets(assets, base_dir)
+        errors += outside
+    if base_dir is not None:
+        errors += missing_assets(assets, str(base_dir))
+    if errors:
+        raise ReportValidationError(errors, source)
+    return data
+
+
+def main():
+    p = argparse.ArgumentParser(description="report.json の形と画像の有無を調べる")
+    p.add_argument("reports", nargs="+", help="report.json（複数可）")
+    p.add_argument("--base-dir", default=None,
+                   help="画像パスの基準ディレクトリ（省略時は各 report.json のディレクトリ）")
+    args = p.parse_args()
+
+    failed = 0
+    for report in args.reports:
+        try:
+            data = json.loads(Path(report).read_text(encoding="utf-8"))
+            t0 = time.perf_counter()
+            validate(data, base_dir=args.base_dir or Path(report).resolve().parent, source=report)
+            print(f"OK: {report} ({(time.perf_counter() - t0) * 1e6:.0f}µs)")
+        except (OSError, ValueError) as e:
+            failed += 1
+            print(f"NG: {e}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
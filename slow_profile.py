@@ -0,0 +1,148 @@
+"""
+遅い描画の自動プロファイル
+
+描画中は別スレッドで描画スレッドのスタックを一定間隔でサンプリングしておき，
+かかった時間が閾値を超えたときだけ
+  <out_dir>/<日時>_<検査名>_<pid>_<連番>/
+    profile.folded   … collapsed stack 形式（flamegraph.pl / speedscope でそのまま開ける）
+    report.json      … 入力のコピー
+    timings.json     … 工程ごとの時間・サンプル数・ジョブの情報
+を保存する．閾値以下なら何も書かない．検査名は report.json のあるディレクトリ名
+（outputs/<検査ID>/report.json）．ファイル名が report.json 以外ならそのファイル名．
+連番はプロセス内で増やすので，同じ秒に同じワーカーで何度遅くなっても上書きしない．
+
+    with SlowRenderCapture(threshold=10, json_path=..., info={...}) as cap:
+        result = ...
+        cap.timings = result["timings"]
+    cap.saved  # 保存先（保存しなかった場合は None）
+
+サンプリングは 1 回あたりフレームをたどるだけなので，既定の 10ms 間隔なら
+描画時間への影響は 1% 未満．
+"""
+import datetime
+import itertools
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+DEFAULT_PROFILE_DIR = Path(__file__).resolve().parent / "slow_profiles"
+DEFAULT_INTERVAL = 0.01
+
+# 保存先の連番（プロセス内）
+_SEQ = itertools.count(1)
+
+
+def _report_name(json_path):
+    # report.json はどの検査も同じ名前なので，検査 ID のディレクトリ名を使う
+    if json_path.stem == "report" and json_path.resolve().parent.name:
+        return json_path.resolve().parent.name
+    return json_path.stem
+
+
+class StackSampler(threading.Thread):
+    """
+    指定スレッドのスタックを interval 秒ごとに数える
+    """
+
+    def __init__(self, thread_id, interval=DEFAULT_INTERVAL):
+        super().__init__(name="slow-profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._halt = threading.Event()
+        self._labels = {}
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = \
+                f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+        return label
+
+    def run(self):
+        while not self._halt.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+    def folded(self):
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+class SlowRenderCapture:
+    """
+    with 内の処理が threshold 秒を超えたらプロファイル・入力・時間を保存する
+    """
+
+    def __init__(self, threshold, json_path, out_dir=None, info=None, interval=DEFAULT_INTERVAL):
+        self.threshold = threshold
+        self.json_path = Path(json_path)
+        self.out_dir = Path(out_dir or DEFAULT_PROFILE_DIR)
+        self.info = dict(info or {})
+        self.interval = interval
+        self.timings = {}
+        self.saved = None
+
+    def __enter__(self):
+        self._sampler = StackSampler(threading.get_ident(), self.interval)
+        self._t0 = time.perf_counter()
+        self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._t0
+        self._sampler.stop()
+        if elapsed >= self.threshold:
+            try:
+                self.saved = self._save(elapsed, exc)
+                print(f"SLOW: {elapsed:.2f}s >= {self.threshold:g}s → {self.saved}")
+            except OSError as e:
+                print(f"WARN: プロファイルを保存できません ({e})")
+        return False
+
+    def _save(self, elapsed, exc):
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        prefix = f"{stamp}_{_report_name(self.json_path)}_{os.getpid()}"
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        while True:
+            dest = self.out_dir / f"{prefix}_{next(_SEQ)}"
+            try:
+                dest.mkdir()
+                break
+            except FileExistsError:
+                continue   # pid が再利用された前のプロセスの保存先
+        (dest / "profile.folded").write_text(self._sampler.folded(), encoding="utf-8")
+        if self.json_path.exists():
+            shutil.copyfile(self.json_path, dest / "report.json")
+        meta = {
+            "json": str(self.json_path.resolve()),
+            "elapsed": elapsed,
+            "threshold": self.threshold,
+            "timings": self.timings,
+            "samples": self._sampler.samples,
+            "interval": self.interval,
+            "pid": os.getpid(),
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            **self.info,
+        }
+        if exc is not None:
+            meta["error"] = repr(exc)
+        (dest / "timings.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2),
+                                           encoding="utf-8")
+        return dest
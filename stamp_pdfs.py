@@ -0,0 +1,413 @@
+"""
+出力済みレポート PDF への一括スタンプ（再レイアウトなしの再発行）
+
+患者ID・「COPY」印・訂正した日付を reportlab で描いたオーバーレイにし，
+既存 PDF の各ページに重ねる．WeasyPrint を通さないので 1 件あたり数十 ms で済み，
+プロセスプールで並列に処理する．
+
+重ね方は page.merge_page（両方のコンテンツを解析して書き直し，リソースを
+ページごとに合成する）ではなく，オーバーレイを 1 つの Form XObject にして
+各ページのコンテンツ配列に「/名前 Do」を足すだけにしている（FormStamp）．
+ページあたりの手間は一定で，オーバーレイの中身は出力に 1 回だけ入る．
+
+    writer = PdfWriter(clone_from="in.pdf")
+    stamp = FormStamp(writer, overlay_reader.pages[0])
+    for page in writer.pages:
+        stamp.apply(page)
+
+索引は CSV（1 行目が列名）か JSON Lines で，1 件ごとに
+  pdf         … 入力 PDF（索引ファイルからの相対パス可）
+  out         … 出力 PDF（省略時は --out-dir/<入力と同じ名前>）
+  patient_id  … 【患者ID 　　　　】の空欄に入れる ID
+  copy        … 1 / true / yes なら COPY 印を押す
+  date        … 訂正後の日付（元の日付を白で消してから書く）
+を持つ．空の欄は押さない．
+
+    python stamp_pdfs.py reissue.csv --out-dir reissued -j 8
+    python stamp_pdfs.py --grid Ideal_Report.pdf grid.pdf   # 位置合わせ用に mm 方眼を重ねる
+
+スタンプの位置は report.html のヘッダー（A4・余白 5mm・メタ情報 16pt）に合わせた
+STAMP_LAYOUT（ページ左上からの mm）．テンプレートを変えたら --grid で確かめて
+--layout に JSON で上書きする．
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from io import BytesIO
+from pathlib import Path
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    FloatObject,
+    NameObject,
+)
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfgen import canvas
+
+STAMP_FONT = "HeiseiKakuGo-W5"
+
+# ページ左上からの位置 [mm]．y はベースライン
+STAMP_LAYOUT = {
+    "patient_id": {"x": 174, "y": 16.5, "size": 14},
+    "date": {"x": 108, "y": 16.5, "size": 16,
+             "erase": {"x": 107, "y": 10, "w": 38, "h": 8}},   # 元の日付を消す白い矩形
+    "copy": {"x": 150, "y": 30, "size": 20, "text": "COPY", "color": (0.8, 0.1, 0.1)},
+}
+
+# --layout に書ける項目（それ以外はワーカーに渡す前に誤りにする）
+_POS_KEYS = {"x", "y", "size", "erase", "text", "color"}
+_ERASE_KEYS = {"x", "y", "w", "h"}
+
+_TRUE = {"1", "true", "yes", "y", "on"}
+
+# ワーカー内のオーバーレイ（(ページ寸法, 押す内容) → PdfReader のページ）
+_OVERLAY_CACHE = {}
+_LAYOUT = STAMP_LAYOUT
+
+
+def _register_font():
+    if STAMP_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(UnicodeCIDFont(STAMP_FONT))
+
+
+def _fields(row):
+    """
+    索引の 1 行から押す内容（空でないものだけ）を取り出す
+    """
+    fields = {}
+    for key in ("patient_id", "date"):
+        value = str(row.get(key) or "").strip()
+        if value:
+            fields[key] = value
+    if str(row.get("copy") or "").strip().lower() in _TRUE:
+        fields["copy"] = _LAYOUT["copy"].get("text", "COPY")
+    return fields
+
+
+def make_overlay(width, height, fields, layout=None):
+    """
+    fields を描いた 1 ページの PDF（bytes）を返す．width, height は pt
+    """
+    layout = layout or _LAYOUT
+    _register_font()
+    packet = BytesIO()
+    can = canvas.Canvas(packet, pagesize=(width, height))
+    for key in ("date", "patient_id", "copy"):
+        if key not in fields:
+            continue
+        pos = layout[key]
+        erase = pos.get("erase")
+        if erase:
+            can.setFillColorRGB(1, 1, 1)
+            can.rect(erase["x"] * mm, height - (erase["y"] + erase["h"]) * mm,
+                     erase["w"] * mm, erase["h"] * mm, stroke=0, fill=1)
+        if key == "copy":
+            can.setStrokeColorRGB(*pos["color"])
+            can.setFillColorRGB(*pos["color"])
+            text_w = pdfmetrics.stringWidth(fields[key], STAMP_FONT, pos["size"])
+            pad = pos["size"] * 0.3
+            can.rect(pos["x"] * mm - pad, height - pos["y"] * mm - pad,
+                     text_w + pad * 2, pos["size"] + pad, stroke=1, fill=0)
+        else:
+            can.setFillColorRGB(0.07, 0.07, 0.07)   # 本文と同じ #111
+        can.setFont(STAMP_FONT, pos["size"])
+        can.drawString(pos["x"] * mm, height - pos["y"] * mm, fields[key])
+    can.save()
+    return packet.getvalue()
+
+
+def merge_layout(override, base=STAMP_LAYOUT):
+    """
+    base に override（STAMP_LAYOUT と同じ形）を項目ごとに重ねた配置を返す．
+    書いたキーだけ上書きし（erase の中も同じ），erase を null にすると消さない．
+    知らない項目・キーや，足りない値は ValueError
+    """
+    if not isinstance(override, dict):
+        raise ValueError("--layout はオブジェクトにしてください")
+    layout = {key: dict(pos) for key, pos in base.items()}
+    for key, pos in override.items():
+        if key not in base:
+            raise ValueError(f"--layout: 未知の項目です: {key}（{', '.join(base)}）")
+        if not isinstance(pos, dict):
+            raise ValueError(f"--layout: {key} はオブジェクトにしてください")
+        unknown = set(pos) - _POS_KEYS
+        if unknown:
+            raise ValueError(f"--layout: {key} の未知のキーです: {', '.join(sorted(unknown))}")
+        merged = {**base[key], **pos}
+        erase = pos.get("erase")
+        if erase:
+            if not isinstance(erase, dict) or set(erase) - _ERASE_KEYS:
+                raise ValueError(f"--layout: {key}.erase は {{x, y, w, h}} のオブジェクトにしてください")
+            merged["erase"] = {**(base[key].get("erase") or {}), **erase}
+            missing = _ERASE_KEYS - set(merged["erase"])
+            if missing:
+                raise ValueError(f"--layout: {key}.erase に {', '.join(sorted(missing))} がありません")
+        layout[key] = merged
+    return layout
+
+
+class FormStamp:
+    """
+    オーバーレイのページを writer 内の Form XObject にし，ページに参照で重ねる
+    """
+
+    def __init__(self, writer, overlay_page, name="/Stamp"):
+        self.writer = writer
+        box = overlay_page.mediabox
+        form = DecodedStreamObject()
+        form.set_data(overlay_page.get_contents().get_data())
+        form.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): ArrayObject(FloatObject(v) for v in
+                                             (box.left, box.bottom, box.right, box.top)),
+        })
+        if "/Resources" in overlay_page:
+            form[NameObject("/Resources")] = overlay_page.raw_get("/Resources").clone(writer)
+        self.ref = writer._add_object(form.flate_encode())
+        self._name = name
+        self._names = {}  # id(ページの /XObject 辞書) → そこで使う名前
+        # 元のコンテンツの q/Q が釣り合っていなくても重ねる位置がずれないよう，
+        # 前後を q ... Q で囲む（どちらの stream も全ページで共有する）
+        self._head = self._stream(b"q\n")
+        self._tail_by_name = {}
+
+    def _stream(self, data):
+        stream = DecodedStreamObject()
+        stream.set_data(data)
+        return self.writer._add_object(stream)
+
+    def _xobject_name(self, xobjects):
+        name = self._names.get(id(xobjects))
+        if name is not None:
+            return name
+        name, n = self._name, 0
+        while name in xobjects and xobjects.raw_get(name) != self.ref:
+            n += 1
+            name = f"{self._name}{n}"
+        xobjects[NameObject(name)] = self.ref
+        self._names[id(xobjects)] = name
+        return name
+
+    def apply(self, page):
+        """
+        page に重ねる（コンテンツ・リソースの中身は読まない）
+        """
+        name = self._xobject_name(_page_xobjects(page))
+
+        tail = self._tail_by_name.get(name)
+        if tail is None:
+            tail = self._tail_by_name[name] = self._stream(f"\nQ\nq {name} Do Q\n".encode("ascii"))
+        if "/Contents" not in page:
+            parts = []
+        else:
+            contents = page.raw_get("/Contents")
+            parts = list(contents.get_object()) \
+                if isinstance(contents.get_object(), ArrayObject) else [contents]
+        page[NameObject("/Contents")] = ArrayObject([self._head, *parts, tail])
+
+
+def _page_xobjects(page):
+    """
+    page の /Resources /XObject 辞書（無ければ作る．親から継承したリソースはページに写す）
+    """
+    if "/Resources" not in page:
+        node = page
+        while node is not None and "/Resources" not in node:
+            node = node.get("/Parent")
+            node = node.get_object() if node is not None else None
+        resources = DictionaryObject(node["/Resources"] if node is not None else {})
+        if "/XObject" in resources:
+            resources[NameObject("/XObject")] = DictionaryObject(resources["/XObject"])
+        page[NameObject("/Resources")] = resources
+    resources = page["/Resources"]
+    if "/XObject" not in resources:
+        resources[NameObject("/XObject")] = DictionaryObject()
+    return resources["/XObject"]
+
+
+def stamp_many(writer, pages, overlay_page):
+    """
+    pages（writer のページ）すべてに同じ overlay_page を重ねる
+    """
+    stamp = FormStamp(writer, overlay_page)
+    for page in pages:
+        stamp.apply(page)
+    return stamp
+
+
+def _overlay_page(width, height, fields):
+    key = (round(width, 1), round(height, 1), tuple(sorted(fields.items())))
+    page = _OVERLAY_CACHE.get(key)
+    if page is None:
+        page = PdfReader(BytesIO(make_overlay(width, height, fields))).pages[0]
+        # 同じ内容（COPY・日付だけなど）は使い回す．患者ID入りは 1 件ごとなので溜めない
+        if "patient_id" not in fields:
+            _OVERLAY_CACHE[key] = page
+    return page
+
+
+def stamp_pdf(src, dst, fields):
+    """
+    src の全ページに fields を重ねて dst に書く（一時ファイルから置き換える）
+    戻り値: ページ数
+    """
+    writer = PdfWriter(clone_from=str(src))
+    stamps = {}  # ページ寸法 → この出力の FormStamp
+    for page in writer.pages:
+        size = (float(page.mediabox.width), float(page.mediabox.height))
+        stamp = stamps.get(size)
+        if stamp is None:
+            stamp = stamps[size] = FormStamp(writer, _overlay_page(*size, fields))
+        stamp.apply(page)
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    part = f"{dst}.{os.getpid()}.part"
+    try:
+        with open(part, "wb") as f:
+            writer.write(f)
+        os.replace(part, dst)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+    return len(writer.pages)
+
+
+def _init_worker(layout):
+    global _LAYOUT
+    _LAYOUT = layout
+    _register_font()
+
+
+def _stamp_job(job):
+    try:
+        pages = stamp_pdf(job["pdf"], job["out"], job["fields"])
+        return {"pdf": job["out"], "pages": pages}
+    except Exception as e:
+        return {"pdf": job["out"], "src": job["pdf"], "error": f"{type(e).__name__}: {e}"}
+
+
+def load_index(index_path, out_dir=None, in_place=False):
+    """
+    CSV / JSON Lines の索引を読み，[{"pdf", "out", "fields"}, ...] を返す
+    """
+    index_path = Path(index_path)
+    base = index_path.resolve().parent
+    with open(index_path, encoding="utf-8-sig", newline="") as f:
+        if index_path.suffix.lower() in (".jsonl", ".ndjson"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for n, row in enumerate(rows, 1):
+        if not row.get("pdf"):
+            raise ValueError(f"{index_path}:{n}: pdf がありません")
+        src = (base / row["pdf"]).resolve()
+        if row.get("out"):
+            out = (base / row["out"]).resolve()
+        elif in_place:
+            out = src
+        elif out_dir:
+            out = Path(out_dir).resolve() / src.name
+        else:
+            raise ValueError("--out-dir か --in-place を指定してください（索引に out が無い行があります）")
+        if out == src and not in_place:
+            raise ValueError(f"{index_path}:{n}: 入力を上書きするには --in-place が必要です ({src})")
+        jobs.append({"pdf": str(src), "out": str(out), "fields": _fields(row)})
+    return jobs
+
+
+def stamp_all(jobs, processes=None, layout=None):
+    """
+    プロセスプールでスタンプする．戻り値: _stamp_job の結果のリスト（索引の順とは限らない）
+    """
+    layout = layout or STAMP_LAYOUT
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(jobs) < 2:
+        _init_worker(layout)
+        return [_stamp_job(job) for job in jobs]
+    # 1 件が短いので数件ずつまとめて渡す
+    chunksize = max(1, min(16, len(jobs) // (processes * 4)))
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(layout,)) as pool:
+        return list(pool.imap_unordered(_stamp_job, jobs, chunksize=chunksize))
+
+
+def write_grid(src, dst):
+    """
+    位置合わせ用に 5mm ごとの方眼（10mm ごとに数字）を src の 1 ページ目に重ねる
+    """
+    _register_font()
+    writer = PdfWriter(clone_from=str(src))
+    page = writer.pages[0]
+    width, height = float(page.mediabox.width), float(page.mediabox.height)
+    packet = BytesIO()
+    can = canvas.Canvas(packet, pagesize=(width, height))
+    can.setFont(STAMP_FONT, 5)
+    for i in range(0, int(max(width, height) / mm) + 1, 5):
+        major = i % 10 == 0
+        can.setStrokeColorRGB(*((0.2, 0.4, 1.0) if major else (0.7, 0.8, 1.0)))
+        can.setLineWidth(0.3 if major else 0.1)
+        can.line(i * mm, 0, i * mm, height)
+        can.line(0, height - i * mm, width, height - i * mm)
+        if major:
+            can.drawString(i * mm + 0.5, height - 3 * mm, str(i))
+            can.drawString(0.5, height - i * mm - 2, str(i))
+    can.save()
+    FormStamp(writer, PdfReader(packet).pages[0], name="/Grid").apply(page)
+    with open(dst, "wb") as f:
+        writer.write(f)
+    print(f"GRID: {dst}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="出力済みレポートPDFに患者ID・COPY印・訂正日付を一括で重ねる")
+    p.add_argument("index", nargs="?", help="索引（CSV か JSON Lines: pdf, out, patient_id, copy, date）")
+    p.add_argument("--out-dir", default=None, help="出力先ディレクトリ（索引に out が無い行）")
+    p.add_argument("--in-place", action="store_true", help="入力PDFを置き換える")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="プロセス数（既定: CPU数）")
+    p.add_argument("--layout", default=None, metavar="JSON",
+                   help="スタンプ位置（STAMP_LAYOUT と同じ形の JSON ファイル．書いたキーだけ上書き，erase の中も同じ）")
+    p.add_argument("--grid", nargs=2, metavar=("PDF", "OUT"), default=None,
+                   help="PDF の 1 ページ目に mm 方眼を重ねて OUT に書く（位置合わせ用）")
+    args = p.parse_args()
+
+    if args.grid:
+        write_grid(*args.grid)
+        return
+    if not args.index:
+        p.error("索引を指定してください")
+
+    layout = STAMP_LAYOUT
+    if args.layout:
+        # 誤りはワーカーの中の KeyError ではなく，ここで 1 回だけ出す
+        try:
+            layout = merge_layout(json.loads(Path(args.layout).read_text(encoding="utf-8")))
+        except (OSError, ValueError) as e:
+            p.error(str(e))
+
+    jobs = load_index(args.index, args.out_dir, args.in_place)
+    t0 = time.perf_counter()
+    results = stamp_all(jobs, args.jobs, layout)
+    elapsed = time.perf_counter() - t0
+
+    failed = [r for r in results if "error" in r]
+    for r in failed:
+        print(f"ERROR: {r['src']}: {r['error']}")
+    pages = sum(r.get("pages", 0) for r in results)
+    print(f"STAMPED: {len(results) - len(failed)}/{len(jobs)} files, {pages} pages "
+          f"in {elapsed:.1f}s ({len(jobs) / max(elapsed, 1e-9):.1f} files/s)")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
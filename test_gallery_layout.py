@@ -0,0 +1,82 @@
+"""
+gallery_layout の改ページ計算の確認（python -m pytest test_gallery_layout.py）
+"""
+import itertools
+import math
+
+import pytest
+
+from gallery_layout import block_rows, gallery_geometry, paginate
+
+
+def _blocks(*counts):
+    return [{"label": str(i), "images": [{"index": j} for j in range(n)]}
+            for i, n in enumerate(counts)]
+
+
+def test_empty_gallery():
+    assert paginate([], 3, 2, 6) == [[]]
+    assert paginate([], 3, 0, 6) == [[]]
+
+
+def test_exact_fit_on_first_sheet():
+    # 2 行ちょうどで 1 枚目が埋まり，次のブロックは続きのシートへ
+    assert paginate(_blocks(6), 3, 2, 6) == [[(0, 0, 6)]]
+    assert paginate(_blocks(6, 3), 3, 2, 6) == [[(0, 0, 6)], [(1, 0, 3)]]
+
+
+def test_exact_fit_on_continuation_sheets():
+    # 続きのシートもちょうど埋まる．余分な空のシートは作らない
+    assert paginate(_blocks(3, 6, 6), 3, 1, 2) == [[(0, 0, 3)], [(1, 0, 6)], [(2, 0, 6)]]
+
+
+def test_rows_first_zero():
+    # 1 枚目にギャラリーが入らなければ 1 枚目は空で，続きのシートから始める
+    assert paginate(_blocks(3, 3), 3, 0, 6) == [[], [(0, 0, 3), (1, 0, 3)]]
+
+
+def test_block_sent_to_next_sheet():
+    # 今のシートに入らないが次のシートなら丸ごと入るブロックは分割せずに送る
+    assert paginate(_blocks(3, 9), 3, 2, 6) == [[(0, 0, 3)], [(1, 0, 9)]]
+
+
+def test_block_spanning_several_sheets():
+    # 7 行のブロックは 1 枚目の 2 行・続きの 3 行・残り 2 行に分割し，次のブロックは残りに入る
+    assert paginate(_blocks(20, 3), 3, 2, 3) == [
+        [(0, 0, 6)],
+        [(0, 6, 15)],
+        [(0, 15, 20), (1, 0, 3)],
+    ]
+
+
+def test_block_without_images_takes_one_row():
+    assert block_rows(0, 3) == 1
+    assert paginate(_blocks(0, 3), 3, 1, 2) == [[(0, 0, 0)], [(1, 0, 3)]]
+
+
+def test_unlimited_rows():
+    assert paginate(_blocks(30, 30), 3, math.inf, math.inf) == [[(0, 0, 30), (1, 0, 30)]]
+
+
+@pytest.mark.parametrize("counts,rows_first,rows_per_page", list(itertools.product(
+    [(1,), (5, 7), (20, 1, 0, 13), (3, 3, 3, 3, 3)], [0, 1, 3], [1, 2, 4])))
+def test_every_image_once_and_sheets_not_overfilled(counts, rows_first, rows_per_page):
+    columns = 3
+    blocks = _blocks(*counts)
+    pages = paginate(blocks, columns, rows_first, rows_per_page)
+
+    placed = [(bi, i) for page in pages for bi, start, end in page for i in range(start, end)]
+    assert placed == [(bi, i) for bi, n in enumerate(counts) for i in range(n)]
+    for page_no, page in enumerate(pages):
+        rows = sum(block_rows(end - start, columns) for _, start, end in page)
+        assert rows <= (rows_first if page_no == 0 else rows_per_page)
+    assert all(pages[1:])   # 空になりうるのは 1 枚目だけ
+
+
+def test_gallery_geometry():
+    section = {"data-columns": "3", "data-row-mm": "40", "data-first-mm": "85",
+               "data-page-mm": "250"}
+    assert gallery_geometry(section) == (3, 2, 6)
+    assert gallery_geometry({"data-columns": "4"}) == (4, math.inf, math.inf)
+    with pytest.raises(ValueError):
+        gallery_geometry({"data-row-mm": "40", "data-page-mm": "30"})
@@ -0,0 +1,124 @@
+"""
+live_report の JSON Patch と部分更新の確認（python -m pytest test_live_report.py）
+"""
+import copy
+import json
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("bs4")
+try:
+    import weasyprint  # noqa: F401
+except (ImportError, OSError) as e:
+    # print_report が import 時に読み込む．Pango などが無いと OSError になる
+    pytest.skip(f"WeasyPrint を読み込めません: {e}", allow_module_level=True)
+
+import print_report
+from i18n import load_catalog
+from live_report import PatchError, apply_patch
+
+HERE = Path(__file__).resolve().parent
+TEMPLATE = str(HERE / "report.html")
+
+
+@pytest.fixture
+def data():
+    return json.loads((HERE / "report.json").read_text(encoding="utf-8"))
+
+
+def test_append_with_dash(data):
+    row = {"label": "NBI", "mark": "○", "time": "3分"}
+    doc, touched = apply_patch(data, {"op": "add", "path": "/checks/rows/-", "value": row})
+    assert doc["checks"]["rows"][-1] == row
+    assert len(doc["checks"]["rows"]) == len(data["checks"]["rows"]) + 1
+    assert touched == ["checks"]
+
+
+def test_add_at_index_inserts(data):
+    n = len(data["checks"]["rows"])
+    doc, _ = apply_patch(data, [{"op": "add", "path": "/checks/rows/0", "value": {"x": 1}},
+                                {"op": "add", "path": f"/checks/rows/{n + 1}", "value": {"y": 2}}])
+    assert doc["checks"]["rows"][0] == {"x": 1}
+    assert doc["checks"]["rows"][-1] == {"y": 2}
+
+
+@pytest.mark.parametrize("path", ["/checks/rows/01", "/checks/rows/-1", "/checks/rows/x",
+                                  "/checks/rows/99"])
+def test_bad_array_index(data, path):
+    with pytest.raises(PatchError):
+        apply_patch(data, {"op": "replace", "path": path, "value": {}})
+
+
+def test_dash_only_for_add(data):
+    with pytest.raises(PatchError):
+        apply_patch(data, {"op": "remove", "path": "/checks/rows/-"})
+
+
+def test_escaped_tokens(data):
+    doc, _ = apply_patch(data, [{"op": "add", "path": "/header/a~1b", "value": 1},
+                                {"op": "add", "path": "/header/c~0d", "value": 2},
+                                {"op": "test", "path": "/header/a~1b", "value": 1}])
+    assert doc["header"]["a/b"] == 1
+    assert doc["header"]["c~d"] == 2
+
+
+def test_test_op(data):
+    date = data["header"]["date"]
+    doc, touched = apply_patch(data, {"op": "test", "path": "/header/date", "value": date})
+    assert doc == data and touched == []
+    with pytest.raises(PatchError):
+        apply_patch(data, {"op": "test", "path": "/header/date", "value": "1999/01/01"})
+    with pytest.raises(PatchError):
+        apply_patch(data, {"op": "test", "path": "/header/missing", "value": None})
+
+
+@pytest.mark.parametrize("ops", [
+    {"op": "move", "path": "/header/date", "from": "/header/x"},
+    {"op": "remove", "path": ""},
+    {"op": "add", "path": "header/date", "value": "x"},
+    {"op": "remove", "path": "/header/missing"},
+    {"op": "add", "path": "/nothing/here", "value": 1},
+])
+def test_rejected_ops(data, ops):
+    with pytest.raises(PatchError):
+        apply_patch(data, ops)
+
+
+def test_failed_patch_leaves_data_unchanged(data):
+    before = copy.deepcopy(data)
+    ops = [
+        {"op": "replace", "path": "/header/date", "value": "2030/01/01"},
+        {"op": "add", "path": "/checks/rows/-", "value": {"label": "x", "mark": "x", "time": "x"}},
+        {"op": "remove", "path": "/gallery/0/images/0"},
+        {"op": "test", "path": "/header/date", "value": "not this"},
+    ]
+    with pytest.raises(PatchError):
+        apply_patch(data, ops)
+    assert data == before
+
+
+def test_untouched_sections_are_shared(data):
+    doc, touched = apply_patch(data, {"op": "replace", "path": "/header/date", "value": "2030/01/01"})
+    assert touched == ["header"]
+    assert doc["gallery"] is data["gallery"]
+    assert doc["header"] is not data["header"]
+    assert data["header"]["date"] != "2030/01/01"
+
+
+@pytest.mark.parametrize("ops", [
+    [{"op": "replace", "path": "/header/date", "value": "2030/01/01"}],
+    [{"op": "add", "path": "/checks/rows/-", "value": {"label": "NBI", "mark": "○", "time": "3分"}}],
+    [{"op": "remove", "path": "/timeline/1"}],
+    [{"op": "add", "path": "/gallery/0/images/-",
+      "value": {"src": "outputs/new.png", "time": "9m00s", "index": 9}}],
+    [{"op": "add", "path": "/gallery/-", "value": {"label": "追加", "images": [
+        {"src": f"outputs/extra_{i}.png", "time": f"{i}m", "index": i} for i in range(12)]}},
+     {"op": "replace", "path": "/header/date", "value": "2030/01/02"}],
+])
+def test_incremental_update_matches_full_build(data, ops):
+    msgs = load_catalog("ja")
+    soup = print_report.build_soup(TEMPLATE, data, "ja")
+    doc, touched = apply_patch(data, ops)
+    print_report.update_sections(soup, doc, touched, msgs=msgs)
+    assert str(soup) == str(print_report.build_soup(TEMPLATE, doc, "ja"))
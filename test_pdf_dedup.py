@@ -0,0 +1,125 @@
+"""
+pdf_dedup の結合・重複排除の確認（python -m pytest test_pdf_dedup.py）
+"""
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pypdf")
+pytest.importorskip("reportlab")
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+import pdf_dedup
+
+FONT = Path(__file__).resolve().parent / "fonts" / "segoeui.ttf"
+
+
+def _make_pdf(path, font_name=None):
+    """
+    Segoe UI で 1 行書いた PDF．font_name を渡すとフォント辞書の /Name だけ変える
+    （フォント辞書は別物・中のフォントプログラム（/FontFile2）は同じになる）
+    """
+    if "DedupSegoe" not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont("DedupSegoe", str(FONT)))
+    c = canvas.Canvas(str(path))
+    c.setFont("DedupSegoe", 12)
+    c.drawString(50, 700, "Hello report")
+    c.save()
+    if font_name:
+        writer = PdfWriter(clone_from=str(path))
+        for font in writer.pages[0]["/Resources"]["/Font"].values():
+            font = font.get_object()
+            if font["/Subtype"] == "/TrueType":
+                font[NameObject("/Name")] = NameObject(font_name)
+        with open(path, "wb") as f:
+            writer.write(f)
+    return path
+
+
+def _font_file_bytes(path):
+    for font in PdfReader(str(path)).pages[0]["/Resources"]["/Font"].values():
+        font = font.get_object()
+        if font["/Subtype"] == "/TrueType":
+            return len(font["/FontDescriptor"]["/FontFile2"].get_data())
+    raise AssertionError("TrueType フォントがありません")
+
+
+def _object_count(path):
+    return sum(1 for obj in PdfWriter(clone_from=str(path))._objects if obj is not None)
+
+
+@pytest.mark.skipif(not FONT.exists(), reason="fonts/segoeui.ttf がありません")
+def test_merge_drops_shared_font_program(tmp_path):
+    a = _make_pdf(tmp_path / "a.pdf")
+    b = _make_pdf(tmp_path / "b.pdf", font_name="/F9+0")
+
+    plain = tmp_path / "plain.pdf"
+    writer = PdfWriter()
+    writer.append(str(a))
+    writer.append(str(b))
+    with open(plain, "wb") as f:
+        writer.write(f)
+
+    merged = tmp_path / "merged.pdf"
+    stats = pdf_dedup.merge_pdfs([a, b], merged)
+
+    # Helvetica の辞書は同じなのでまとまり，TrueType は辞書が別でフォントプログラムだけ共有
+    assert stats["font_files"] == 1
+    # フォントプログラム 1 つ分（数 KB 以上）小さくなり，オブジェクトも減る
+    assert merged.stat().st_size < plain.stat().st_size - _font_file_bytes(a) // 2
+    assert _object_count(merged) < _object_count(plain)
+    assert len(PdfReader(str(merged)).pages) == 2
+
+
+@pytest.mark.skipif(not FONT.exists(), reason="fonts/segoeui.ttf がありません")
+def test_merge_identical_documents(tmp_path):
+    a = _make_pdf(tmp_path / "a.pdf")
+    b = _make_pdf(tmp_path / "b.pdf")
+    merged = tmp_path / "merged.pdf"
+    stats = pdf_dedup.merge_pdfs([a, b], merged)
+
+    assert stats["fonts"] >= 1
+    assert merged.stat().st_size < a.stat().st_size * 1.5
+    text = [page.extract_text().strip() for page in PdfReader(str(merged)).pages]
+    assert text == ["Hello report", "Hello report"]
+
+
+def _dangling(path):
+    """結合した PDF の中で，削除したオブジェクトを指したままの参照の数"""
+    writer = PdfWriter(clone_from=str(path))
+    missing = 0
+    todo = [writer.root_object]
+    seen = set()
+    while todo:
+        o = todo.pop()
+        if isinstance(o, IndirectObject):
+            if o.idnum in seen:
+                continue
+            seen.add(o.idnum)
+            resolved = o.get_object()
+            if resolved is None or isinstance(resolved, NullObject):
+                missing += 1
+                continue
+            todo.append(resolved)
+        elif isinstance(o, DictionaryObject):
+            todo.extend(o.raw_get(k) for k in o.keys())
+        elif isinstance(o, ArrayObject):
+            todo.extend(o)
+    return missing
+
+
+@pytest.mark.skipif(not FONT.exists(), reason="fonts/segoeui.ttf がありません")
+def test_merge_keeps_every_reference(tmp_path):
+    a = _make_pdf(tmp_path / "a.pdf")
+    b = _make_pdf(tmp_path / "b.pdf", font_name="/F9+0")
+    merged = tmp_path / "merged.pdf"
+    pdf_dedup.merge_pdfs([a, b, a, b], merged)
+
+    assert _dangling(merged) == 0
+    text = [page.extract_text().strip() for page in PdfReader(str(merged)).pages]
+    assert text == ["Hello report"] * 4
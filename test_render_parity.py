@@ -0,0 +1,65 @@
+"""
+weasyprint と reportlab の描画結果の一致確認（python -m pytest test_render_parity.py）
+
+parity_check.py と同じ比べ方で，ページ数と文字の位置のずれを確かめる．
+画像は report.json が参照するパスに小さな PNG を作って置き換える．
+WeasyPrint（と Pango）が無い環境では飛ばす．
+"""
+import json
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pypdf")
+pytest.importorskip("reportlab")
+Image = pytest.importorskip("PIL.Image")
+try:
+    import weasyprint  # noqa: F401
+except (ImportError, OSError) as e:
+    # Pango などのライブラリが無いと OSError になる
+    pytest.skip(f"WeasyPrint を読み込めません: {e}", allow_module_level=True)
+
+import print_report
+from asset_store import report_asset_srcs
+from parity_check import compare_text, text_lines
+
+HERE = Path(__file__).resolve().parent
+MAX_OFFSET = 1.5   # [mm] parity_check.py の既定と同じ
+
+
+def _make_report(tmp_path, gallery_scale):
+    data = json.loads((HERE / "report.json").read_text(encoding="utf-8"))
+    data["gallery"] = data.get("gallery", []) * gallery_scale
+    for src in report_asset_srcs(data):
+        path = tmp_path / src
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not path.exists():
+            Image.new("RGB", (160, 120), (120, 140, 160)).save(path)
+    # テンプレートの @font-face は基準ディレクトリの fonts/ を読む
+    shutil.copytree(HERE / "fonts", tmp_path / "fonts")
+    json_path = tmp_path / "report.json"
+    json_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return json_path
+
+
+@pytest.mark.parametrize("gallery_scale", [1, 3])
+def test_engines_match(tmp_path, gallery_scale):
+    json_path = _make_report(tmp_path, gallery_scale)
+    results, pdfs, seconds = {}, {}, {}
+    for engine in print_report.ENGINES:
+        pdfs[engine] = tmp_path / f"{engine}.pdf"
+        t0 = time.perf_counter()
+        results[engine] = print_report.render_report(str(HERE / "report.html"), str(json_path),
+                                                     str(pdfs[engine]), base_dir=tmp_path,
+                                                     engine=engine)
+        seconds[engine] = time.perf_counter() - t0
+    html, canvas = print_report.ENGINES
+    print(f"time: {html} {seconds[html]:.3f}s / {canvas} {seconds[canvas]:.3f}s")
+
+    assert results[html]["pages"] == results[canvas]["pages"]
+    text = compare_text(text_lines(pdfs[html]), text_lines(pdfs[canvas]))
+    assert text["matched"] > 0
+    assert text["missing"] == []
+    assert text["max_offset"] <= MAX_OFFSET, text["worst"]
@@ -0,0 +1,91 @@
+"""
+タイムライン（臓器・処置・生検）をインライン SVG で描画する
+
+report.json の timeline[] 要素が "track" を持つ場合，C++側が出力した
+PNG の代わりにここで生成した SVG をトラックとして埋め込む．
+
+    "track": {
+      "duration": 750,                       # 検査全体の長さ（秒）
+      "segments": [                          # 臓器区間・処置区間
+        { "start": 0, "end": 95, "class_id": 1, "color": "#f4b183" }
+      ],
+      "events": [                            # 鉗子などの瞬間イベント
+        { "time": 300, "color": "#000000" }
+      ]
+    }
+
+color を省略した場合は class_id から DEFAULT_PALETTE の色を使う．
+"""
+
+# SVG の論理座標（横幅は 1000 固定．実寸は CSS で決める）
+VIEW_W = 1000
+VIEW_H = 100
+
+# イベント線の太さ（論理座標）
+EVENT_W = 3
+
+# class_id → 色（C++側のタイムラインPNGと同じ並び）
+DEFAULT_PALETTE = [
+    "#d9d9d9",  # 0: 未分類
+    "#f4b183",  # 1
+    "#9dc3e6",  # 2
+    "#a9d18e",  # 3
+    "#ffd966",  # 4
+    "#c9a0dc",  # 5
+    "#f8cbad",  # 6
+    "#8faadc",  # 7
+]
+DEFAULT_EVENT_COLOR = "#000000"
+
+
+def segment_color(item):
+    if item.get("color"):
+        return item["color"]
+    class_id = int(item.get("class_id", 0))
+    return DEFAULT_PALETTE[class_id % len(DEFAULT_PALETTE)]
+
+
+def _x(t, duration):
+    """秒 → 論理座標（範囲外はトラック端に丸める）"""
+    if duration <= 0:
+        return 0.0
+    return min(max(float(t) / duration, 0.0), 1.0) * VIEW_W
+
+
+def build_timeline_svg(soup, track, alt=""):
+    """
+    track 定義から <svg> タグを生成して返す
+    """
+    duration = float(track.get("duration", 0))
+
+    svg = soup.new_tag("svg", **{
+        "xmlns": "http://www.w3.org/2000/svg",
+        "viewBox": f"0 0 {VIEW_W} {VIEW_H}",
+        "preserveAspectRatio": "none",
+        "role": "img",
+        "aria-label": alt,
+    })
+
+    # 区間（臓器・処置）
+    for seg in track.get("segments", []):
+        x0 = _x(seg["start"], duration)
+        x1 = _x(seg["end"], duration)
+        if x1 <= x0:
+            continue
+        svg.append(soup.new_tag("rect", **{
+            "x": f"{x0:.2f}", "y": "0",
+            "width": f"{x1 - x0:.2f}", "height": str(VIEW_H),
+            "fill": segment_color(seg),
+        }))
+
+    # イベント（生検など）
+    for ev in track.get("events", []):
+        x = _x(ev["time"], duration)
+        x = min(max(x - EVENT_W / 2, 0.0), VIEW_W - EVENT_W)
+        svg.append(soup.new_tag("rect", **{
+            "x": f"{x:.2f}", "y": "0",
+            "width": str(EVENT_W), "height": str(VIEW_H),
+            "fill": ev.get("color", DEFAULT_EVENT_COLOR),
+        }))
+
+    return svg